@@ -0,0 +1,50 @@
+"""
+Measure CPU usage of the application while its handlers are saturated.
+
+Debug backend produces messages faster than handlers can process them,
+so update queue stays full for the whole run. Ideally, application
+should not consume CPU while it waits for handlers to complete.
+
+Usage: python3 benchmarks/backpressure.py [seconds]
+"""
+
+import sys
+import time
+import asyncio
+from kutana import Kutana, Plugin
+from kutana.backends import Debug
+
+
+def endless_messages():
+    i = 0
+    while True:
+        i += 1
+        yield (f"message {i}", i)
+
+
+def main(duration=5.0):
+    # Queue size is a multiple of Debug's batch size (25), so backend
+    # returns exactly when the queue is full (like long polling does).
+    app = Kutana(concurrent_handlers_count=500)
+
+    plugin = Plugin("slow")
+
+    @plugin.on_messages()
+    async def _(msg, ctx):
+        await asyncio.sleep(3600)
+
+    app.add_plugin(plugin)
+    app.add_backend(Debug(messages=endless_messages(), save_replies=False))
+
+    loop = app.get_loop()
+    loop.call_later(duration, app.stop)
+
+    wall_started, cpu_started = time.monotonic(), time.process_time()
+    app.run()
+    wall, cpu = time.monotonic() - wall_started, time.process_time() - cpu_started
+
+    print(f"wall time: {wall:.2f}s, cpu time: {cpu:.2f}s, cpu usage: {cpu / wall:.1%}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
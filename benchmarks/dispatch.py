@@ -0,0 +1,64 @@
+"""
+Measure throughput of `Kutana._handle_update` with many plugins loaded.
+
+Every plugin registers handlers for commands, attachments, VKontakte
+payloads and callbacks, and non-message updates. Benchmark reports
+amount of processed updates per second for messages and for other
+updates.
+
+Usage: python3 benchmarks/dispatch.py [plugins] [updates]
+"""
+
+import sys
+import time
+import asyncio
+from kutana import Kutana, Plugin, Context
+from kutana.backends import Debug
+from kutana.update import Update, UpdateType
+
+
+def make_plugin(index):
+    plugin = Plugin(f"plugin {index}")
+
+    async def handler(update, ctx):
+        pass
+
+    plugin.on_commands([f"command{index}"])(handler)
+    plugin.on_attachments([f"type{index}"])(handler)
+    plugin.vk.on_payloads([{"command": f"command{index}"}])(handler)
+    plugin.vk.on_callbacks([{"callback": f"callback{index}"}])(handler)
+    plugin.vk.on_message_actions([f"action{index}"])(handler)
+
+    return plugin
+
+
+async def measure(app, backend, update, count):
+    ctx = await Context.create(app=app, config=app.config, update=update, backend=backend)
+
+    started = time.perf_counter()
+
+    for _ in range(count):
+        await app._handle_update(update, ctx)
+
+    return count / (time.perf_counter() - started)
+
+
+def main(plugins_count=500, updates_count=20000):
+    app = Kutana()
+    backend = Debug(messages=[])
+
+    app.add_backend(backend)
+    app.add_plugins([make_plugin(i) for i in range(plugins_count)])
+
+    message = backend._make_update(("unknown message", 1))
+    update = Update(raw={"type": "unknown"}, type=UpdateType.UPD, meta={})
+
+    loop = app.get_loop()
+
+    for name, upd in (("messages", message), ("updates", update)):
+        rate = loop.run_until_complete(measure(app, backend, upd, updates_count))
+        print(f"{name}: {rate:,.0f} updates/sec ({plugins_count} plugins)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,41 @@
+"""
+Measure latency of `MemoryStorage` puts when storage is full.
+
+Storage is filled up to its `keys_limit`, then new keys are saved and
+average and maximum time of one put is reported.
+
+Usage: python3 benchmarks/memory_eviction.py [keys_limit] [puts]
+"""
+
+import sys
+import time
+import asyncio
+from kutana.storages import MemoryStorage
+
+
+async def measure(keys_limit, puts_count):
+    storage = MemoryStorage(keys_limit)
+
+    for i in range(keys_limit):
+        await storage._put(f"key{i}", {"state": ""})
+
+    delays = []
+
+    for i in range(keys_limit, keys_limit + puts_count):
+        started = time.perf_counter()
+        await storage._put(f"key{i}", {"state": ""})
+        delays.append(time.perf_counter() - started)
+
+    return delays
+
+
+def main(keys_limit=1_000_000, puts_count=100_000):
+    delays = asyncio.get_event_loop().run_until_complete(
+        measure(int(keys_limit), int(puts_count))
+    )
+
+    print(f"put: avg {sum(delays) / len(delays) * 1e6:.1f} us, max {max(delays) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,48 @@
+"""
+Measure memory used by `MemoryStorage` per stored document.
+
+Storage is filled with documents like the ones plugins store for
+users (`{"state": ""}`), and amount of allocated memory divided by
+the amount of documents is reported for regular and compact modes.
+Reported size includes keys and structures of eviction policy.
+
+Usage: python3 benchmarks/memory_size.py [keys]
+"""
+
+import sys
+import asyncio
+import tracemalloc
+from kutana.storages import MemoryStorage
+
+
+async def fill(storage, keys_count):
+    for i in range(keys_count):
+        await storage.put(f"sender:vkontakte:{i}", {"state": "", "_version": None})
+
+
+def measure(keys_count, compact):
+    loop = asyncio.new_event_loop()
+
+    tracemalloc.start()
+
+    before, _ = tracemalloc.get_traced_memory()
+    storage = MemoryStorage(keys_limit=keys_count, compact=compact)
+    loop.run_until_complete(fill(storage, keys_count))
+    after, _ = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+    loop.close()
+
+    return (after - before) / keys_count
+
+
+def main(keys_count=1_000_000):
+    keys_count = int(keys_count)
+
+    for compact in (False, True):
+        size = measure(keys_count, compact)
+        print(f"compact={compact}: {size:.0f} bytes per document")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,69 @@
+"""
+Measure amount of updates lost because of optimistic locking when
+users send many messages at once.
+
+Every handler increments counter in the sender's document. Without
+ordering, concurrent handlers of the same sender conflict and their
+changes are dropped.
+
+Usage: python3 benchmarks/ordering.py [users] [messages_per_user]
+"""
+
+import sys
+import asyncio
+from kutana import Kutana, Plugin
+from kutana.backends import Debug
+
+
+def run(ordering, users_count, messages_count):
+    app = Kutana(ordering=ordering)
+
+    plugin = Plugin("counter")
+
+    @plugin.on_messages()
+    async def __(message, ctx):
+        doc = await plugin.storage.get(ctx.sender_key)
+
+        if doc is None:
+            doc = plugin.storage.make_document({"count": 0}, ctx.sender_key)
+
+        await asyncio.sleep(0.001)  # emulate latency of real storage
+        await doc.update({"count": doc["count"] + 1})
+
+    app.add_plugin(plugin)
+
+    app.add_backend(Debug(
+        messages=[
+            (f"message {i}", user)
+            for i in range(messages_count)
+            for user in range(1, users_count + 1)
+        ],
+    ))
+
+    app.get_loop().call_later(users_count * messages_count * 0.00005 + 1, app.stop)
+
+    app.run()
+
+    counted = 0
+
+    for user in range(1, users_count + 1):
+        doc = app.get_storage()._storage.get(f"debug:s{user}")
+        counted += doc["count"] if doc else 0
+
+    return counted
+
+
+def main(users_count=100, messages_count=20):
+    users_count, messages_count = int(users_count), int(messages_count)
+
+    for ordering in (None, "sender"):
+        counted = run(ordering, users_count, messages_count)
+
+        print(
+            f"ordering={ordering}: {counted} of {users_count * messages_count} "
+            f"updates saved"
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
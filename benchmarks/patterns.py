@@ -0,0 +1,65 @@
+"""
+Measure throughput of `Kutana._handle_update` with many `on_match`
+handlers registered.
+
+Most of the patterns start with literal text (as patterns usually do),
+some of them don't. Benchmark reports amount of processed messages per
+second for messages matched by one of patterns and for messages that
+are not matched by any pattern.
+
+Usage: python3 benchmarks/patterns.py [patterns] [messages]
+"""
+
+import sys
+import time
+from kutana import Kutana, Plugin, Context
+from kutana.backends import Debug
+
+
+def make_plugin(patterns_count):
+    plugin = Plugin("patterns")
+
+    async def handler(message, ctx):
+        pass
+
+    for i in range(patterns_count):
+        if i % 10 == 0:
+            plugin.on_match(rf"(\w+) number {i}$")(handler)
+        else:
+            plugin.on_match(rf"keyword{i}\b")(handler)
+
+    return plugin
+
+
+async def measure(app, backend, texts, count):
+    updates = [backend._make_update((text, 1)) for text in texts]
+
+    started = time.perf_counter()
+
+    for i in range(count):
+        update = updates[i % len(updates)]
+        ctx = await Context.create(app=app, config=app.config, update=update, backend=backend)
+        await app._handle_update(update, ctx)
+
+    return count / (time.perf_counter() - started)
+
+
+def main(patterns_count=1000, messages_count=2000):
+    app = Kutana()
+    backend = Debug(messages=[])
+
+    app.add_backend(backend)
+    app.add_plugin(make_plugin(patterns_count))
+
+    matched = [f"keyword{i} and text" for i in range(1, patterns_count, 10)]
+    unmatched = ["just a message", "another message without keywords"]
+
+    loop = app.get_loop()
+
+    for name, texts in (("matched", matched), ("unmatched", unmatched)):
+        rate = loop.run_until_complete(measure(app, backend, texts, messages_count))
+        print(f"{name}: {rate:,.0f} messages/sec ({patterns_count} patterns)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,115 @@
+"""
+Compare JSON libraries supported by `kutana.serializer`.
+
+For every installed library, reports the time of parsing longpoll
+responses with updates from Vkontakte, building code for `execute`
+requests, and put/get round-trips of `SqliteStorage`.
+
+Usage: python3 benchmarks/serializer.py [iterations]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from kutana import serializer
+from kutana.storages import SqliteStorage
+
+
+UPDATE = {
+    "type": "message_new",
+    "object": {
+        "message": {
+            "date": 1581000000,
+            "from_id": 123456789,
+            "id": 0,
+            "out": 0,
+            "peer_id": 2000000001,
+            "text": "Привет, бот! Как дела?",
+            "conversation_message_id": 1234,
+            "fwd_messages": [],
+            "important": False,
+            "random_id": 0,
+            "attachments": [],
+            "is_hidden": False,
+        },
+        "client_info": {
+            "button_actions": ["text", "vkpay", "open_app", "location", "open_link"],
+            "keyboard": True,
+            "inline_keyboard": True,
+            "lang_id": 0,
+        },
+    },
+    "group_id": 1,
+    "event_id": "2ee46ab2bb4de7e3b0fc2a3cc9d0a8ec7e4f3a1b",
+}
+
+RESPONSE = serializer.dumps({"ts": "100", "updates": [UPDATE] * 25})
+
+REQUESTS = [
+    ("messages.send", {"peer_id": 2000000001, "message": "Ответ " * 20, "random_id": i})
+    for i in range(25)
+]
+
+
+def bench_parse(iterations):
+    for _ in range(iterations):
+        serializer.loads(RESPONSE)
+
+
+def bench_execute(iterations):
+    for _ in range(iterations):
+        code = "return ["
+
+        for method, kwargs in REQUESTS:
+            code += f"API.{method}({serializer.dumps(kwargs)}),"
+
+        code += "];"
+
+
+def bench_storage(iterations):
+    async def run(storage):
+        await storage.init()
+
+        version = None
+
+        for _ in range(iterations):
+            version = await storage._put("key", UPDATE, version)
+            await storage._get("key")
+
+    with tempfile.TemporaryDirectory() as path:
+        storage = SqliteStorage(os.path.join(path, "kutana.sqlite3"))
+        asyncio.get_event_loop().run_until_complete(run(storage))
+        storage.connection.close()
+
+
+def measure(func, iterations):
+    start = time.perf_counter()
+    func(iterations)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations=10000):
+    iterations = int(iterations)
+
+    for library in serializer.LIBRARIES:
+        try:
+            serializer.use(library)
+        except ModuleNotFoundError:
+            print(f"{library}: not installed")
+            continue
+
+        parse = measure(bench_parse, iterations)
+        execute = measure(bench_execute, iterations)
+        storage = measure(bench_storage, iterations // 10)
+
+        print(
+            f"{library}: parse response {parse:.1f} us, "
+            f"execute code {execute:.1f} us, "
+            f"sqlite put+get {storage:.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
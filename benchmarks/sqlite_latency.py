@@ -0,0 +1,76 @@
+"""
+Measure event loop latency while plugins write to `SqliteStorage`.
+
+Writers save documents in the loop, while separate task sleeps for 1
+millisecond and measures how late it wakes up. If storage blocks the
+event loop, the delays grow with the time of queries.
+
+If `group_commit_delay` is specified, storage saves puts in group
+commits.
+
+Usage: python3 benchmarks/sqlite_latency.py [seconds] [writers] [group_commit_delay]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from kutana.storages import SqliteStorage
+
+
+async def write(storage, index, until):
+    writes = 0
+    version = None
+
+    while time.perf_counter() < until:
+        version = await storage.put(f"key{index}", {"state": "x" * 100, "_version": version})
+        writes += 1
+
+    return writes
+
+
+async def watch(until):
+    delays = []
+
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        delays.append(time.perf_counter() - started - 0.001)
+
+    return delays
+
+
+async def measure(path, duration, writers_count, group_commit_delay):
+    storage = SqliteStorage(path, group_commit_delay=group_commit_delay)
+    await storage.init()
+
+    until = time.perf_counter() + duration
+
+    delays, *writes = await asyncio.gather(
+        watch(until),
+        *(write(storage, i, until) for i in range(writers_count)),
+    )
+
+    return delays, sum(writes)
+
+
+def main(duration=5.0, writers_count=10, group_commit_delay=None):
+    duration, writers_count = float(duration), int(writers_count)
+    group_commit_delay = group_commit_delay and float(group_commit_delay)
+
+    with tempfile.TemporaryDirectory() as directory:
+        delays, writes = asyncio.get_event_loop().run_until_complete(
+            measure(os.path.join(directory, "storage.db"), duration, writers_count, group_commit_delay)
+        )
+
+    delays.sort()
+
+    print(f"writes: {writes / duration:.0f}/s")
+    print(f"loop delay: avg {sum(delays) / len(delays) * 1000:.2f} ms, "
+          f"p99 {delays[int(len(delays) * 0.99)] * 1000:.2f} ms, "
+          f"max {delays[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
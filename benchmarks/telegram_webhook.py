@@ -0,0 +1,92 @@
+"""
+Measure how many updates per second `TelegramWebhook` can receive.
+
+Local client posts updates to the webhook's server using few
+concurrent connections (like Telegram does), while application
+consumes updates from the backend's queue.
+
+Usage: python3 benchmarks/telegram_webhook.py [updates] [connections]
+"""
+
+import sys
+import time
+import asyncio
+import aiohttp
+from kutana import serializer
+from kutana.backends import TelegramWebhook
+
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "from": {"id": 1, "is_bot": False, "first_name": "User"},
+        "chat": {"id": 1, "first_name": "User", "type": "private"},
+        "date": 1569800330,
+        "text": "message",
+    },
+}
+
+
+async def measure(updates_count, connections_count):
+    updates_count -= updates_count % connections_count
+
+    backend = TelegramWebhook(
+        "token", host="127.0.0.1", port=10889, secret_token="secret",
+    )
+
+    backend.updates_queue = asyncio.Queue(backend._queue_limit)
+    await backend.start_server()
+
+    received = 0
+
+    async def submit_update(update):
+        nonlocal received
+        received += 1
+
+    async def consume():
+        while received < updates_count:
+            await backend.acquire_updates(submit_update)
+
+    url = "http://127.0.0.1:10889/"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "secret"}
+    body = serializer.dumps(UPDATE)
+
+    async def post(session, count):
+        for _ in range(count):
+            async with session.post(url, data=body, headers=headers) as resp:
+                await resp.read()
+
+    start = time.perf_counter()
+
+    connector = aiohttp.TCPConnector(limit=connections_count)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(
+            consume(),
+            *(
+                post(session, updates_count // connections_count)
+                for _ in range(connections_count)
+            ),
+        )
+
+    elapsed = time.perf_counter() - start
+
+    await backend.stop_server()
+
+    return updates_count / elapsed
+
+
+def main(updates_count=20000, connections_count=40):
+    updates_count = int(updates_count)
+    connections_count = int(connections_count)
+
+    rate = asyncio.get_event_loop().run_until_complete(
+        measure(updates_count, connections_count)
+    )
+
+    print(f"{rate:.0f} updates per second")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
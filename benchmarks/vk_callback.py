@@ -0,0 +1,93 @@
+"""
+Measure responsiveness of `VkontakteCallback` during traffic spike.
+
+Local client posts updates to the callback server using 50
+connections, while application consumes updates slower than they
+arrive, so the queue overflows.
+Reported are response latencies, statuses and backend's metrics for
+every overflow policy.
+
+Usage: python3 benchmarks/vk_callback.py [updates] [queue_limit]
+"""
+
+import sys
+import time
+import asyncio
+import aiohttp
+from collections import Counter
+from kutana import serializer
+from kutana.backends import VkontakteCallback
+from kutana.backends.vkontakte.callback import OVERFLOW_POLICIES
+
+
+CONNECTIONS = 50
+
+
+async def measure(updates_count, queue_limit, policy):
+    backend = VkontakteCallback(
+        "token", host="127.0.0.1", port=10888,
+        queue_limit=queue_limit, overflow_policy=policy,
+    )
+
+    backend.updates_queue = asyncio.Queue(queue_limit)
+    await backend.start_server()
+
+    async def submit_update(update):
+        await asyncio.sleep(0.001)
+
+    async def consume():
+        while True:
+            await backend.acquire_updates(submit_update)
+
+    consumer = asyncio.ensure_future(consume())
+
+    latencies = []
+    statuses = Counter()
+
+    async def post(session, event_ids):
+        for event_id in event_ids:
+            body = serializer.dumps({
+                "type": "message_typing_state", "object": {}, "event_id": str(event_id),
+            })
+
+            start = time.perf_counter()
+
+            async with session.post("http://127.0.0.1:10888/", data=body) as resp:
+                await resp.read()
+                statuses[resp.status] += 1
+
+            latencies.append(time.perf_counter() - start)
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(
+            post(session, range(i, updates_count, CONNECTIONS))
+            for i in range(CONNECTIONS)
+        ))
+
+    consumer.cancel()
+    await backend.stop_server()
+
+    latencies.sort()
+
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], statuses, backend.metrics
+
+
+def main(updates_count=10000, queue_limit=1000):
+    updates_count = int(updates_count)
+    queue_limit = int(queue_limit)
+
+    loop = asyncio.get_event_loop()
+
+    for policy in OVERFLOW_POLICIES:
+        p50, p99, statuses, metrics = loop.run_until_complete(
+            measure(updates_count, queue_limit, policy)
+        )
+
+        print(
+            f"{policy}: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, "
+            f"statuses {dict(statuses)}, metrics {metrics}"
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
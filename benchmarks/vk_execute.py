@@ -0,0 +1,79 @@
+"""
+Measure latency and throughput of requests sent through VKontakte's
+`execute` batching.
+
+API is replaced with a stub that answers instantly, so numbers show
+overhead of the scheduler only: average latency of sequential requests
+(light load) and amount of requests per second when many requests are
+sent concurrently (heavy load).
+
+Usage: python3 benchmarks/vk_execute.py [requests]
+"""
+
+import sys
+import time
+import asyncio
+from kutana.backends import VkontakteLongpoll
+
+
+class StubVkontakte(VkontakteLongpoll):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executes = 0
+
+    async def _get_response(self, method, kwargs={}):
+        self.executes += 1
+        return {"response": [1] * kwargs["code"].count("API.")}
+
+    async def _update_group_data(self):
+        pass
+
+
+async def measure(requests_count):
+    loop = asyncio.get_event_loop()
+
+    vkontakte = StubVkontakte(token="token", session=object())
+    vkontakte._requests_event = asyncio.Event()
+
+    task = asyncio.ensure_future(vkontakte._execute_loop(loop))
+
+    # Wait for the first token to make measurements independent
+    await asyncio.sleep(vkontakte.api_request_pause)
+
+    started = time.perf_counter()
+
+    for _ in range(10):
+        await vkontakte._request("users.get", {})
+        await asyncio.sleep(vkontakte.api_request_pause)
+
+    latency = (
+        time.perf_counter() - started - 10 * vkontakte.api_request_pause
+    ) / 10
+
+    vkontakte.executes = 0
+
+    started = time.perf_counter()
+
+    await asyncio.gather(*(
+        vkontakte._request("users.get", {"user_id": i})
+        for i in range(requests_count)
+    ))
+
+    elapsed = time.perf_counter() - started
+
+    task.cancel()
+
+    return latency, requests_count / elapsed, vkontakte.executes
+
+
+def main(requests_count=2000):
+    latency, throughput, executes = asyncio.get_event_loop().run_until_complete(
+        measure(requests_count)
+    )
+
+    print(f"light load latency: {latency * 1000:.1f} ms")
+    print(f"heavy load: {throughput:.0f} requests/s ({executes} executes)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
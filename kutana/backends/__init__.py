@@ -1,11 +1,12 @@
 from .debug import Debug
 from .vkontakte import Vkontakte, VkontakteLongpoll, VkontakteCallback
 from .telegram import Telegram
+from .telegram_webhook import TelegramWebhook
 from .terminal import Terminal
 
 __all__ = [
     "Debug",
     "Vkontakte", "VkontakteLongpoll", "VkontakteCallback",
-    "Telegram",
+    "Telegram", "TelegramWebhook",
     "Terminal"
 ]
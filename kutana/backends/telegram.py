@@ -1,11 +1,13 @@
 import asyncio
+import hashlib
 import aiohttp
-import json
-from ..helpers import pick_by
+from .. import serializer
+from ..helpers import pick_by, TokenBucket
 from ..backend import Backend
-from ..update import Message, ReceiverType, Update, UpdateType, Attachment
+from ..update import Message, ReceiverType, Update, UpdateType, Attachment, FileGetter
 from ..exceptions import RequestException
 from ..logger import logger
+from ..upload_cache import UploadCache
 
 
 SUPPORTED_ATTACHMENT_TYPES = (
@@ -22,6 +24,21 @@ ATTACHMENT_TYPE_ALIASES = {
     "image": "photo",
 }
 
+# Attachments of the same kind can be sent together with sendMediaGroup
+MEDIA_GROUP_KINDS = {
+    "photo": "visual",
+    "video": "visual",
+    "document": "document",
+    "audio": "audio",
+}
+
+MEDIA_GROUP_SIZE = 10
+
+CAPTION_MAX_LENGTH = 1024
+
+# Limiters of idle chats are removed when there are more chats than this
+CHATS_LIMITERS_CLEANUP_SIZE = 10000
+
 
 class Telegram(Backend):
     def __init__(
@@ -31,6 +48,10 @@ class Telegram(Backend):
         session=None,
         proxy=None,
         api_url="https://api.telegram.org",
+        chat_messages_per_second=1,
+        chat_messages_burst=10,
+        upload_cache_size=10_000,
+        upload_cache_storage=None,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -46,23 +67,48 @@ class Telegram(Backend):
 
         self.username = None
         self.api_token = token
-        self.api_messages_pause = 1 / messages_per_second
-        self.api_messages_lock = None
+
+        self.chat_messages_per_second = chat_messages_per_second
+        self.chat_messages_burst = chat_messages_burst
+
+        self._messages_limiter = TokenBucket(messages_per_second)
+        self._chats_limiters = {}
+
+        if upload_cache_size:
+            self.upload_cache = UploadCache(upload_cache_size, upload_cache_storage)
+        else:
+            self.upload_cache = None
+
+        # IDs of files can be used only by the bot that sent them
+        self._upload_cache_scope = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
 
         api_url = api_url.rstrip("/")
         self.api_url = f"{api_url}/bot{token}/{{}}"
         self.file_url = f"{api_url}/file/bot{token}/{{}}"
 
+    @classmethod
+    def get_identity(cls):
+        return "telegram"
+
     async def _request(self, method, kwargs={}):
         if not self.session:
             self.session = aiohttp.ClientSession()
 
         data = {k: v for k, v in kwargs.items() if v is not None}
 
+        # Files streamed from async iterators are sent as multipart form
+        if any(hasattr(v, "__aiter__") for v in data.values()):
+            form = aiohttp.FormData()
+
+            for k, v in data.items():
+                form.add_field(k, v, filename=k if hasattr(v, "__aiter__") else None)
+
+            data = form
+
         url = self.api_url.format(method)
 
         async with self.session.post(url, proxy=self.proxy, data=data) as resp:
-            data = await resp.json(content_type=None)
+            data = await resp.json(content_type=None, loads=serializer.loads)
 
             if not data.get("ok"):
                 raise RequestException(self, (method, {**kwargs}), data)
@@ -81,10 +127,23 @@ class Telegram(Backend):
         async with self.session.get(url, proxy=self.proxy) as resp:
             return await resp.read()
 
+    async def _stream_file(self, file_id, chunk_size):
+        file = await self._request("getFile", {"file_id": file_id})
+
+        url = self.file_url.format(file["file_path"])
+
+        async with self.session.get(url, proxy=self.proxy) as resp:
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
+
     def _make_getter(self, file_id):
         async def getter():
             return await self._request_file(file_id)
-        return getter
+
+        def stream(chunk_size):
+            return self._stream_file(file_id, chunk_size)
+
+        return FileGetter(getter, stream)
 
     def _make_attachment(self, raw_attachment, raw_attachment_type):
         t = raw_attachment_type
@@ -229,7 +288,7 @@ class Telegram(Backend):
             response = await self._request(
                 "getUpdates", {"timeout": 25, "offset": self.offset}
             )
-        except (json.JSONDecodeError, aiohttp.ClientError):
+        except (serializer.JSONDecodeError, aiohttp.ClientError):
             return
 
         except asyncio.CancelledError:
@@ -244,56 +303,204 @@ class Telegram(Backend):
             await submit_update(self._make_update(update))
             self.offset = update["update_id"] + 1
 
+    def _get_chat_limiter(self, chat_id):
+        """
+        Return lock and token bucket for specified chat. Lock keeps
+        order of messages sent to the chat.
+        """
+
+        limiter = self._chats_limiters.get(chat_id)
+
+        if limiter is None:
+            if len(self._chats_limiters) >= CHATS_LIMITERS_CLEANUP_SIZE:
+                self._chats_limiters = {
+                    k: v for k, v in self._chats_limiters.items()
+                    if v[0].locked() or not v[1].is_full()
+                }
+
+            limiter = self._chats_limiters[chat_id] = (
+                asyncio.Lock(),
+                TokenBucket(self.chat_messages_per_second, self.chat_messages_burst),
+            )
+
+        return limiter
+
+    async def _send(self, chat_bucket, method, kwargs):
+        await chat_bucket.acquire()
+        await self._messages_limiter.acquire()
+        return await self._request(method, kwargs)
+
+    @staticmethod
+    def _get_sent_file_id(message, attachment_type):
+        if not isinstance(message, dict) or attachment_type not in message:
+            return None
+
+        file = message[attachment_type]
+
+        # Photos are returned in all available sizes
+        if isinstance(file, list):
+            file = file[-1]
+
+        return file.get("file_id")
+
+    @staticmethod
+    def _group_attachments(attachments):
+        """
+        Split list of (attachment, type) pairs to groups of consecutive
+        attachments that can be sent with one `sendMediaGroup`.
+        """
+
+        groups = []
+        last_kind = None
+
+        for attachment, attachment_type in attachments:
+            kind = MEDIA_GROUP_KINDS.get(attachment_type)
+
+            if kind is None or kind != last_kind or len(groups[-1]) >= MEDIA_GROUP_SIZE:
+                groups.append([])
+
+            groups[-1].append((attachment, attachment_type))
+            last_kind = kind
+
+        return groups
+
+    async def _get_file(self, attachment):
+        """
+        Return tuple (file, cache_key) where file is ID of the file if
+        it was already sent and cache_key is key of the file's ID in
+        upload cache.
+        """
+
+        if attachment.uploaded:
+            return str(attachment.id), None
+
+        # Files that were already sent are sent by their IDs
+        cache_key = self.upload_cache and UploadCache.get_key(attachment, self._upload_cache_scope)
+        cached = cache_key and await self.upload_cache.get(cache_key)
+
+        if cached:
+            return cached["file_id"], cache_key
+
+        return attachment.file, cache_key
+
+    async def _send_files(self, chat_bucket, method, kwargs, files):
+        """
+        Perform request for sending files that were returned by
+        :meth:`_get_file` as list of tuples (file, cache_key). Cached
+        IDs of files are removed from cache if request fails.
+        """
+
+        try:
+            return await self._send(chat_bucket, method, kwargs)
+        except RequestException:
+            for file, cache_key in files:
+                if cache_key and isinstance(file, str):
+                    await self.upload_cache.delete(cache_key)
+            raise
+
+    async def _save_file_id(self, cache_key, file, sent, attachment_type):
+        if cache_key and not isinstance(file, str):
+            file_id = self._get_sent_file_id(sent, attachment_type)
+
+            if file_id:
+                await self.upload_cache.put(cache_key, {"file_id": file_id})
+
+    async def _send_attachment(self, chat_bucket, chat_id, attachment, attachment_type):
+        file, cache_key = await self._get_file(attachment)
+
+        sent = await self._send_files(chat_bucket, f"send{attachment_type.capitalize()}", pick_by({
+            "chat_id": chat_id,
+            attachment_type: file,
+            "caption": attachment.title,
+        }), [(file, cache_key)])
+
+        await self._save_file_id(cache_key, file, sent, attachment_type)
+
+        return sent
+
+    async def _send_media_group(self, chat_bucket, chat_id, group, caption):
+        media = []
+        new_files = {}
+        files = []
+
+        for i, (attachment, attachment_type) in enumerate(group):
+            file, cache_key = await self._get_file(attachment)
+
+            files.append((file, cache_key))
+
+            # New files are sent in the same request
+            if not isinstance(file, str):
+                new_files[f"file{i}"] = file
+                file = f"attach://file{i}"
+
+            media.append(pick_by({
+                "type": attachment_type,
+                "media": file,
+                "caption": caption if i == 0 and caption else attachment.title,
+            }))
+
+        sent = await self._send_files(chat_bucket, "sendMediaGroup", {
+            "chat_id": chat_id,
+            "media": serializer.dumps(media),
+            **new_files,
+        }, files)
+
+        for message, (_, attachment_type), (file, cache_key) in zip(sent or (), group, files):
+            await self._save_file_id(cache_key, file, message, attachment_type)
+
+        return sent
+
     async def execute_send(self, target_id, message, attachments, kwargs):
         result = []
 
         chat_id = str(target_id)
 
-        async with self.api_messages_lock:
-            if message:
-                result.append(await self._request("sendMessage", {
-                    "chat_id": chat_id,
-                    "text": message,
-                    **kwargs,
-                }))
+        if isinstance(attachments, (int, str, Attachment)):
+            attachments = (attachments,)
 
-                await asyncio.sleep(self.api_messages_pause)
+        typed_attachments = []
 
-            if isinstance(attachments, (int, str, Attachment)):
-                attachments = (attachments,)
+        for attachment in attachments:
+            if not isinstance(attachment, Attachment):
+                raise ValueError(f'Unexpected attachment: "{attachment}"')
 
-            for attachment in attachments:
-                if not isinstance(attachment, Attachment):
-                    raise ValueError(f'Unexpected attachment: "{attachment}"')
+            attachment_type = ATTACHMENT_TYPE_ALIASES.get(
+                attachment.type,
+                attachment.type,
+            )
 
-                attachment_type = ATTACHMENT_TYPE_ALIASES.get(
-                    attachment.type,
-                    attachment.type,
-                )
+            if not attachment.uploaded and attachment_type not in SUPPORTED_ATTACHMENT_TYPES:
+                raise ValueError(f"Can't upload attachment '{attachment_type}'")
 
-                send_method = f"send{attachment_type.capitalize()}"
+            typed_attachments.append((attachment, attachment_type))
 
-                if attachment.uploaded:
-                    result.append(await self._request(send_method, pick_by({
-                        "chat_id": chat_id,
-                        attachment_type: str(attachment.id),
-                        "caption": attachment.title,
-                    })))
+        groups = self._group_attachments(typed_attachments)
 
-                    await asyncio.sleep(self.api_messages_pause)
+        # Text is sent as caption of the media group if possible
+        caption = None
 
-                    continue
+        if (
+            message and not kwargs and len(message) <= CAPTION_MAX_LENGTH
+            and groups and len(groups[0]) > 1 and not groups[0][0][0].title
+        ):
+            caption = message
 
-                if attachment_type not in SUPPORTED_ATTACHMENT_TYPES:
-                    raise ValueError(f"Can't upload attachment '{attachment_type}'")
+        chat_lock, chat_bucket = self._get_chat_limiter(chat_id)
 
-                result.append(await self._request(send_method, pick_by({
+        async with chat_lock:
+            if message and not caption:
+                result.append(await self._send(chat_bucket, "sendMessage", {
                     "chat_id": chat_id,
-                    attachment_type: attachment.file,
-                    "caption": attachment.title,
-                })))
+                    "text": message,
+                    **kwargs,
+                }))
 
-                await asyncio.sleep(self.api_messages_pause)
+            for group in groups:
+                if len(group) == 1:
+                    result.append(await self._send_attachment(chat_bucket, chat_id, *group[0]))
+                else:
+                    result.append(await self._send_media_group(chat_bucket, chat_id, group, caption))
+                    caption = None
 
             return result
 
@@ -301,6 +508,9 @@ class Telegram(Backend):
         return await self._request(method, kwargs)
 
     async def on_start(self, app):
+        if self.upload_cache:
+            self.upload_cache.resolve_storage(app)
+
         me = await self._request("getMe")
 
         name = me.get("first_name", "") + " " + me.get("last_name", "")
@@ -314,8 +524,6 @@ class Telegram(Backend):
 
         self.username = me["username"]
 
-        self.api_messages_lock = asyncio.Lock()
-
     async def send_message(self, target_id, message, attachments=(), **kwargs):
         """
         Send message to specified `target_id` with text `message` and
@@ -0,0 +1,82 @@
+import asyncio
+import hmac
+from aiohttp import web
+from .telegram import Telegram
+from .webhook_server import WebhookServerMixin
+from .. import serializer
+from ..helpers import get_random_string
+from ..logger import logger
+
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class TelegramWebhook(WebhookServerMixin, Telegram):
+    """
+    Telegram backend that receives updates with webhook instead of
+    long polling.
+
+    Web server listens on 'host' and 'port', and webhook is set to the
+    'address' on start (path of 'address' is used as server's path if
+    'address_path' is not specified). Requests without expected secret
+    token are rejected. If 'secret_token' is not specified, random one
+    is generated.
+
+    Received updates are kept in queue of 'queue_limit' updates. If
+    queue is full, requests are answered with 503, so Telegram delivers
+    updates later.
+    """
+
+    def __init__(
+        self,
+        *args,
+        port=10889,
+        secret_token=None,
+        max_connections=40,
+        allowed_updates=None,
+        **kwargs
+    ):
+        super().__init__(*args, port=port, **kwargs)
+
+        self.secret_token = secret_token or get_random_string(32)
+        self.max_connections = max_connections
+        self.allowed_updates = allowed_updates
+
+    async def handle_request(self, request):
+        secret_token = request.headers.get(SECRET_TOKEN_HEADER, "")
+
+        if not hmac.compare_digest(secret_token, self.secret_token):
+            return web.Response(status=403)
+
+        try:
+            data = serializer.loads(await request.read())
+        except serializer.JSONDecodeError:
+            return web.Response(status=400)
+
+        try:
+            self.updates_queue.put_nowait(self._make_update(data))
+        except asyncio.QueueFull:
+            logger.warning("Updates queue is full, update will be delivered later (Telegram)")
+            return web.Response(status=503)
+
+        return web.Response(body="ok")
+
+    async def on_start(self, app):
+        await super().on_start(app)
+
+        if not self._address:
+            logger.warning(
+                "No address provided for TelegramWebhook! You "
+                "will have to set bot's webhook manually."
+            )
+            return
+
+        await self._request("setWebhook", {
+            "url": self._address,
+            "secret_token": self.secret_token,
+            "max_connections": self.max_connections,
+            "allowed_updates": (
+                None if self.allowed_updates is None
+                else serializer.dumps(self.allowed_updates)
+            ),
+        })
@@ -1,19 +1,25 @@
+from collections import deque
 from random import random
 import asyncio
-import json
 import re
 import aiohttp
+from ... import serializer
 from ...logger import logger
 from ...backend import Backend
+from ...helpers import TokenBucket
 from ...update import (
-    ReceiverType, UpdateType, Update, Message, Attachment,
+    ReceiverType, UpdateType, Update, Message, Attachment, FileGetter,
 )
 from ...exceptions import RequestException
+from ...upload_cache import UploadCache
 
 
 NAIVE_CACHE = {}
 
 
+EXECUTE_BATCH_SIZE = 25
+
+
 class VKRequest(asyncio.Future):
     def __init__(self, method, kwargs):
         super().__init__()
@@ -29,6 +35,10 @@ class Vkontakte(Backend):
         requests_per_second=19,
         api_version="5.131",
         api_url="https://api.vk.com",
+        requests_batch_delay=0.002,
+        upload_cache_size=10_000,
+        upload_cache_storage=None,
+        uploads_concurrency=4,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -39,6 +49,7 @@ class Vkontakte(Backend):
         self.api_token = token
         self.api_version = api_version
         self.api_request_pause = 1 / requests_per_second
+        self.requests_batch_delay = requests_batch_delay
 
         self.session = session
         self._is_session_local = session is None
@@ -47,7 +58,18 @@ class Vkontakte(Backend):
         self.group_screen_name = None
         self.group_name = None
 
-        self.requests_queue = []
+        self.requests_queue = deque()
+
+        self._requests_limiter = TokenBucket(requests_per_second)
+        self._requests_event = None
+
+        if upload_cache_size:
+            self.upload_cache = UploadCache(upload_cache_size, upload_cache_storage)
+        else:
+            self.upload_cache = None
+
+        self.uploads_concurrency = uploads_concurrency
+        self._uploads_semaphore = None
 
         self.api_request_url = api_url + f"/method/{{}}?access_token={token}&v={api_version}"
 
@@ -80,7 +102,7 @@ class Vkontakte(Backend):
         request_url = self.api_request_url.format(method)
 
         async with self.session.post(request_url, data=data) as response:
-            return await response.json(content_type=None)
+            return await response.json(content_type=None, loads=serializer.loads)
 
     async def raw_request(self, method, kwargs={}):
         """
@@ -97,25 +119,45 @@ class Vkontakte(Backend):
 
         return data["response"]
 
+    async def _wait_for_requests(self):
+        """
+        Wait until there are requests in the queue. If there are less
+        requests than can be sent in one batch, wait for more requests
+        for `requests_batch_delay` seconds.
+        """
+
+        self._requests_event.clear()
+
+        if not self.requests_queue:
+            await self._requests_event.wait()
+            self._requests_event.clear()
+
+        if len(self.requests_queue) < EXECUTE_BATCH_SIZE and self.requests_batch_delay:
+            try:
+                await asyncio.wait_for(
+                    self._requests_event.wait(),
+                    timeout=self.requests_batch_delay,
+                )
+            except asyncio.TimeoutError:
+                pass
+
     async def _execute_loop(self, loop):
         while True:
-            await asyncio.sleep(self.api_request_pause)
+            await self._wait_for_requests()
 
-            requests = []
-
-            for _ in range(25):
-                if not self.requests_queue:
-                    break
+            # Requests keep coming while we wait for the limiter, so
+            # batch is taken from the queue only after that.
+            await self._requests_limiter.acquire()
 
-                requests.append(self.requests_queue.pop())
+            requests = []
 
-            if not requests:
-                continue
+            while self.requests_queue and len(requests) < EXECUTE_BATCH_SIZE:
+                requests.append(self.requests_queue.popleft())
 
             code = "return ["
 
             for r in requests:
-                kwargs = json.dumps(r.kwargs, ensure_ascii=False)
+                kwargs = serializer.dumps(r.kwargs)
                 code += f"API.{r.method}({kwargs}),"
 
             code += "];"
@@ -156,6 +198,11 @@ class Vkontakte(Backend):
 
         self.requests_queue.append(req)
 
+        # Wake up execute loop when queue stops being empty or when
+        # full batch can be sent.
+        if self._requests_event and len(self.requests_queue) in (1, EXECUTE_BATCH_SIZE):
+            self._requests_event.set()
+
         res = await asyncio.wait_for(req, timeout=timeout)
 
         logger.debug("Vkontakte: %s(%s) => %s", method, kwargs, res)
@@ -197,7 +244,13 @@ class Vkontakte(Backend):
         async def getter():
             async with self.session.get(url) as response:
                 return await response.read()
-        return getter
+
+        async def stream(chunk_size):
+            async with self.session.get(url) as response:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
+
+        return FileGetter(getter, stream)
 
     def _make_attachment(self, raw_attachment):
         t = raw_attachment["type"]
@@ -313,16 +366,43 @@ class Vkontakte(Backend):
 
     async def _upload_file_to_vk(self, upload_url, data):
         async with self.session.post(upload_url, data=data) as resp:
-            return await resp.json(content_type=None)
+            return await resp.json(content_type=None, loads=serializer.loads)
+
+    def _get_upload_cache_key(self, attachment, peer_id):
+        if not self.upload_cache:
+            return None
+
+        # Attachments are uploaded for the group, and attachments for
+        # messages and for walls are uploaded differently
+        return UploadCache.get_key(
+            attachment, f"{self.group_id}:{'messages' if peer_id else 'wall'}",
+        )
 
     async def upload_attachment(self, attachment, peer_id=None):
         """
         Upload specified attachment to VKontakte with specified peer_id and
         return newly uploaded attachment.
 
-        This method doesn't change passed attachments.
+        This method doesn't change passed attachments. Attachments with
+        the same contents are uploaded once if upload cache is enabled.
         """
 
+        cache_key = self._get_upload_cache_key(attachment, peer_id)
+
+        if cache_key:
+            cached = await self.upload_cache.get(cache_key)
+
+            if cached:
+                return self._make_attachment(cached["attachment"])
+
+        raw_attachment = await self._upload_attachment(attachment, peer_id)
+
+        if cache_key:
+            await self.upload_cache.put(cache_key, {"attachment": raw_attachment})
+
+        return self._make_attachment(raw_attachment)
+
+    async def _upload_attachment(self, attachment, peer_id):
         attachment_type = attachment.type
 
         if attachment_type == "voice":
@@ -352,12 +432,10 @@ class Vkontakte(Backend):
                 upload_data["upload_url"], data
             )
 
-            attachment = await self._request(
+            return await self._request(
                 "docs.save", upload_result
             )
 
-            return self._make_attachment(attachment)
-
         if attachment_type == "image":
             upload_data = await self._request(
                 "photos.getMessagesUploadServer", {"peer_id": peer_id}
@@ -380,15 +458,57 @@ class Vkontakte(Backend):
                 if not peer_id or not e.error or e.error["error_code"] != 1:
                     raise
 
-                return await self.upload_attachment(attachment, peer_id=None)
+                # Streams can't be uploaded again
+                if hasattr(attachment.file, "__aiter__"):
+                    raise
+
+                return await self._upload_attachment(attachment, peer_id=None)
 
-            return self._make_attachment({
+            return {
                 "type": "photo",
                 "photo": attachments[0],
-            })
+            }
 
         raise ValueError(f"Can't upload attachment '{attachment_type}'")
 
+    async def _upload_attachments(self, attachments, peer_id):
+        """
+        Upload new attachments concurrently (up to 'uploads_concurrency'
+        uploads at once for the backend) and return list of attachments
+        in the same order.
+        """
+
+        attachments = list(attachments)
+
+        indices = [
+            i for i, a in enumerate(attachments)
+            if isinstance(a, Attachment) and a.type != "sticker" and not a.uploaded
+        ]
+
+        if not indices:
+            return attachments
+
+        if self._uploads_semaphore is None:
+            self._uploads_semaphore = asyncio.Semaphore(self.uploads_concurrency)
+
+        async def upload(attachment):
+            async with self._uploads_semaphore:
+                return await self.upload_attachment(attachment, peer_id=peer_id)
+
+        tasks = [asyncio.ensure_future(upload(attachments[i])) for i in indices]
+
+        try:
+            uploaded = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        for i, attachment in zip(indices, uploaded):
+            attachments[i] = attachment
+
+        return attachments
+
     async def execute_send(self, target_id, message, attachments, kwargs):
         # Form proper arguments
         true_kwargs = {"message": message, "peer_id": target_id}
@@ -403,15 +523,21 @@ class Vkontakte(Backend):
         if isinstance(attachments, (int, str, Attachment)):
             attachments = (attachments,)
 
+        attachments = list(attachments)
+
+        new_attachments = [
+            a for a in attachments
+            if isinstance(a, Attachment) and a.type != "sticker" and not a.uploaded
+        ]
+
+        attachments = await self._upload_attachments(attachments, target_id)
+
         for a in attachments:
             if isinstance(a, Attachment):
                 if a.type == "sticker":
                     true_kwargs["sticker_id"] = a.id
                     continue
 
-                if not a.uploaded:
-                    a = await self.upload_attachment(a, peer_id=target_id)
-
                 if not a.id:
                     raise ValueError("Attachment has no ID")
 
@@ -430,7 +556,17 @@ class Vkontakte(Backend):
         if true_attachments[:-1]:
             true_kwargs["attachment"] = true_attachments[:-1]
 
-        return await self._request("messages.send", true_kwargs)
+        try:
+            return await self._request("messages.send", true_kwargs)
+        except RequestException:
+            # Cached attachments could be unavailable now
+            for attachment in new_attachments:
+                cache_key = self._get_upload_cache_key(attachment, target_id)
+
+                if cache_key:
+                    await self.upload_cache.delete(cache_key)
+
+            raise
 
     async def execute_request(self, method, kwargs):
         return await self._request(method, kwargs)
@@ -439,6 +575,9 @@ class Vkontakte(Backend):
         if not self.session:
             self.session = aiohttp.ClientSession()
 
+        if self.upload_cache:
+            self.upload_cache.resolve_storage(app)
+
         await self._update_group_data()
 
         logger.info(
@@ -447,6 +586,11 @@ class Vkontakte(Backend):
             self.group_id,
         )
 
+        self._requests_event = asyncio.Event()
+
+        if self.requests_queue:
+            self._requests_event.set()
+
         self._tasks.append(asyncio.ensure_future(
             self._execute_loop(app.get_loop()),
             loop=app.get_loop()
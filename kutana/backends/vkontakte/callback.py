@@ -1,8 +1,8 @@
-from urllib.parse import urlparse
-import asyncio
-import re
+from collections import OrderedDict
 from aiohttp import web
 from .backend import Vkontakte
+from ..webhook_server import WebhookServerMixin
+from ... import serializer
 from ...helpers import get_random_string
 from ...logger import logger
 
@@ -10,43 +10,98 @@ from ...logger import logger
 DEFAULT_ADDRESS = "0.0.0.0:8080/callback/1"
 
 
-class VkontakteCallback(Vkontakte):
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "reject")
+
+
+class VkontakteCallback(WebhookServerMixin, Vkontakte):
+    """
+    Vkontakte backend that receives updates with callback server.
+
+    Requests are answered as soon as updates are put to the queue of
+    'queue_limit' updates (or unbounded queue if 'queue_limit' is 0).
+    When queue is full, 'overflow_policy' is applied:
+
+    - "drop_oldest" - the oldest update in queue is dropped.
+    - "drop_newest" - received update is dropped.
+    - "reject" - request is answered with 503, so Vkontakte sends
+      update again later.
+
+    Up to 'dedupe_size' last event IDs are remembered, and updates
+    with the same IDs (retries from Vkontakte) are ignored.
+
+    Counters of received, queued, duplicated, dropped and rejected
+    updates are available in 'metrics'.
+    """
+
     def __init__(
         self,
         *args,
-        address=None,
-        address_path=None,
-        host="0.0.0.0",
         port=10888,
-        queue_limit=0,
+        overflow_policy="reject",
+        dedupe_size=10000,
         callback_settings=None,
         **kwargs
     ):
-        super().__init__(*args, **kwargs)
+        super().__init__(*args, port=port, **kwargs)
+
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
 
         self.callback_settings = callback_settings or {}
 
-        if address:
-            if not re.match(r"^https://", address):
-                address = f"https://{address}"
+        self.overflow_policy = overflow_policy
+        self.dedupe_size = dedupe_size
+        self._event_ids = OrderedDict()
+
+        self.metrics = {
+            "received": 0,
+            "queued": 0,
+            "duplicated": 0,
+            "dropped": 0,
+            "rejected": 0,
+        }
+
+    def _is_duplicate(self, data):
+        event_id = data.get("event_id")
+
+        if not self.dedupe_size or event_id is None:
+            return False
+
+        if event_id in self._event_ids:
+            return True
+
+        self._event_ids[event_id] = None
+
+        if len(self._event_ids) > self.dedupe_size:
+            self._event_ids.popitem(last=False)
+
+        return False
 
-            self._address = address
-            self._address_path = address_path or urlparse(address).path or "/"
+    def _enqueue(self, update):
+        """Put update to the queue and return False if it was rejected."""
 
-        else:
-            self._address = None
-            self._address_path = address_path or "/"
+        if self.updates_queue.full():
+            if self.overflow_policy == "reject":
+                self.metrics["rejected"] += 1
+                return False
 
-        self._server_path = self._address_path
-        self._server_host = host
-        self._server_port = port
-        self._server_app_runner = None
+            self.metrics["dropped"] += 1
 
-        self._queue_limit = queue_limit
-        self.updates_queue = None
+            if self.overflow_policy == "drop_newest":
+                return True
+
+            self.updates_queue.get_nowait()
+
+        self.updates_queue.put_nowait(update)
+        self.metrics["queued"] += 1
+
+        return True
 
     async def handle_request(self, request):
-        data = await request.json()
+        try:
+            data = serializer.loads(await request.read())
+        except serializer.JSONDecodeError:
+            return web.Response(status=400)
 
         if data["type"] == "confirmation":
             resp = await self.request(
@@ -56,43 +111,22 @@ class VkontakteCallback(Vkontakte):
 
             return web.Response(body=f"{resp['code']}")
 
-        await self.updates_queue.put(self._make_update(data))
-
-        return web.Response(body="ok")
-
-    def make_server_app(self):
-        app = web.Application()
-        app.add_routes([web.post(self._server_path, self.handle_request)])
-        return app
+        self.metrics["received"] += 1
 
-    async def start_server(self):
-        app = self.make_server_app()
+        if self._is_duplicate(data):
+            self.metrics["duplicated"] += 1
+            return web.Response(body="ok")
 
-        self._server_app_runner = web.AppRunner(app)
+        if not self._enqueue(self._make_update(data)):
+            # Update will be sent again, so it's not a duplicate
+            self._event_ids.pop(data.get("event_id"), None)
+            return web.Response(status=503)
 
-        await self._server_app_runner.setup()
-
-        site = web.TCPSite(
-            self._server_app_runner,
-            self._server_host,
-            self._server_port
-        )
-
-        await site.start()
-
-    async def stop_server(self):
-        if self._server_app_runner:
-            await self._server_app_runner.cleanup()
+        return web.Response(body="ok")
 
     async def on_start(self, app):
         await super().on_start(app)
 
-        # Setup queue
-        self.updates_queue = asyncio.Queue(self._queue_limit)
-
-        # Start web server
-        await self.start_server()
-
         if not self._address:
             logger.warning(
                 "No address provided for VkontakteCallback! You "
@@ -143,10 +177,3 @@ class VkontakteCallback(Vkontakte):
             server_id=server_id,
             **callback_settings,
         )
-
-    async def on_shutdown(self, app):
-        await super().on_shutdown(app)
-        await self.stop_server()
-
-    async def acquire_updates(self, submit_update):
-        await submit_update(await self.updates_queue.get())
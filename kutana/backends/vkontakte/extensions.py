@@ -1,5 +1,5 @@
-import json
 import warnings
+from ... import serializer
 from ...helpers import uniq_by, pick
 from ...handler import Handler
 from ...routers import MapRouter
@@ -9,6 +9,9 @@ from ...update import UpdateType
 class PayloadRouter(MapRouter):
     __slots__ = ("possible_key_sets",)
 
+    update_types = (UpdateType.MSG,)
+    backend_identities = ("vkontakte",)
+
     def __init__(self, priority=7):
         """Base priority is 7"""
         super().__init__(priority=priority)
@@ -51,8 +54,8 @@ class PayloadRouter(MapRouter):
         message = update.raw["object"]["message"]
 
         try:
-            payload = json.loads(message.get("payload", ""))
-        except json.JSONDecodeError:
+            payload = serializer.loads(message.get("payload", ""))
+        except serializer.JSONDecodeError:
             return
 
         if isinstance(payload, dict):
@@ -65,8 +68,13 @@ class PayloadRouter(MapRouter):
         self._update_key_sets(key)
         return super().add_handler(handler, self._to_hashable(key))
 
+    def remove_handler(self, handler, key):
+        return super().remove_handler(handler, self._to_hashable(key))
+
 
 class CallbackPayloadRouter(PayloadRouter):
+    update_types = (UpdateType.UPD,)
+
     def _get_keys(self, update, ctx):
         if ctx.backend.get_identity() != "vkontakte":
             return
@@ -86,6 +94,9 @@ class CallbackPayloadRouter(PayloadRouter):
 class ActionMessageRouter(MapRouter):
     __slots__ = ()
 
+    update_types = (UpdateType.MSG,)
+    backend_identities = ("vkontakte",)
+
     def __init__(self, priority=3):
         """Base priority is 3."""
         super().__init__(priority)
@@ -93,6 +104,9 @@ class ActionMessageRouter(MapRouter):
     def add_handler(self, handler, key):
         return super().add_handler(handler, key.lower())
 
+    def remove_handler(self, handler, key):
+        return super().remove_handler(handler, key.lower())
+
     def _get_keys(self, update, ctx):
         backend_identity = ctx.backend.get_identity()
 
@@ -144,7 +158,7 @@ class VkontaktePluginExtension:
 
         def decorator(func):
             async def wrapper(update, ctx):
-                ctx.payload = json.loads(
+                ctx.payload = serializer.loads(
                     update.raw["object"]["message"].get("payload", "")
                 )
 
@@ -205,7 +219,7 @@ class VkontaktePluginExtension:
 
                 async def send_message_event_answer(event_data, **kwargs):
                     return await ctx.request("messages.sendMessageEventAnswer", **{
-                        "event_data": json.dumps(event_data),
+                        "event_data": serializer.dumps(event_data),
                         **ctx.message_event,
                         **kwargs,
                     })
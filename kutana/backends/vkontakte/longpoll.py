@@ -1,7 +1,7 @@
 import asyncio
-import json
 import aiohttp
 from .backend import Vkontakte
+from ... import serializer
 from ...logger import logger
 
 
@@ -27,8 +27,8 @@ class VkontakteLongpoll(Vkontakte):
 
         try:
             async with self.session.post(longpoll_url) as resp:
-                return await resp.json(content_type=None)
-        except (json.JSONDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
+                return await resp.json(content_type=None, loads=serializer.loads)
+        except (serializer.JSONDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
             return None
 
         except asyncio.CancelledError:
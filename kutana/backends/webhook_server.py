@@ -0,0 +1,96 @@
+from urllib.parse import urlparse
+import asyncio
+import re
+from aiohttp import web
+
+
+class WebhookServerMixin:
+    """
+    Mixin for backends that receive updates with web server.
+
+    Web server listens on 'host' and 'port', and backend should
+    register 'address' (if specified) on start. Path of 'address' is
+    used as server's path if 'address_path' is not specified.
+
+    Requests are handled with backend's 'handle_request' method, which
+    should put updates to the queue of 'queue_limit' updates (or
+    unbounded queue if 'queue_limit' is 0).
+    """
+
+    def __init__(
+        self,
+        *args,
+        address=None,
+        address_path=None,
+        host="0.0.0.0",
+        port=8080,
+        queue_limit=10000,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+
+        if address:
+            if not re.match(r"^https://", address):
+                address = f"https://{address}"
+
+            self._address = address
+            self._address_path = address_path or urlparse(address).path or "/"
+
+        else:
+            self._address = None
+            self._address_path = address_path or "/"
+
+        self._server_path = self._address_path
+        self._server_host = host
+        self._server_port = port
+        self._server_app_runner = None
+
+        self._queue_limit = queue_limit
+        self.updates_queue = None
+
+    async def handle_request(self, request):
+        raise NotImplementedError
+
+    def make_server_app(self):
+        app = web.Application()
+        app.add_routes([web.post(self._server_path, self.handle_request)])
+        return app
+
+    async def start_server(self):
+        app = self.make_server_app()
+
+        self._server_app_runner = web.AppRunner(app)
+
+        await self._server_app_runner.setup()
+
+        site = web.TCPSite(
+            self._server_app_runner,
+            self._server_host,
+            self._server_port
+        )
+
+        await site.start()
+
+    async def stop_server(self):
+        if self._server_app_runner:
+            await self._server_app_runner.cleanup()
+
+    async def on_start(self, app):
+        await super().on_start(app)
+
+        # Setup queue
+        self.updates_queue = asyncio.Queue(self._queue_limit)
+
+        # Start web server
+        await self.start_server()
+
+    async def on_shutdown(self, app):
+        await self.stop_server()
+        await super().on_shutdown(app)
+
+    async def acquire_updates(self, submit_update):
+        await submit_update(await self.updates_queue.get())
+
+        # Submit updates that were received in the meantime
+        while not self.updates_queue.empty():
+            await submit_update(self.updates_queue.get_nowait())
@@ -4,8 +4,8 @@ import argparse
 import yaml
 from kutana import Kutana, load_plugins, logger
 from kutana.i18n import load_translations, set_default_language
-from kutana.backends import Vkontakte, VkontakteCallback, Telegram
-from kutana.storages import MemoryStorage, MongoDBStorage, SqliteStorage
+from kutana.backends import Vkontakte, VkontakteCallback, Telegram, TelegramWebhook
+from kutana.storages import MemoryStorage, MongoDBStorage, SqliteStorage, RedisStorage
 
 
 parser = argparse.ArgumentParser("kutana", description="Run kutana application instance using provided config.")
@@ -21,6 +21,14 @@ parser.add_argument(
     "--translations", dest="translations", type=str,
     default="", help="folder with translations to load (default: none)",
 )
+parser.add_argument(
+    "--workers", dest="workers", type=int,
+    default=0, help="amount of worker processes for plugins (default: 0, no workers)",
+)
+parser.add_argument(
+    "--ordering", dest="ordering", choices=("sender", "receiver"),
+    default=None, help="process updates with the same sender or receiver one by one",
+)
 parser.add_argument(
     "--debug", dest="debug", action="store_const",
     const=True, default=False,
@@ -42,6 +50,9 @@ def add_backends(app, backends):
         elif backend["kind"] == "vk":
             app.add_backend(Vkontakte(**kwargs))
 
+        elif backend["kind"] == "tg" and "address" in backend:
+            app.add_backend(TelegramWebhook(**kwargs))
+
         elif backend["kind"] == "tg":
             app.add_backend(Telegram(**kwargs))
 
@@ -66,6 +77,9 @@ def add_storages(app, storages):
         elif storage["kind"] == "sqlite":
             app.set_storage(name, SqliteStorage(**kwargs))
 
+        elif storage["kind"] == "redis":
+            app.set_storage(name, RedisStorage(**kwargs))
+
         else:
             logger.logger.warning(f"Unknown storage kind: {storage['kind']}")
 
@@ -95,7 +109,7 @@ def run():
         config = yaml.safe_load(fh)
 
     # Create application
-    app = Kutana()
+    app = Kutana(workers=args.workers, ordering=args.ordering)
 
     # Update configuration
     app.config.update(config)
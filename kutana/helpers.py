@@ -1,5 +1,7 @@
 import string
 import random
+import time
+import asyncio
 import os.path
 
 
@@ -51,3 +53,93 @@ def ensure_list(value):
     if isinstance(value, (list, tuple)):
         return value
     return [value]
+
+
+class VersionedDict(dict):
+    """
+    Dictionary that increments it's `version` every time it's changed.
+    Changes of mutable values stored in dictionary are not tracked.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._changed()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._changed()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+
+class TokenBucket:
+    """
+    Token bucket for limiting rate of actions. Bucket is refilled with
+    `rate` tokens per second and holds up to `capacity` tokens. Waiters
+    are served in order of calls to :meth:`acquire`.
+    """
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("Rate should be positive")
+
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def is_full(self):
+        """Return True if bucket holds all tokens it can hold."""
+
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def reserve(self):
+        """
+        Take token from the bucket and return amount of seconds to wait
+        before it can be used.
+        """
+
+        self._refill()
+        self._tokens -= 1
+        return max(0, -self._tokens / self.rate)
+
+    async def acquire(self):
+        """Wait until token is available and take it."""
+
+        delay = self.reserve()
+
+        if delay:
+            await asyncio.sleep(delay)
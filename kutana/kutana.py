@@ -1,12 +1,16 @@
 import asyncio
+from collections import deque
 from sortedcontainers import SortedList
 from .handler import HandlerResponse as hr
 from .storages import MemoryStorage
 from .storage import OptimisticLockException, Storage
 from .backend import Backend
 from .context import Context
+from .update import UpdateType
 from .plugin import Plugin
 from .logger import logger
+from .helpers import VersionedDict
+from .workers import WorkersPool
 
 
 # Find proper methods for different python versions
@@ -30,6 +34,34 @@ class Kutana:
     - '.prefixes' - prefixes for commands (default is [".", "/"])
     - '.ignore_initial_spaces' - ignore spaces after prefix (default is True)
 
+    Configuration and plugins can be changed while application is running.
+    Changes will be applied to the next processed updates. Note that
+    "start" handlers of plugins added this way are not called.
+
+    If 'workers' is specified, updates will be processed by plugins in
+    specified amount of worker processes. Backends are still managed by
+    the main process, and updates from the same sender (or with the
+    same key, if 'ordering' is specified) are always processed by the
+    same worker. Workers are started with 'fork', so
+    this mode is not available on Windows. Storages are used by each
+    worker separately, so shared storage (not :class:`MemoryStorage`,
+    which is the default one) should be used with workers, or state
+    of chats will be split between workers.
+
+    If 'ordering' is specified, updates with the same key are processed
+    one after another in order they were received, while updates with
+    different keys are still processed concurrently. Possible values:
+
+    - "sender" - updates from the same sender (or from the same
+      receiver if update has no sender).
+    - "receiver" - updates for the same receiver (chat).
+
+    Updates that wait for previous updates with the same key release
+    their slots of 'concurrent_handlers_count' (and take them back
+    before processing), so updates with other keys are not delayed. Up
+    to 'ordering_backlog_limit' updates can wait without slots, other
+    waiting updates keep their slots.
+
     :ivar ~.config: Application's configuration
     """
 
@@ -38,7 +70,13 @@ class Kutana:
         concurrent_handlers_count=512,
         default_storage=None,
         loop=None,
+        workers=0,
+        ordering=None,
+        ordering_backlog_limit=10000,
     ):
+        if ordering not in (None, "sender", "receiver"):
+            raise ValueError(f"Unknown ordering: {ordering}")
+
         self._plugins = []
         self._backends = []
         self._storages = {"default": default_storage or MemoryStorage()}
@@ -47,15 +85,24 @@ class Kutana:
 
         self._concurrent_handlers_count = concurrent_handlers_count
         self._sem = asyncio.Semaphore(value=concurrent_handlers_count)
+        self._queue_capacity = None
 
         self._routers = None
+        self._routers_plans = None
         self._handlers = None
 
-        self.config = {
+        self._workers_pool = WorkersPool(self, workers) if workers else None
+
+        self._ordering = ordering
+        self._ordered_queues = {}
+        self._ordering_backlog_limit = ordering_backlog_limit
+        self._ordering_backlog = 0
+
+        self.config = VersionedDict({
             "prefixes": (".", "/"),
             "mention_prefix": ("", ","),
             "ignore_initial_spaces": True,
-        }
+        })
 
     def get_loop(self):
         """Return application's asyncio loop."""
@@ -78,6 +125,35 @@ class Kutana:
             raise RuntimeError("Plugin already added")
         self._plugins.append(plugin)
 
+        # Update already initialized routers and handlers
+        if self._routers is not None:
+            plugin.app = self
+
+            for router in plugin._routers:
+                self._add_router(router)
+
+            self._routers_plans = {}
+
+        self._handlers = None
+
+    def remove_plugin(self, plugin):
+        """Remove plugin from the application."""
+        if plugin not in self._plugins:
+            raise RuntimeError("Plugin is not added")
+        self._plugins.remove(plugin)
+
+        # Update already initialized routers and handlers
+        if self._routers is not None:
+            for router in plugin._routers:
+                for app_router in self._routers:
+                    if app_router.can_merge(router):
+                        app_router.unmerge(router)
+                        break
+
+            self._routers_plans = {}
+
+        self._handlers = None
+
     def add_plugins(self, plugins):
         """Add every plugin in passed iterable to the application."""
         for plugin in plugins:
@@ -105,10 +181,26 @@ class Kutana:
     def get_backends(self):
         return self._backends
 
-    async def _on_start(self, queue):
+    async def _init_storages(self):
         for storage in self._storages.values():
             await storage.init()
 
+    async def _start_plugins(self):
+        await self._init_storages()
+
+        # Prepare plugins
+        for plugin in self._plugins:
+            plugin.app = self
+
+        # Run event listeners
+        await self._handle_event("start")
+
+    async def _on_start(self, queue):
+        # Backends use storages (like upload cache's one) in the main
+        # process, while plugins use them in workers
+        if self._workers_pool:
+            await self._init_storages()
+
         # Prepare backends and run background update acquiring
         for backend in self._backends:
             await backend.on_start(self)
@@ -121,18 +213,20 @@ class Kutana:
                     return await queue.put((update, backend))
 
                 while True:
-                    if queue.qsize() < queue.maxsize:
-                        await backend.acquire_updates(submit_update)
+                    # Don't acquire new updates until queue has free slots
+                    async with self._queue_capacity:
+                        await self._queue_capacity.wait_for(lambda: not queue.full())
+
+                    await backend.acquire_updates(submit_update)
                     await asyncio.sleep(0)
 
             asyncio.ensure_future(acquire_updates(backend), loop=self._loop)
 
-        # Prepare plugins
-        for plugin in self._plugins:
-            plugin.app = self
-
-        # Run event listeners
-        await self._handle_event("start")
+        # Plugins are started in workers if they are used
+        if self._workers_pool:
+            await self._workers_pool.on_start()
+        else:
+            await self._start_plugins()
 
     async def _main_loop_wrapper(self):
         try:
@@ -145,6 +239,7 @@ class Kutana:
 
     async def _main_loop(self):
         queue = asyncio.Queue(maxsize=self._concurrent_handlers_count)
+        self._queue_capacity = asyncio.Condition()
 
         await self._on_start(queue)
 
@@ -153,6 +248,9 @@ class Kutana:
 
             update, backend = await queue.get()
 
+            async with self._queue_capacity:
+                self._queue_capacity.notify_all()
+
             ctx = await Context.create(
                 app=self,
                 config=self.config,
@@ -162,12 +260,74 @@ class Kutana:
 
             backend.prepare_context(ctx)
 
-            task = asyncio.ensure_future(
-                self._handle_update_with_logger(update, ctx),
-                loop=self._loop
+            if self._workers_pool:
+                self._workers_pool.dispatch(update, backend, ctx)
+                continue
+
+            self._process_update(
+                update, ctx, self._sem.release, self._sem.release, self._sem.acquire,
             )
 
-            task.add_done_callback(lambda t: self._sem.release())
+    def _get_ordering_key(self, ctx):
+        if self._ordering == "sender":
+            return ctx.sender_key or ctx.receiver_key
+
+        if self._ordering == "receiver":
+            return ctx.receiver_key
+
+        return None
+
+    def _process_update(self, update, ctx, callback, release=None, acquire=None):
+        """
+        Start processing of the update and call callback when it's
+        processed. If ordering is enabled and updates with the same key
+        are being processed, update will be processed after them.
+
+        If 'release' and 'acquire' (coroutine function) are specified,
+        slot of the waiting update is released with 'release' and
+        acquired back with 'acquire' before processing.
+        """
+
+        key = self._get_ordering_key(ctx)
+
+        if key is not None:
+            queue = self._ordered_queues.get(key)
+
+            if queue is not None:
+                if release and self._ordering_backlog < self._ordering_backlog_limit:
+                    self._ordering_backlog += 1
+                    release()
+                else:
+                    acquire = None
+
+                queue.append((update, ctx, callback, acquire))
+                return
+
+            self._ordered_queues[key] = deque()
+
+        asyncio.ensure_future(
+            self._process_updates(key, update, ctx, callback),
+            loop=self._loop
+        )
+
+    async def _process_updates(self, key, update, ctx, callback):
+        while True:
+            try:
+                await self._handle_update_with_logger(update, ctx)
+            finally:
+                callback()
+
+            queue = self._ordered_queues.get(key)
+
+            if not queue:
+                self._ordered_queues.pop(key, None)
+                return
+
+            update, ctx, callback, acquire = queue.popleft()
+
+            if acquire:
+                self._ordering_backlog -= 1
+                await acquire()
 
     def _init_handlers(self):
         self._handlers = {}
@@ -186,20 +346,49 @@ class Kutana:
         for handler in self._handlers.get(name):
             await handler.handle(*args, **kwargs)
 
-    def _init_routers(self):
-        self._routers = SortedList([], key=lambda r: -r.priority)
+    def _add_router(self, new_router):
+        for router in self._routers:
+            if router.can_merge(new_router):
+                router.merge(new_router)
+                return
+
+        # Plugins' routers are not modified, so they can be removed later
+        router = type(new_router)(priority=new_router.priority)
+        router.merge(new_router)
 
-        def _add_router(new_router):
-            for router in self._routers:
-                if router.can_merge(new_router):
-                    router.merge(new_router)
-                    return
+        self._routers.add(router)
 
-            self._routers.add(new_router)
+    def _init_routers(self):
+        self._routers = SortedList([], key=lambda r: -r.priority)
 
         for plugin in self._plugins:
             for router in plugin._routers:
-                _add_router(router)
+                self._add_router(router)
+
+        # Compile plans for known backends
+        self._routers_plans = {}
+
+        for backend in self._backends:
+            for update_type in UpdateType:
+                self._get_routers_plan(update_type, backend.get_identity())
+
+    def _get_routers_plan(self, update_type, backend_identity):
+        """
+        Return routers that can handle updates with specified type from
+        backend with specified identity.
+        """
+
+        plan_key = (update_type, backend_identity)
+
+        plan = self._routers_plans.get(plan_key)
+
+        if plan is None:
+            plan = self._routers_plans[plan_key] = tuple(
+                router for router in self._routers
+                if router.can_handle(update_type, backend_identity)
+            )
+
+        return plan
 
     async def _handle_update_with_logger(self, update, ctx):
         logger.debug("Processing update %s", update)
@@ -220,7 +409,9 @@ class Kutana:
 
         await self._handle_event("before", update, ctx)
 
-        for router in self._routers:
+        routers = self._get_routers_plan(update.type, ctx.backend.get_identity())
+
+        for router in routers:
             if await router.handle(update, ctx) != hr.SKIPPED:
                 ctx._result = hr.COMPLETE
                 break
@@ -240,7 +431,10 @@ class Kutana:
         for backend in self._backends:
             tasks.append(backend.on_shutdown(self))
 
-        tasks.append(self._handle_event("shutdown"))
+        if self._workers_pool:
+            tasks.append(self._workers_pool.stop())
+        else:
+            tasks.append(self._handle_event("shutdown"))
 
         await asyncio.gather(*tasks, return_exceptions=True)
 
@@ -260,6 +454,9 @@ class Kutana:
         """Run the application."""
         logger.info("Starting application...")
 
+        if self._workers_pool:
+            self._workers_pool.start()
+
         try:
             asyncio.ensure_future(self._main_loop_wrapper(), loop=self._loop)
             self._loop.run_forever()
@@ -1,14 +1,12 @@
-import re
 import inspect
 import warnings
 import functools
 from .handler import Handler, HandlerResponse
-from .update import UpdateType
 from .helpers import ensure_list
 from .backends.vkontakte import VkontaktePluginExtension
 from .routers import (
-    CommandsRouter, AttachmentsRouter, ListRouter, AnyMessageRouter,
-    AnyUpdateRouter
+    CommandsRouter, AttachmentsRouter, AnyMessageRouter, AnyUpdateRouter,
+    PatternsRouter,
 )
 
 
@@ -287,7 +285,7 @@ class Plugin:
         """
         Decorator for registering coroutine to be called when
         incoming update is message and it's text is matched by
-        provided pattern.
+        provided pattern (string or compiled regular expression).
 
         Context is automatically populated with following values:
 
@@ -298,21 +296,10 @@ class Plugin:
         """
 
         def decorator(func):
-            async def wrapper(update, ctx):
-                if update.type != UpdateType.MSG:
-                    return HandlerResponse.SKIPPED
-
-                match = re.match(pattern, update.text)
-                if not match:
-                    return HandlerResponse.SKIPPED
-
-                ctx.match = match
-
-                return await func(update, ctx)
-
             self._add_handler_for_router(
-                ListRouter,
-                handler=Handler(wrapper, priority),
+                PatternsRouter,
+                handler=Handler(func, priority),
+                handler_key=pattern,
                 router_priority=router_priority,
             )
 
@@ -3,8 +3,23 @@ from .handler import HandlerResponse as hr
 
 
 class Router:
+    """
+    Base class for routers.
+
+    Routers can limit types of updates (`update_types`) and identities of
+    backends (`backend_identities`) they can handle. Application uses
+    them to skip routers that can't handle update without calling them.
+    Value None means that router accepts any value.
+
+    Application merges routers of plugins into new routers, so routers
+    should be constructible with only `priority` argument.
+    """
+
     __slots__ = ("priority",)
 
+    update_types = None
+    backend_identities = None
+
     def __init__(self, priority=0):
         self.priority = priority
 
@@ -22,6 +37,16 @@ class Router:
         if other_router.priority != self.priority:
             raise RuntimeError("Can't merge routers with different priorities")
 
+    def can_handle(self, update_type, backend_identity):
+        """Can router handle updates of specified type from specified backend?"""
+        if self.update_types is not None and update_type not in self.update_types:
+            return False
+
+        if self.backend_identities is not None and backend_identity not in self.backend_identities:
+            return False
+
+        return True
+
     def _check_update(self, update, ctx):
         """Should update be processed?"""
         return True
@@ -29,6 +54,10 @@ class Router:
     def merge(self, other_router):
         raise NotImplementedError
 
+    def unmerge(self, other_router):
+        """Remove handlers of other router from this router."""
+        raise NotImplementedError
+
     async def handle(self, update, ctx):
         raise NotImplementedError
 
@@ -43,10 +72,19 @@ class ListRouter(Router):
     def add_handler(self, handler):
         self._handlers.add(handler)
 
+    def remove_handler(self, handler):
+        self._handlers.discard(handler)
+
     def merge(self, other_router):
         self._assert_routers_can_merge(other_router)
         self._handlers.update(other_router._handlers)
 
+    def unmerge(self, other_router):
+        self._assert_routers_can_merge(other_router)
+
+        for handler in other_router._handlers:
+            self.remove_handler(handler)
+
     async def handle(self, update, ctx):
         if not self._check_update(update, ctx):
             return hr.SKIPPED
@@ -78,6 +116,17 @@ class MapRouter(Router):
         else:
             self._handlers[key] = SortedList([handler], key=self._key)
 
+    def remove_handler(self, handler, key):
+        handlers = self._handlers.get(key)
+
+        if handlers is None:
+            return
+
+        handlers.discard(handler)
+
+        if not handlers:
+            del self._handlers[key]
+
     def merge(self, other_router):
         self._assert_routers_can_merge(other_router)
 
@@ -85,6 +134,13 @@ class MapRouter(Router):
             for handler in handlers:
                 self.add_handler(handler, key)
 
+    def unmerge(self, other_router):
+        self._assert_routers_can_merge(other_router)
+
+        for key, handlers in other_router._handlers.items():
+            for handler in handlers:
+                self.remove_handler(handler, key)
+
     async def handle(self, update, ctx):
         keys = self._get_keys(update, ctx)
 
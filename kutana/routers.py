@@ -1,55 +1,223 @@
 import re
-from .router import MapRouter, ListRouter
+import heapq
+from sortedcontainers import SortedList
+from .handler import HandlerResponse as hr
+from .router import Router, MapRouter, ListRouter
 from .update import UpdateType
 
 
+REGEX_SPECIAL_CHARACTERS = set(".^$*+?{}[]\\|()")
+
+
+class CommandMatch:
+    """
+    Result of matching message by :class:`kutana.routers.CommandsRouter`.
+    Mimics `re.Match` with following groups: prefix, command and body.
+    """
+
+    __slots__ = ("string", "_spans")
+
+    def __init__(self, string, spans):
+        self.string = string
+        self._spans = spans
+
+    def span(self, group=0):
+        return self._spans[group]
+
+    def start(self, group=0):
+        return self._spans[group][0]
+
+    def end(self, group=0):
+        return self._spans[group][1]
+
+    def group(self, *groups):
+        if not groups:
+            groups = (0,)
+
+        values = tuple(
+            None if self._spans[g] is None else self.string[self._spans[g][0]:self._spans[g][1]]
+            for g in groups
+        )
+
+        return values[0] if len(values) == 1 else values
+
+    def groups(self):
+        return self.group(1, 2, 3)
+
+    def __getitem__(self, group):
+        return self.group(group)
+
+
 class CommandsRouter(MapRouter):
-    __slots__ = ("_pattern", "_pattern_when_mentioned")
+    """
+    Router for commands. Commands are looked up in a trie, so time of
+    matching doesn't depend on amount of registered commands. If many
+    commands match message, the longest one is used.
+
+    Handlers can be added and removed at any time, and changes of
+    prefixes in application's config are picked up automatically.
+    """
+
+    __slots__ = (
+        "_commands", "_prefixes", "_mention_prefixes", "_ignore_spaces",
+        "_config", "_config_version",
+    )
+
+    update_types = (UpdateType.MSG,)
 
     def __init__(self, priority=6):
         """Base priority is 6."""
         super().__init__(priority=priority)
-        self._pattern = None
-        self._pattern_when_mentioned = None
-
-    def _populate_cache(self, ctx):
-        kwargs = {
-            "prefix": "|".join(
-                re.escape(prefix) for prefix in ctx.config["prefixes"]
-            ),
-            "mention_prefix": "|".join(
-                re.escape(prefix) for prefix in [*ctx.config["prefixes"], *ctx.config["mention_prefix"]]
-            ),
-            "command": "|".join(
-                re.escape(command) for command in list(self._handlers.keys())
-            ),
-            "spaces": r"\s*" if ctx.config["ignore_initial_spaces"] else "",
-        }
-
-        self._pattern = re.compile(
-            pattern=r"{spaces}({prefix}){spaces}({command})(?:$|\s([\s\S]*))".format(**kwargs),
-            flags=re.IGNORECASE,
-        )
+        self._commands = None
+        self._prefixes = None
+        self._mention_prefixes = None
+        self._ignore_spaces = None
+        self._config = None
+        self._config_version = None
+
+    def _update_config(self, config):
+        version = getattr(config, "version", None)
+
+        if config is self._config and version == self._config_version:
+            return
 
-        self._pattern_when_mentioned = re.compile(
-            pattern=r"{spaces}({mention_prefix}){spaces}(?:{prefix})?{spaces}({command})(?:$|\s([\s\S]*))".format(**kwargs),
-            flags=re.IGNORECASE,
+        self._prefixes = tuple(p.lower() for p in config["prefixes"])
+        self._mention_prefixes = tuple(
+            p.lower() for p in [*config["prefixes"], *config["mention_prefix"]]
         )
+        self._ignore_spaces = config["ignore_initial_spaces"]
+
+        self._config = config
+        self._config_version = version
+
+    def _add_command(self, key):
+        node = self._commands
+
+        for char in key:
+            for lower_char in char.lower():
+                node = node.setdefault(lower_char, {})
+
+        node[None] = key
+
+    def _update_commands(self):
+        if self._commands is not None:
+            return
+
+        self._commands = {}
+
+        for key in self._handlers:
+            self._add_command(key)
+
+    def _skip_spaces(self, text, pos):
+        if self._ignore_spaces:
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+        return pos
+
+    def _skip_prefix(self, text, pos, prefix):
+        """Return position after prefix or -1 if text doesn't have it."""
+        end = pos + len(prefix)
+        if text[pos:end].lower() == prefix:
+            return end
+        return -1
+
+    def _find_command(self, text, pos):
+        """
+        Return the longest command that starts at specified position and
+        position of it's end.
+        """
+
+        node = self._commands
+        found = None
+
+        while True:
+            if None in node and (pos == len(text) or text[pos].isspace()):
+                found = (node[None], pos)
+
+            if pos == len(text):
+                return found
+
+            for char in text[pos].lower():
+                node = node.get(char)
+
+                if node is None:
+                    return found
+
+            pos += 1
+
+    def _make_match(self, text, prefix_span, command_start, found):
+        key, command_end = found
+
+        if command_end == len(text):
+            spans = ((0, command_end), prefix_span, (command_start, command_end), None)
+        else:
+            spans = ((0, len(text)), prefix_span, (command_start, command_end), (command_end + 1, len(text)))
+
+        return key, CommandMatch(text, spans)
+
+    def _match(self, text):
+        start = self._skip_spaces(text, 0)
+
+        for prefix in self._prefixes:
+            end = self._skip_prefix(text, start, prefix)
+
+            if end != -1:
+                command_start = self._skip_spaces(text, end)
+                found = self._find_command(text, command_start)
+
+                if found is not None:
+                    return self._make_match(text, (start, end), command_start, found)
+
+        return None, None
+
+    def _match_when_mentioned(self, text):
+        start = self._skip_spaces(text, 0)
+
+        for mention_prefix in self._mention_prefixes:
+            end = self._skip_prefix(text, start, mention_prefix)
+
+            if end == -1:
+                continue
+
+            for prefix in (*self._prefixes, ""):
+                prefix_end = self._skip_prefix(text, self._skip_spaces(text, end), prefix)
+
+                if prefix_end != -1:
+                    command_start = self._skip_spaces(text, prefix_end)
+                    found = self._find_command(text, command_start)
+
+                    if found is not None:
+                        return self._make_match(text, (start, end), command_start, found)
+
+        return None, None
 
     def add_handler(self, handler, key):
-        return super().add_handler(handler, key.lower())
+        key = key.lower()
+
+        super().add_handler(handler, key)
+
+        if self._commands is not None:
+            self._add_command(key)
+
+    def remove_handler(self, handler, key):
+        key = key.lower()
+
+        super().remove_handler(handler, key)
+
+        if key not in self._handlers:
+            self._commands = None
 
     def _get_keys(self, update, ctx):
         if update.type != UpdateType.MSG:
             return ()
 
-        if self._pattern is None:
-            self._populate_cache(ctx)
+        self._update_config(ctx.config)
+        self._update_commands()
 
         if update.meta.get("bot_mentioned"):
-            match = self._pattern_when_mentioned.match(update.text)
+            key, match = self._match_when_mentioned(update.text)
         else:
-            match = self._pattern.match(update.text)
+            key, match = self._match(update.text)
 
         if match is None:
             return ()
@@ -59,12 +227,14 @@ class CommandsRouter(MapRouter):
         ctx.body = (match.group(3) or "").strip()
         ctx.match = match
 
-        return (ctx.command.lower(),)
+        return (key,)
 
 
 class AttachmentsRouter(MapRouter):
     __slots__ = ()
 
+    update_types = (UpdateType.MSG,)
+
     def __init__(self, priority=3):
         """Base priority is 3."""
         super().__init__(priority=priority)
@@ -79,6 +249,8 @@ class AttachmentsRouter(MapRouter):
 class AnyMessageRouter(ListRouter):
     __slots__ = ()
 
+    update_types = (UpdateType.MSG,)
+
     def __init__(self, priority=9):
         """Base priority is 9."""
         super().__init__(priority=priority)
@@ -90,9 +262,120 @@ class AnyMessageRouter(ListRouter):
 class AnyUpdateRouter(ListRouter):
     __slots__ = ()
 
+    update_types = (UpdateType.UPD,)
+
     def __init__(self, priority=9):
         """Base priority is 9."""
         super().__init__(priority=priority)
 
     def _check_update(self, update, ctx):
         return update.type == UpdateType.UPD
+
+
+class PatternsRouter(Router):
+    """
+    Router for handlers that should be called when text of the message
+    is matched by regular expression. Patterns are compiled once, and
+    messages are only checked against patterns that can match them
+    judging by literal prefixes of patterns.
+    """
+
+    __slots__ = ("_handlers", "_index", "_unindexed")
+
+    update_types = (UpdateType.MSG,)
+
+    def __init__(self, priority=-3):
+        """Base priority is -3."""
+        super().__init__(priority=priority)
+        self._handlers = SortedList([], key=lambda entry: -entry[0].priority)
+        self._index = None
+        self._unindexed = None
+
+    @staticmethod
+    def _get_literal_prefix(pattern):
+        """Return text that every string matched by pattern starts with."""
+
+        if pattern.flags & (re.IGNORECASE | re.VERBOSE) or "|" in pattern.pattern:
+            return ""
+
+        prefix = ""
+
+        for char in pattern.pattern:
+            if char in REGEX_SPECIAL_CHARACTERS:
+                # Previous character can be optional
+                if char in "*?{" and prefix:
+                    prefix = prefix[:-1]
+                break
+
+            prefix += char
+
+        return prefix
+
+    def _build_index(self):
+        self._index = {}
+        self._unindexed = []
+
+        for position, (_, pattern) in enumerate(self._handlers):
+            prefix = self._get_literal_prefix(pattern)
+
+            if prefix:
+                self._index.setdefault(prefix[0], []).append((position, prefix))
+            else:
+                self._unindexed.append(position)
+
+    def _get_candidates(self, text):
+        """Return positions of handlers which patterns can match text."""
+
+        if self._index is None:
+            self._build_index()
+
+        indexed = [
+            position
+            for position, prefix in self._index.get(text[:1], ())
+            if text.startswith(prefix)
+        ]
+
+        if not self._unindexed:
+            return indexed
+
+        return heapq.merge(indexed, self._unindexed)
+
+    def add_handler(self, handler, pattern):
+        self._handlers.add((handler, re.compile(pattern)))
+        self._index = None
+
+    def remove_handler(self, handler, pattern):
+        self._handlers.discard((handler, re.compile(pattern)))
+        self._index = None
+
+    def merge(self, other_router):
+        self._assert_routers_can_merge(other_router)
+        self._handlers.update(other_router._handlers)
+        self._index = None
+
+    def unmerge(self, other_router):
+        self._assert_routers_can_merge(other_router)
+
+        for entry in other_router._handlers:
+            self._handlers.discard(entry)
+
+        self._index = None
+
+    async def handle(self, update, ctx):
+        if update.type != UpdateType.MSG:
+            return hr.SKIPPED
+
+        for position in self._get_candidates(update.text):
+            handler, pattern = self._handlers[position]
+
+            match = pattern.match(update.text)
+
+            if not match:
+                continue
+
+            ctx.match = match
+
+            if await handler.handle(update, ctx) != hr.SKIPPED:
+                return hr.COMPLETE
+
+        return hr.SKIPPED
@@ -0,0 +1,80 @@
+"""
+JSON serializer used by kutana for storing values and for requests and
+responses of backends.
+
+The fastest installed library is selected on import ("orjson",
+"ujson" or "json" from standard library). Other library can be
+selected with :func:`use`. Use attributes of this module (like
+`serializer.dumps`) instead of importing them, so changes are
+picked up.
+"""
+
+import json
+
+
+def _load_orjson():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    return dumps, orjson.loads, orjson.JSONDecodeError
+
+
+def _load_ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False)
+
+    return dumps, ujson.loads, ValueError
+
+
+def _load_json():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    return dumps, json.loads, json.JSONDecodeError
+
+
+LIBRARIES = {
+    "orjson": _load_orjson,
+    "ujson": _load_ujson,
+    "json": _load_json,
+}
+
+
+library = None
+dumps = None
+loads = None
+JSONDecodeError = ValueError
+
+
+def use(name=None):
+    """
+    Select library for serialization by its name. If name is None,
+    the fastest installed library is selected. Returns name of the
+    selected library.
+
+    Raises ModuleNotFoundError if library is not installed.
+    """
+
+    global library, dumps, loads, JSONDecodeError
+
+    if name is None:
+        for name in LIBRARIES:
+            try:
+                return use(name)
+            except ModuleNotFoundError:
+                pass
+
+    if name not in LIBRARIES:
+        raise ValueError(f"Unknown JSON library: {name}")
+
+    dumps, loads, JSONDecodeError = LIBRARIES[name]()
+    library = name
+
+    return name
+
+
+use()
@@ -1,3 +1,7 @@
+import copy
+import asyncio
+import inspect
+import random
 from .helpers import ensure_list
 
 
@@ -77,6 +81,32 @@ class Document:
 
         return self
 
+    async def atomic(self, mutate, attempts=5, backoff=0.01):
+        """
+        Call `mutate` with this document and save it. If saving fails
+        because of optimistic locking, document is refreshed and the
+        process is repeated after random delay (up to `backoff`
+        seconds, doubled every attempt). Raises
+        :class:`kutana.storage.OptimisticLockException` if all `attempts`
+        failed.
+
+        `mutate` can be a function or a coroutine function.
+        """
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, backoff * 2 ** (attempt - 1)))
+                await self.refresh()
+
+            result = mutate(self)
+            if inspect.isawaitable(result):
+                await result
+
+            try:
+                return await self.save()
+            except OptimisticLockException:
+                if attempt + 1 == attempts:
+                    raise
+
 
 class Storage:
     async def init(self):
@@ -94,11 +124,93 @@ class Storage:
         return await self._delete(key)
 
     async def get(self, key):
-        values = await self._get(key)
+        values = await self._get_shared(key)
         if not values:
             return None
         return Document(values, key=key, storage=self)
 
+    async def _get_shared(self, key):
+        """
+        Perform `_get` for key. Concurrent calls for the same key share
+        one call of `_get`. If call was shared, every caller receives
+        its own deep copy of the result, so changes made by one caller
+        are not visible to others.
+        """
+
+        # Storages don't have to call Storage.__init__
+        pending = self.__dict__.setdefault("_pending_gets", {})
+
+        shared = pending.get(key)
+
+        if shared is None:
+            task = asyncio.ensure_future(self._get_and_forget(key, pending))
+            shared = pending[key] = [task, False]
+        else:
+            shared[1] = True
+
+        values = await asyncio.shield(shared[0])
+
+        # Nobody can join the call after it's completed
+        if shared[1] and values:
+            return copy.deepcopy(values)
+
+        return values
+
+    async def _get_and_forget(self, key, pending):
+        try:
+            return await self._get(key)
+        finally:
+            pending.pop(key, None)
+
+    async def get_many(self, keys):
+        """
+        Return list of documents (or None for missing ones) for
+        specified keys.
+        """
+        keys = list(keys)
+        return [
+            Document(values, key=key, storage=self) if values else None
+            for key, values in zip(keys, await self._get_many(keys))
+        ]
+
+    async def put_many(self, items):
+        """
+        Put values for every pair of key and values in `items`. Returns
+        list with new versions for every pair. Puts that failed with
+        :class:`kutana.storage.OptimisticLockException` don't prevent other
+        puts, and their exceptions are returned instead of versions.
+        """
+        items = list(items)
+        for _, values in items:
+            if "_version" not in values:
+                raise ValueError("Values missing '_version'")
+        return await self._put_many([
+            (key, values, values.get("_version")) for key, values in items
+        ])
+
+    async def delete_many(self, keys):
+        return await self._delete_many(list(keys))
+
+    async def atomic(self, key, mutate, default=None, attempts=5, backoff=0.01):
+        """
+        Load document for key (or create it with `default` values), and
+        update it with :meth:`kutana.storage.Document.atomic`.
+        """
+        document = await self.get(key)
+        if document is None:
+            document = self.make_document({**(default or {})}, key)
+        return await document.atomic(mutate, attempts=attempts, backoff=backoff)
+
+    async def update_fields(self, key, values=None, increments=None):
+        """
+        Set fields from `values` and add numbers from `increments` to
+        fields of the document for key (missing fields are considered
+        to be 0) without conflicts with other updates. Document is
+        created if it doesn't exist. Returns updated document.
+        """
+        values = await self._update_fields(key, values or {}, increments or {})
+        return Document(values, key=key, storage=self)
+
     async def _put(self, key, values, version=None):
         raise NotImplementedError
 
@@ -107,3 +219,28 @@ class Storage:
 
     async def _delete(self, key):
         raise NotImplementedError
+
+    async def _get_many(self, keys):
+        return [await self._get(key) for key in keys]
+
+    async def _put_many(self, items):
+        results = []
+        for key, values, version in items:
+            try:
+                results.append(await self._put(key, values, version=version))
+            except OptimisticLockException as e:
+                results.append(e)
+        return results
+
+    async def _delete_many(self, keys):
+        for key in keys:
+            await self._delete(key)
+
+    async def _update_fields(self, key, values, increments):
+        def mutate(document):
+            document.values.update(values)
+            for field, increment in increments.items():
+                document.values[field] = document.values.get(field, 0) + increment
+
+        document = await self.atomic(key, mutate)
+        return document.values
@@ -1,5 +1,10 @@
 from .sqlite import SqliteStorage
 from .memory import MemoryStorage
 from .mongodb import MongoDBStorage
+from .redis import RedisStorage
+from .cached import CachedStorage
 
-__all__ = ["MemoryStorage", "MongoDBStorage", "SqliteStorage"]
+__all__ = [
+    "MemoryStorage", "MongoDBStorage", "SqliteStorage", "RedisStorage",
+    "CachedStorage",
+]
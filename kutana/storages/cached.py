@@ -0,0 +1,167 @@
+import copy
+import time
+from collections import OrderedDict
+from ..storage import Storage
+
+
+class CachedStorage(Storage):
+    """
+    Storage that caches values of other storage in memory.
+
+    Up to 'keys_limit' values (including absence of values) are cached
+    for 'ttl' seconds (or forever if 'ttl' is None). Least recently used
+    values are evicted first. Values are updated in cache on puts and
+    removed from cache on deletes.
+
+    Documents from cache can be outdated if storage is changed by
+    someone else, but puts of them will still fail because of
+    mismatched '_version' (and remove outdated values from cache).
+    """
+
+    def __init__(self, storage, keys_limit=100_000, ttl=60):
+        self.storage = storage
+        self.keys_limit = keys_limit
+        self.ttl = ttl
+
+        self._cache = OrderedDict()
+        self._loading = {}
+
+    async def init(self):
+        await self.storage.init()
+
+    @staticmethod
+    def _copy(values):
+        # Nested values can be changed by plugins without saving
+        return copy.deepcopy(values)
+
+    def _set(self, key, values):
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+
+        self._cache[key] = (self._copy(values), expires_at)
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.keys_limit:
+            self._cache.popitem(last=False)
+
+    def _invalidate(self, key):
+        self._cache.pop(key, None)
+
+        # Values that are being loaded can be outdated now
+        self._loading.pop(key, None)
+
+    def _get_cached(self, key):
+        """Return tuple (found, values) for key from cache."""
+
+        cached = self._cache.get(key)
+
+        if cached is not None:
+            values, expires_at = cached
+
+            if expires_at is None or expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                return True, self._copy(values)
+
+            del self._cache[key]
+
+        return False, None
+
+    async def _load(self, keys):
+        tokens = [object() for _ in keys]
+
+        for key, token in zip(keys, tokens):
+            self._loading[key] = token
+
+        try:
+            if len(keys) == 1:
+                values = [await self.storage._get(keys[0])]
+            else:
+                values = await self.storage._get_many(keys)
+        finally:
+            # Values are cached only if key wasn't changed while loading
+            actual = [self._loading.get(key) is token for key, token in zip(keys, tokens)]
+
+            for key, is_actual in zip(keys, actual):
+                if is_actual:
+                    del self._loading[key]
+
+        for key, key_values, is_actual in zip(keys, values, actual):
+            if is_actual:
+                self._set(key, key_values)
+
+        return values
+
+    async def _get(self, key):
+        found, values = self._get_cached(key)
+
+        if found:
+            return values
+
+        return (await self._load([key]))[0]
+
+    async def _get_many(self, keys):
+        results = {}
+        missing = []
+
+        for key in keys:
+            found, values = self._get_cached(key)
+
+            if found:
+                results[key] = values
+            elif key not in results:
+                results[key] = None
+                missing.append(key)
+
+        if missing:
+            results.update(zip(missing, await self._load(missing)))
+
+        return [results[key] for key in keys]
+
+    async def _put(self, key, values, version=None):
+        self._invalidate(key)
+
+        new_version = await self.storage._put(key, values, version=version)
+
+        self._invalidate(key)
+        self._set(key, {**values, "_version": new_version})
+
+        return new_version
+
+    async def _put_many(self, items):
+        for key, _, _ in items:
+            self._invalidate(key)
+
+        results = await self.storage._put_many(items)
+
+        for (key, values, _), result in zip(items, results):
+            self._invalidate(key)
+
+            if not isinstance(result, Exception):
+                self._set(key, {**values, "_version": result})
+
+        return results
+
+    async def _update_fields(self, key, values, increments):
+        self._invalidate(key)
+
+        new_values = await self.storage._update_fields(key, values, increments)
+
+        self._invalidate(key)
+        self._set(key, new_values)
+
+        return new_values
+
+    async def _delete(self, key):
+        self._invalidate(key)
+
+        await self.storage._delete(key)
+
+        self._invalidate(key)
+
+    async def _delete_many(self, keys):
+        for key in keys:
+            self._invalidate(key)
+
+        await self.storage._delete_many(keys)
+
+        for key in keys:
+            self._invalidate(key)
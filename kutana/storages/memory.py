@@ -1,44 +1,223 @@
-import random
+import time
+from collections import OrderedDict
 from ..storage import Storage, OptimisticLockException
 
 
+class _LRUPolicy:
+    """
+    Evicts least recently used key. Order of keys is kept in the
+    storage's ordered dict itself to save memory.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def add(self, key):
+        self._storage.move_to_end(key)
+
+    def touch(self, key):
+        self._storage.move_to_end(key)
+
+    def remove(self, key):
+        pass
+
+    def pop(self):
+        return next(iter(self._storage))
+
+
+class _TTLPolicy(_LRUPolicy):
+    """Evicts key that was saved least recently (and expires first)."""
+
+    def touch(self, key):
+        pass
+
+
+class _LFUPolicy:
+    """
+    Evicts least frequently used key. Keys with the same frequency are
+    evicted in order they reached this frequency.
+    """
+
+    def __init__(self, storage):
+        self._counts = {}
+        self._buckets = {}
+        self._min_count = 0
+
+    def _link(self, key, count):
+        self._counts[key] = count
+
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = OrderedDict()
+
+        bucket[key] = None
+
+    def _unlink(self, key):
+        count = self._counts.pop(key)
+
+        bucket = self._buckets[count]
+        del bucket[key]
+
+        if not bucket:
+            del self._buckets[count]
+
+        return count
+
+    def add(self, key):
+        if key in self._counts:
+            return self.touch(key)
+
+        self._link(key, 1)
+        self._min_count = 1
+
+    def touch(self, key):
+        count = self._unlink(key)
+
+        if self._min_count == count and count not in self._buckets:
+            self._min_count = count + 1
+
+        self._link(key, count + 1)
+
+    def remove(self, key):
+        if key in self._counts:
+            self._unlink(key)
+
+    def pop(self):
+        if self._min_count not in self._buckets:
+            # Happens after removals and evictions of keys
+            self._min_count = min(self._buckets)
+
+        key = next(iter(self._buckets[self._min_count]))
+        self._unlink(key)
+        return key
+
+
+EVICTION_POLICIES = {
+    "lru": _LRUPolicy,
+    "lfu": _LFUPolicy,
+    "ttl": _TTLPolicy,
+}
+
+
 class MemoryStorage(Storage):
     """
     Naive implementation of the storage that uses in-memory dict for
     storing data.
 
-    WARNING:
-        When keys count is equal or greater than 'keys_limit', 30% of the
-        stored keys will be cleared.
+    When keys count reaches 'keys_limit', keys are evicted one by one
+    according to 'eviction_policy':
+
+    - "lru" - least recently used key is evicted.
+    - "lfu" - least frequently used key is evicted.
+    - "ttl" - key that was saved least recently is evicted.
+
+    If 'ttl' is specified, keys expire after this amount of seconds
+    since they were saved.
+
+    If 'compact' is True, values are stored as tuples, and tuples of
+    field names are shared between documents with the same fields. This
+    greatly reduces memory usage, but values have to be copied to new
+    dict every time document is loaded.
     """
 
-    def __init__(self, keys_limit=1_000_000):
+    def __init__(self, keys_limit=1_000_000, eviction_policy="lru", ttl=None, compact=False):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction_policy}")
+
         self.keys_limit = keys_limit
-        self._storage = {}
+        self.eviction_policy = eviction_policy
+        self.ttl = ttl
+        self.compact = compact
+
+        self._storage = OrderedDict()
+        self._fields = {}
+        self._policy = EVICTION_POLICIES[eviction_policy](self._storage)
+        self._expires = OrderedDict()
+
+    def _pack(self, values, version):
+        if not self.compact:
+            return {**values, "_version": version}
+
+        fields = tuple(k for k in values if k != "_version")
+        fields = self._fields.setdefault(fields, fields)
+
+        return (fields, version, *(values[k] for k in fields))
+
+    def _unpack(self, entry):
+        if not self.compact:
+            return entry
+
+        return {**dict(zip(entry[0], entry[2:])), "_version": entry[1]}
+
+    def _get_version(self, entry):
+        if not self.compact:
+            return entry.get("_version")
+
+        return entry[1]
+
+    def _remove(self, key):
+        self._storage.pop(key, None)
+        self._policy.remove(key)
+        self._expires.pop(key, None)
+
+    def _remove_expired(self):
+        # All keys have the same ttl, so they are ordered by expiration
+        now = time.monotonic()
+
+        while self._expires:
+            key, expires_at = next(iter(self._expires.items()))
+
+            if expires_at > now:
+                break
+
+            self._remove(key)
 
     async def _put(self, key, values, version=None):
-        # handle keys overflow
-        if len(self._storage) >= self.keys_limit:
-            for key in random.sample(list(self._storage.keys()), k=int(self.keys_limit * 0.3)):
-                self._storage.pop(key)
+        if self.ttl is not None:
+            self._remove_expired()
+
+        entry = self._storage.get(key)
 
         # use optimistic locking
-        if version is None and key in self._storage:
+        if version is None and entry is not None:
             raise OptimisticLockException("Values for this key already exists")
 
-        if version is not None and key not in self._storage:
+        if version is not None and entry is None:
             raise OptimisticLockException("Values for this key was deleted")
 
-        if self._storage.get(key, {}).get("_version") != version:
+        if entry is not None and self._get_version(entry) != version:
             raise OptimisticLockException("Versions differ from expected value")
 
+        # handle keys overflow
+        if entry is None:
+            while self._storage and len(self._storage) >= self.keys_limit:
+                evicted_key = self._policy.pop()
+                self._storage.pop(evicted_key)
+                self._expires.pop(evicted_key, None)
+
         # update value
         new_version = (version or 0) + 1
-        self._storage[key] = {**values, "_version": new_version}
+        self._storage[key] = self._pack(values, new_version)
+        self._policy.add(key)
+
+        if self.ttl is not None:
+            self._expires[key] = time.monotonic() + self.ttl
+            self._expires.move_to_end(key)
+
         return new_version
 
     async def _get(self, key):
-        return self._storage.get(key, None)
+        if self.ttl is not None:
+            self._remove_expired()
+
+        entry = self._storage.get(key, None)
+
+        if entry is None:
+            return None
+
+        self._policy.touch(key)
+
+        return self._unpack(entry)
 
     async def _delete(self, key):
-        self._storage.pop(key, None)
+        self._remove(key)
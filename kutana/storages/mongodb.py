@@ -3,6 +3,9 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from ..storage import Storage, OptimisticLockException
 
 
+DUPLICATE_KEY_ERROR = 11000
+
+
 class MongoDBStorage(Storage):
     """
     Storage implementation of the storage that uses running MongoDB server.
@@ -38,8 +41,68 @@ class MongoDBStorage(Storage):
 
         return new_version
 
+    async def _put_many(self, items):
+        results = []
+        operations = []
+
+        for key, values, version in items:
+            new_version = (version or 0) + 1
+
+            results.append(new_version)
+            operations.append(pymongo.UpdateOne(
+                {"_key": key, "_version": version or 0},
+                {"$set": {
+                    **values,
+                    "_key": key,
+                    "_version": new_version,
+                }},
+                upsert=True
+            ))
+
+        if not operations:
+            return results
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if error["code"] != DUPLICATE_KEY_ERROR:
+                    raise
+
+                key = items[error["index"]][0]
+                results[error["index"]] = OptimisticLockException(
+                    f"Failed to set values for key {key} (mismatched version)"
+                )
+
+        return results
+
     async def _get(self, key):
         return await self.collection.find_one({"_key": key}, projection={"_key": 0, "_id": 0})
 
+    async def _get_many(self, keys):
+        found = {}
+
+        async for values in self.collection.find({"_key": {"$in": keys}}, projection={"_id": 0}):
+            found[values.pop("_key")] = values
+
+        return [found.get(key) for key in keys]
+
     async def _delete(self, key):
         await self.collection.delete_one({"_key": key})
+
+    async def _update_fields(self, key, values, increments):
+        update = {"$inc": {**increments, "_version": 1}}
+
+        if values:
+            update["$set"] = values
+
+        return await self.collection.find_one_and_update(
+            {"_key": key},
+            update,
+            projection={"_key": 0, "_id": 0},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+
+    async def _delete_many(self, keys):
+        await self.collection.delete_many({"_key": {"$in": keys}})
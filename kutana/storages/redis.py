@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+from urllib.parse import urlparse
+from .. import serializer
+from ..storage import Storage, OptimisticLockException
+
+
+# Sets values if stored version is equal to expected one (or key was
+# deleted after it was loaded, like other storages do).
+PUT_SCRIPT = """
+local version = redis.call('HGET', KEYS[1], 'ver')
+if version and version ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'val', ARGV[3], 'ver', ARGV[2])
+return 1
+"""
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """
+    Connection to the Redis server that can perform pipelined
+    commands.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    def _encode(command):
+        parts = [f"*{len(command)}\r\n".encode()]
+
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self.reader.readuntil(b"\r\n")
+        kind, data = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return data.decode("utf-8")
+
+        if kind == b"-":
+            return RedisError(data.decode("utf-8"))
+
+        if kind == b":":
+            return int(data)
+
+        if kind == b"$":
+            if data == b"-1":
+                return None
+            return (await self.reader.readexactly(int(data) + 2))[:-2].decode("utf-8")
+
+        if kind == b"*":
+            if data == b"-1":
+                return None
+            return [await self._read_reply() for _ in range(int(data))]
+
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    async def execute_many(self, commands):
+        """
+        Send commands in one batch and return list of replies. Errors
+        are returned as instances of :class:`RedisError`.
+        """
+
+        self.writer.write(b"".join(self._encode(command) for command in commands))
+
+        return [await self._read_reply() for _ in commands]
+
+    async def execute(self, *command):
+        reply, = await self.execute_many([command])
+
+        if isinstance(reply, RedisError):
+            raise reply
+
+        return reply
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisStorage(Storage):
+    """
+    Storage implementation of the storage that uses running Redis server.
+
+    Documents are stored in hashes with serialized values and versions.
+    Versions are checked by Lua script on the server. Up to 'pool_size'
+    connections are used at once, and operations with many keys are
+    pipelined.
+    """
+
+    def __init__(self, redis_uri="redis://localhost:6379/0", prefix="kutana:", pool_size=10):
+        uri = urlparse(redis_uri)
+
+        self._config = {
+            "host": uri.hostname or "localhost",
+            "port": uri.port or 6379,
+            "password": uri.password,
+            "db": int(uri.path.strip("/") or 0),
+        }
+
+        self.prefix = prefix
+        self.pool_size = pool_size
+
+        self._connections = []
+        self._pool_semaphore = None
+        self._put_script_sha = hashlib.sha1(PUT_SCRIPT.encode("utf-8")).hexdigest()
+
+    async def init(self):
+        self._pool_semaphore = asyncio.Semaphore(self.pool_size)
+
+        await self._execute_many([("PING",)])
+
+    async def _connect(self):
+        connection = RedisConnection(*await asyncio.open_connection(
+            self._config["host"], self._config["port"],
+        ))
+
+        if self._config["password"]:
+            await connection.execute("AUTH", self._config["password"])
+
+        if self._config["db"]:
+            await connection.execute("SELECT", self._config["db"])
+
+        return connection
+
+    async def _execute_many(self, commands):
+        async with self._pool_semaphore:
+            connection = self._connections.pop() if self._connections else await self._connect()
+
+            try:
+                replies = await connection.execute_many(commands)
+            except BaseException:
+                # State of connection is unknown now
+                connection.close()
+                raise
+
+            self._connections.append(connection)
+
+        for reply in replies:
+            if isinstance(reply, RedisError) and not reply.args[0].startswith("NOSCRIPT"):
+                raise reply
+
+        return replies
+
+    async def close(self):
+        while self._connections:
+            self._connections.pop().close()
+
+    async def _put_many(self, items):
+        results = []
+        commands = []
+
+        for key, values, version in items:
+            results.append((version or 0) + 1)
+            commands.append((
+                "EVALSHA", self._put_script_sha, 1, f"{self.prefix}{key}",
+                version or 0, (version or 0) + 1, serializer.dumps(values),
+            ))
+
+        if not commands:
+            return results
+
+        replies = await self._execute_many(commands)
+
+        # Script is not cached by the server yet
+        failed = [i for i, reply in enumerate(replies) if isinstance(reply, RedisError)]
+
+        if failed:
+            retried = await self._execute_many([
+                ("EVAL", PUT_SCRIPT, *commands[i][2:]) for i in failed
+            ])
+
+            for index, reply in zip(failed, retried):
+                replies[index] = reply
+
+        for index, ((key, _, _), reply) in enumerate(zip(items, replies)):
+            if not reply:
+                results[index] = OptimisticLockException(
+                    f"Failed to set values for key {key} (mismatched version)"
+                )
+
+        return results
+
+    async def _put(self, key, values, version=None):
+        result, = await self._put_many([(key, values, version)])
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    async def _get_many(self, keys):
+        replies = await self._execute_many([
+            ("HMGET", f"{self.prefix}{key}", "val", "ver") for key in keys
+        ])
+
+        return [
+            {**serializer.loads(value), "_version": int(version)} if value is not None else None
+            for value, version in replies
+        ]
+
+    async def _get(self, key):
+        values, = await self._get_many([key])
+        return values
+
+    async def _delete_many(self, keys):
+        if keys:
+            await self._execute_many([("DEL", *(f"{self.prefix}{key}" for key in keys))])
+
+    async def _delete(self, key):
+        await self._delete_many([key])
@@ -1,10 +1,16 @@
-import json
+import asyncio
 import sqlite3
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from .. import serializer
 from ..storage import Storage, OptimisticLockException
 
 
+# Maximum amount of variables in one query for old versions of sqlite
+MAX_VARIABLES = 999
+
+
 def dict_factory(cursor, row):
     d = {}
     for idx, col in enumerate(cursor.description):
@@ -15,16 +21,36 @@ def dict_factory(cursor, row):
 class SqliteStorage(Storage):
     """
     Storage implementation of the storage that uses sqlite3.
+
+    Queries are performed in the dedicated thread, so they don't block
+    the event loop.
+
+    If `group_commit_delay` is specified, puts performed during this
+    amount of seconds are saved in one transaction. Every put still
+    fails with :class:`kutana.storage.OptimisticLockException` on its
+    own if versions differ.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, group_commit_delay=None):
         self._path = path
         self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kutana-sqlite")
         self.connection = None
 
+        self.group_commit_delay = group_commit_delay
+        self._pending_puts = []
+        self._flush_task = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
     async def init(self):
+        await self._run(self._sync_init)
+
+    def _sync_init(self):
         self.connection = sqlite3.connect(self._path, check_same_thread=False)
         self.connection.row_factory = dict_factory
+        self.connection.execute("PRAGMA journal_mode=WAL")
 
         with self.cursor() as cur:
             cur.execute("""
@@ -44,36 +70,133 @@ class SqliteStorage(Storage):
                 yield self.connection.cursor()
 
     async def _put(self, key, values, version=None):
+        # Values are serialized here, so errors are raised only for
+        # the caller that caused them
+        dumped_values = serializer.dumps(values)
+
+        if not self.group_commit_delay:
+            return await self._run(self._sync_put, key, dumped_values, version)
+
+        future = asyncio.get_event_loop().create_future()
+
+        self._pending_puts.append((key, dumped_values, version, future))
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_puts())
+
+        return await future
+
+    async def _flush_puts(self):
+        await asyncio.sleep(self.group_commit_delay)
+
+        # Puts performed from now on will be saved in the next transaction
+        puts, self._pending_puts = self._pending_puts, []
+        self._flush_task = None
+
+        try:
+            results = await self._run(self._sync_put_many, [put[:3] for put in puts])
+        except Exception as e:
+            results = [e] * len(puts)
+
+        for (*_, future), result in zip(puts, results):
+            if future.done():
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _execute_put(self, cur, key, dumped_values, version):
         old_version = version or 0
         new_version = old_version + 1
-        dumped_values = json.dumps(values, ensure_ascii=False)
 
         try:
-            with self.cursor() as cur:
-                if version:
-                    cur.execute(
-                        "UPDATE kvs SET val = ?, ver = ? WHERE key = ? AND ver = ?",
-                        (dumped_values, new_version, key, old_version)
-                    )
-
-                if not version or cur.rowcount < 1:
-                    cur.execute(
-                        "INSERT INTO kvs (key, val, ver) VALUES (?, ?, ?)",
-                        (key, dumped_values, new_version)
-                    )
+            if version:
+                cur.execute(
+                    "UPDATE kvs SET val = ?, ver = ? WHERE key = ? AND ver = ?",
+                    (dumped_values, new_version, key, old_version)
+                )
+
+            if not version or cur.rowcount < 1:
+                cur.execute(
+                    "INSERT INTO kvs (key, val, ver) VALUES (?, ?, ?)",
+                    (key, dumped_values, new_version)
+                )
         except sqlite3.IntegrityError:
             raise OptimisticLockException(f"Failed to set values for key {key} (mismatched version)")
 
         return new_version
 
+    def _sync_put(self, key, dumped_values, version):
+        with self.cursor() as cur:
+            return self._execute_put(cur, key, dumped_values, version)
+
+    def _sync_put_many(self, puts):
+        """
+        Perform puts (with serialized values) in one transaction.
+        Failed statements don't affect
+        the transaction, so exceptions are returned for failed puts
+        instead of results.
+        """
+
+        results = []
+
+        with self.cursor() as cur:
+            for key, dumped_values, version in puts:
+                try:
+                    results.append(self._execute_put(cur, key, dumped_values, version))
+                except OptimisticLockException as e:
+                    results.append(e)
+
+        return results
+
+    async def _put_many(self, items):
+        return await self._run(self._sync_put_many, [
+            (key, serializer.dumps(values), version) for key, values, version in items
+        ])
+
     async def _get(self, key):
+        return await self._run(self._sync_get, key)
+
+    def _sync_get(self, key):
         with self.cursor() as cur:
             cur.execute("SELECT * FROM kvs WHERE key = ?", (key,))
             row = cur.fetchone()
             if row:
-                return {**json.loads(row["val"]), "_version": row["ver"]}
+                return {**serializer.loads(row["val"]), "_version": row["ver"]}
             return row
 
+    async def _get_many(self, keys):
+        return await self._run(self._sync_get_many, keys)
+
+    def _sync_get_many(self, keys):
+        found = {}
+
+        with self.cursor() as cur:
+            for i in range(0, len(keys), MAX_VARIABLES):
+                chunk = keys[i: i + MAX_VARIABLES]
+
+                cur.execute(
+                    f"SELECT * FROM kvs WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+
+                for row in cur.fetchall():
+                    found[row["key"]] = {**serializer.loads(row["val"]), "_version": row["ver"]}
+
+        return [found.get(key) for key in keys]
+
     async def _delete(self, key):
+        return await self._run(self._sync_delete, key)
+
+    def _sync_delete(self, key):
         with self.cursor() as cur:
             cur.execute("DELETE FROM kvs WHERE key = ?", (key,))
+
+    async def _delete_many(self, keys):
+        return await self._run(self._sync_delete_many, keys)
+
+    def _sync_delete_many(self, keys):
+        with self.cursor() as cur:
+            cur.executemany("DELETE FROM kvs WHERE key = ?", [(key,) for key in keys])
@@ -1,3 +1,4 @@
+import asyncio
 from collections import namedtuple
 from enum import Enum
 
@@ -27,6 +28,29 @@ ATTACHMENT_TYPES = (
 )
 
 
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class FileGetter:
+    """
+    Callable that downloads file of the attachment. Calling it returns
+    contents of the file, and :meth:`stream` returns async iterator of
+    file's chunks, so the whole file doesn't have to be kept in memory.
+    """
+
+    __slots__ = ("_read", "_stream")
+
+    def __init__(self, read, stream):
+        self._read = read
+        self._stream = stream
+
+    async def __call__(self):
+        return await self._read()
+
+    def stream(self, chunk_size=FILE_CHUNK_SIZE):
+        return self._stream(chunk_size)
+
+
 AttachmentData = namedtuple("AttachmentData", (
     "id",
     "type",
@@ -49,6 +73,11 @@ class Attachment(AttachmentData):
         Create a new attachment with provided type, file (contents) and
         file_name. Also accepts title.
 
+        File can be bytes, file object or async iterator of chunks
+        (for example, :meth:`iter_file` of other attachment). Async
+        iterators are streamed to the backend and can be uploaded only
+        once.
+
         :rtype: kutana.update.Attachment
         """
 
@@ -115,9 +144,72 @@ class Attachment(AttachmentData):
         """
 
         if self.file is not None:
+            if hasattr(self.file, "__aiter__"):
+                return b"".join([chunk async for chunk in self.file])
+
             return self.file
 
         if self.file_getter is not None:
             return await self.file_getter()
 
         raise ValueError("No way to get file from attachment")
+
+    async def iter_file(self, chunk_size=FILE_CHUNK_SIZE):
+        """
+        Iterate over chunks of file stored in attachment. Files are
+        streamed from backends if possible, and chunks of files in
+        memory are memoryviews of them, so files are not copied. Raises
+        ValueError if contents can't be downloaded.
+        """
+
+        if self.file is None:
+            stream = getattr(self.file_getter, "stream", None)
+
+            if stream is not None:
+                async for chunk in stream(chunk_size):
+                    yield chunk
+
+                return
+
+        if hasattr(self.file, "__aiter__"):
+            async for chunk in self.file:
+                yield chunk
+
+            return
+
+        file = await self.get_file()
+
+        if hasattr(file, "read"):
+            while True:
+                chunk = file.read(chunk_size)
+
+                if not chunk:
+                    break
+
+                yield chunk
+
+            return
+
+        view = memoryview(file)
+
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset: offset + chunk_size]
+
+    async def save_file(self, path, chunk_size=FILE_CHUNK_SIZE):
+        """
+        Write file stored in attachment to specified path chunk by
+        chunk. Raises ValueError if contents can't be downloaded.
+
+        File is opened and written in the default executor, so writes
+        don't block the event loop.
+        """
+
+        loop = asyncio.get_event_loop()
+
+        fh = await loop.run_in_executor(None, open, path, "wb")
+
+        try:
+            async for chunk in self.iter_file(chunk_size):
+                await loop.run_in_executor(None, fh.write, chunk)
+        finally:
+            await loop.run_in_executor(None, fh.close)
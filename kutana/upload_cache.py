@@ -0,0 +1,93 @@
+import hashlib
+from collections import OrderedDict
+from .storage import OptimisticLockException
+
+
+class UploadCache:
+    """
+    Cache of values describing uploaded attachments (like their IDs)
+    keyed by hashes of attachments' contents, so the same files are
+    not uploaded again.
+
+    Up to 'keys_limit' recently used values are kept in memory. If
+    'storage' is specified, values are also saved to it, so they are
+    kept between restarts and shared between processes. Storage can
+    be specified by its name in the application.
+
+    Uploads can be used only by the account that made them, so backends
+    should include account in the key's scope.
+    """
+
+    def __init__(self, keys_limit=10_000, storage=None, prefix="upload_cache:"):
+        self.keys_limit = keys_limit
+        self.storage = storage
+        self.prefix = prefix
+
+        self._cache = OrderedDict()
+
+    def resolve_storage(self, app):
+        if isinstance(self.storage, str):
+            self.storage = app.get_storage(self.storage)
+
+    @staticmethod
+    def get_key(attachment, scope=None):
+        """
+        Return key for the attachment, or None if attachment's file is
+        not loaded to memory and can't be hashed without consuming it.
+        Optional 'scope' separates uploads of the same files that can't
+        be used in place of each other.
+        """
+
+        if not isinstance(attachment.file, (bytes, bytearray, memoryview)):
+            return None
+
+        digest = hashlib.sha256(attachment.file).hexdigest()
+
+        key = f"{attachment.type}:{attachment.file_name}:{digest}"
+
+        return f"{scope}:{key}" if scope else key
+
+    def _set(self, key, values):
+        self._cache[key] = values
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.keys_limit:
+            self._cache.popitem(last=False)
+
+    async def get(self, key):
+        values = self._cache.get(key)
+
+        if values is not None:
+            self._cache.move_to_end(key)
+            return values
+
+        if self.storage is None:
+            return None
+
+        document = await self.storage.get(self.prefix + key)
+
+        if document is None:
+            return None
+
+        values = {k: v for k, v in document.values.items() if k != "_version"}
+        self._set(key, values)
+
+        return values
+
+    async def put(self, key, values):
+        self._set(key, values)
+
+        if self.storage is None:
+            return
+
+        try:
+            await self.storage.put(self.prefix + key, {**values, "_version": None})
+        except OptimisticLockException:
+            # Values for the same file were saved by someone else
+            pass
+
+    async def delete(self, key):
+        self._cache.pop(key, None)
+
+        if self.storage is not None:
+            await self.storage.delete(self.prefix + key)
@@ -0,0 +1,457 @@
+import asyncio
+import inspect
+import itertools
+import multiprocessing
+import pickle
+import signal
+import socket
+import struct
+import zlib
+from .backend import Backend
+from .context import Context
+from .exceptions import RequestException
+from .storages.memory import MemoryStorage
+from .update import Attachment
+from .logger import logger
+
+
+def get_shard(ctx, count, key=None):
+    """
+    Return index of the worker that should process update with
+    specified context. Updates with the same 'key' (or with the same
+    sender, or receiver if there is no sender, if 'key' is not
+    specified) are always processed by the same worker. Returns None
+    for updates without keys, so they can be processed by any worker.
+    """
+
+    key = key or ctx.sender_key or ctx.receiver_key
+
+    if not key:
+        return None
+
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def _strip(value):
+    """Remove unpicklable file getters from attachments in value."""
+
+    if isinstance(value, Attachment):
+        return value._replace(file_getter=None)
+
+    if isinstance(value, (list, tuple)) and not hasattr(value, "_fields"):
+        return type(value)(_strip(v) for v in value)
+
+    if isinstance(value, dict):
+        return {k: _strip(v) for k, v in value.items()}
+
+    return value
+
+
+def _pack_update(update):
+    """Prepare update for sending to worker process."""
+
+    if not getattr(update, "attachments", None):
+        return update
+
+    return update._replace(attachments=[
+        a._replace(file_getter=a.file_getter is not None)
+        for a in update.attachments
+    ])
+
+
+def _pack_exception(exc):
+    if isinstance(exc, RequestException):
+        exc = RequestException(None, exc.request, exc.response, exc.error)
+
+    try:
+        pickle.dumps(exc)
+    except Exception:
+        exc = RuntimeError(repr(exc))
+
+    return exc
+
+
+def _get_backend_state(backend):
+    """Return public attributes of backend that can be sent to workers."""
+
+    return {
+        k: v for k, v in vars(backend).items()
+        if not k.startswith("_") and isinstance(v, (str, int, float, bool, type(None)))
+    }
+
+
+class Channel:
+    """
+    Bidirectional channel for exchanging pickled messages between
+    processes over a socket.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._reader = None
+        self._writer = None
+
+    async def open(self):
+        self._reader, self._writer = await asyncio.open_connection(sock=self._sock)
+
+    def send(self, message):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        self._writer.write(struct.pack("!I", len(data)) + data)
+
+    async def receive(self):
+        size, = struct.unpack("!I", await self._reader.readexactly(4))
+        return pickle.loads(await self._reader.readexactly(size))
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+        else:
+            self._sock.close()
+
+
+class WorkerBackend(Backend):
+    """
+    Backend that is used in worker processes instead of actual backend.
+    Coroutine methods of the actual backend are called in the main
+    process (so limits of the backend are respected), other attributes
+    are taken from the worker's copy of the actual backend.
+    """
+
+    def __init__(self, worker, index, backend):
+        super().__init__(name=backend.name, active=backend.active)
+        self._worker = worker
+        self._index = index
+        self._backend = backend
+
+    def get_identity(self):
+        return self._backend.get_identity()
+
+    def prepare_context(self, ctx):
+        type(self._backend).prepare_context(self, ctx)
+
+    async def execute_send(self, target_id, message, attachments, kwargs):
+        return await self._worker.call(
+            self._index, "execute_send", (target_id, message, attachments, kwargs),
+        )
+
+    async def execute_request(self, method, kwargs):
+        return await self._worker.call(
+            self._index, "execute_request", (method, kwargs),
+        )
+
+    def __getattr__(self, name):
+        value = getattr(self._backend, name)
+
+        if not inspect.iscoroutinefunction(value):
+            return value
+
+        async def method(*args, **kwargs):
+            return await self._worker.call(self._index, name, args, kwargs)
+
+        return method
+
+
+class Worker:
+    """
+    Processes updates received from the main process with application's
+    plugins.
+    """
+
+    def __init__(self, app, channel):
+        self.app = app
+        self.channel = channel
+        self.backends = [
+            WorkerBackend(self, index, backend)
+            for index, backend in enumerate(app.get_backends())
+        ]
+
+        self._calls = {}
+        self._calls_counter = itertools.count()
+
+    async def call(self, backend_index, method, args=(), kwargs=None):
+        """Call backend's method in the main process and return result."""
+
+        call_id = next(self._calls_counter)
+
+        future = asyncio.get_event_loop().create_future()
+        self._calls[call_id] = future
+
+        self.channel.send(("call", call_id, backend_index, method, _strip(args), _strip(kwargs or {})))
+
+        try:
+            return await future
+        finally:
+            self._calls.pop(call_id, None)
+
+    def _make_getter(self, update_id, index):
+        async def getter():
+            return await self.call(None, "get_file", (update_id, index))
+        return getter
+
+    def _unpack_update(self, update_id, update):
+        if not getattr(update, "attachments", None):
+            return update
+
+        return update._replace(attachments=[
+            a._replace(file_getter=self._make_getter(update_id, i) if a.file_getter else None)
+            for i, a in enumerate(update.attachments)
+        ])
+
+    async def _handle_update(self, update_id, backend_index, update):
+        backend = self.backends[backend_index]
+        update = self._unpack_update(update_id, update)
+
+        ctx = await Context.create(
+            app=self.app,
+            config=self.app.config,
+            update=update,
+            backend=backend,
+        )
+
+        backend.prepare_context(ctx)
+
+        self.app._process_update(
+            update,
+            ctx,
+            lambda: self.channel.send(("done", update_id)),
+            lambda: self.channel.send(("release", update_id)),
+            lambda: self.call(None, "acquire", (update_id,)),
+        )
+
+    def _handle_message(self, message):
+        kind, *args = message
+
+        if kind == "update":
+            asyncio.ensure_future(self._handle_update(*args))
+
+        elif kind == "result":
+            call_id, success, value = args
+
+            future = self._calls.get(call_id)
+
+            if future is None or future.done():
+                return
+
+            if success:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        elif kind == "state":
+            index, state = args
+
+            for key, value in state.items():
+                setattr(self.backends[index]._backend, key, value)
+
+    async def run(self):
+        await self.channel.open()
+
+        await self.app._start_plugins()
+
+        while True:
+            try:
+                message = await self.channel.receive()
+            except asyncio.IncompleteReadError:
+                break
+
+            if message[0] == "stop":
+                break
+
+            self._handle_message(message)
+
+        await self.app._handle_event("shutdown")
+
+        self.channel.close()
+
+
+def _run_worker(app, sock, socks_to_close):  # pragma: no cover
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for other_sock in socks_to_close:
+        other_sock.close()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app._loop = loop
+
+    try:
+        loop.run_until_complete(Worker(app, Channel(sock)).run())
+    finally:
+        loop.close()
+
+
+class WorkersPool:
+    """
+    Starts worker processes and dispatches updates to them. Calls to
+    backends from workers are performed in the main process.
+
+    If worker process exits unexpectedly, slots of application's
+    semaphore taken by its updates are released and application is
+    stopped.
+    """
+
+    def __init__(self, app, count):
+        if count < 1:
+            raise ValueError("Workers count should be positive")
+
+        self.app = app
+        self.count = count
+
+        self._channels = []
+        self._processes = []
+        self._readers = []
+
+        self._pending = {}
+        self._channels_updates = {}
+        self._released = set()
+        self._updates_counter = itertools.count()
+        self._shards_counter = itertools.count()
+        self._stopping = False
+
+    def _spawn(self, sock, socks_to_close):  # pragma: no cover
+        process = multiprocessing.get_context("fork").Process(
+            target=_run_worker,
+            args=(self.app, sock, socks_to_close),
+            daemon=True,
+        )
+
+        process.start()
+
+        sock.close()
+
+        return process
+
+    def start(self):
+        """Start worker processes. Should be called before loop is running."""
+
+        for name, storage in self.app._storages.items():
+            if isinstance(storage, MemoryStorage):
+                logger.warning(
+                    f'Storage "{name}" is kept in memory of each worker, so '
+                    "workers will not share its documents! Use storage like "
+                    "SqliteStorage or RedisStorage with workers."
+                )
+
+        for _ in range(self.count):
+            sock, worker_sock = socket.socketpair()
+
+            self._channels.append(Channel(sock))
+
+            self._processes.append(self._spawn(
+                worker_sock,
+                [channel._sock for channel in self._channels],
+            ))
+
+    async def on_start(self):
+        for index, channel in enumerate(self._channels):
+            await channel.open()
+
+            for backend_index, backend in enumerate(self.app.get_backends()):
+                channel.send(("state", backend_index, _get_backend_state(backend)))
+
+            self._readers.append(asyncio.ensure_future(self._read(channel)))
+
+    def dispatch(self, update, backend, ctx):
+        """
+        Send update to the worker. Application's semaphore is released
+        when worker completes processing of the update.
+        """
+
+        update_id = next(self._updates_counter)
+
+        self._pending[update_id] = update
+
+        # Updates with the same ordering key should be ordered by one worker
+        shard = get_shard(ctx, self.count, self.app._get_ordering_key(ctx))
+
+        # Updates without keys are distributed evenly
+        if shard is None:
+            shard = next(self._shards_counter) % self.count
+
+        channel = self._channels[shard]
+
+        self._channels_updates.setdefault(channel, set()).add(update_id)
+
+        channel.send((
+            "update",
+            update_id,
+            self.app.get_backends().index(backend),
+            _pack_update(update),
+        ))
+
+    async def _read(self, channel):
+        while True:
+            try:
+                message = await channel.receive()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # Updates of the worker will never be completed
+                for update_id in self._channels_updates.pop(channel, ()):
+                    self._complete(update_id)
+
+                if not self._stopping:
+                    logger.error("Worker process exited unexpectedly, stopping application")
+                    self.app.stop()
+
+                return
+
+            kind, *args = message
+
+            if kind == "done":
+                self._channels_updates[channel].discard(args[0])
+                self._complete(args[0])
+
+            elif kind == "release":
+                # Update waits for previous updates with the same key
+                self._released.add(args[0])
+                self.app._sem.release()
+
+            elif kind == "call":
+                asyncio.ensure_future(self._perform_call(channel, *args))
+
+    def _complete(self, update_id):
+        self._pending.pop(update_id, None)
+
+        if update_id in self._released:
+            self._released.discard(update_id)
+        else:
+            self.app._sem.release()
+
+    async def _acquire(self, update_id):
+        await self.app._sem.acquire()
+
+        # Update could be completed while slot was acquired
+        if update_id in self._pending:
+            self._released.discard(update_id)
+        else:
+            self.app._sem.release()
+
+    async def _perform_call(self, channel, call_id, backend_index, method, args, kwargs):
+        try:
+            if backend_index is None and method == "acquire":
+                result = await self._acquire(*args)
+            elif backend_index is None:  # get_file
+                update_id, index = args
+                result = await self._pending[update_id].attachments[index].get_file()
+            else:
+                backend = self.app.get_backends()[backend_index]
+                result = await getattr(backend, method)(*args, **kwargs)
+        except Exception as exc:
+            channel.send(("result", call_id, False, _pack_exception(exc)))
+        else:
+            channel.send(("result", call_id, True, result))
+
+    async def stop(self):
+        self._stopping = True
+
+        for channel in self._channels:
+            if channel._writer is not None:
+                channel.send(("stop",))
+
+        for process in self._processes:
+            await asyncio.get_event_loop().run_in_executor(None, process.join, 10)
+
+        for reader in self._readers:
+            reader.cancel()
+
+        for channel in self._channels:
+            channel.close()
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+from kutana.storages.redis import PUT_SCRIPT
+
+
+def put_script(server, keys, args):
+    """Python implementation of kutana's PUT_SCRIPT."""
+
+    key, = keys
+    expected_version, new_version, value = args
+
+    stored = server.data.get(key)
+
+    if stored and stored[b"ver"] != expected_version:
+        return 0
+
+    server.data[key] = {b"val": value, b"ver": new_version}
+    return 1
+
+
+class FakeRedisServer:
+    """
+    In-process server that speaks Redis protocol and supports commands
+    used by kutana. Lua scripts are not interpreted: known scripts are
+    replaced with their python implementations.
+    """
+
+    scripts = {PUT_SCRIPT.encode("utf-8"): put_script}
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.loaded_scripts = {}
+        self.commands = []
+        self.connections = 0
+        self.batches = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @staticmethod
+    def _encode(reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Exception):
+            return b"-" + str(reply).encode() + b"\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, str):
+            return b"+" + reply.encode() + b"\r\n"
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(FakeRedisServer._encode(r) for r in reply)
+
+    async def _read_command(self, reader):
+        line = await reader.readuntil(b"\r\n")
+        assert line[:1] == b"*"
+
+        command = []
+
+        for _ in range(int(line[1:-2])):
+            size = int((await reader.readuntil(b"\r\n"))[1:-2])
+            command.append((await reader.readexactly(size + 2))[:-2])
+
+        return command
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        authorized = self.password is None
+
+        try:
+            while True:
+                command = await self._read_command(reader)
+                batch = [command]
+
+                # Commands that are already received are counted as one batch
+                while reader._buffer:
+                    batch.append(await self._read_command(reader))
+
+                self.batches.append(len(batch))
+
+                for command in batch:
+                    name = command[0].decode().upper()
+                    self.commands.append(name)
+
+                    if name == "AUTH":
+                        authorized = command[1].decode() == self.password
+                        reply = "OK" if authorized else Exception("WRONGPASS invalid password")
+                    elif not authorized:
+                        reply = Exception("NOAUTH Authentication required.")
+                    else:
+                        reply = self._execute(name, command[1:])
+
+                    writer.write(self._encode(reply))
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    def _execute(self, name, args):
+        if name in ("PING", "SELECT"):
+            return "PONG" if name == "PING" else "OK"
+
+        if name == "HMGET":
+            stored = self.data.get(args[0], {})
+            return [stored.get(field) for field in args[1:]]
+
+        if name == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+
+        if name == "EVAL":
+            script = args[0]
+            self.loaded_scripts[hashlib.sha1(script).hexdigest().encode()] = script
+        elif name == "EVALSHA":
+            script = self.loaded_scripts.get(args[0])
+            if script is None:
+                return Exception("NOSCRIPT No matching script. Please use EVAL.")
+        else:
+            return Exception(f"ERR unknown command '{name}'")
+
+        keys_count = int(args[1])
+        keys, script_args = args[2: 2 + keys_count], args[2 + keys_count:]
+
+        return self.scripts[script](self, keys, script_args)
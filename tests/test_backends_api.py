@@ -55,7 +55,6 @@ def test_tg_backend_api(mock):
         mock.return_value = "OK"
 
         tg = Telegram("token")
-        tg.api_messages_lock = asyncio.Lock()
 
         resp = await tg.request("method", arg1="val1")
         assert resp == "OK"
@@ -1,5 +1,11 @@
 import os
-from kutana.helpers import get_path, get_random_string, pick, pick_by, uniq_by
+import time
+import asyncio
+import pytest
+from kutana.helpers import (
+    get_path, get_random_string, pick, pick_by, uniq_by, VersionedDict,
+    TokenBucket,
+)
 
 
 def test_get_random_string():
@@ -29,3 +35,50 @@ def test_uniq_by():
     assert uniq_by([1, 2, 3, 1, 2, 3]) == [1, 2, 3]
     assert uniq_by([1, 2, 3, 4, 5], lambda v: v % 2) == [5, 4]
     assert uniq_by([1, 2, 3, 4, 5, 6], lambda v: v % 2) == [5, 6]
+
+
+def test_versioned_dict():
+    value = VersionedDict({"a": 1})
+    assert value.version == 0
+
+    value["b"] = 2
+    del value["b"]
+    value.update({"b": 2})
+    assert value.version == 3
+
+    value.setdefault("b", 3)
+    assert value.version == 3
+    value.setdefault("c", 3)
+    assert value.version == 4
+
+    assert value.pop("c") == 3
+    assert value.popitem() == ("b", 2)
+    value.clear()
+
+    assert value == {}
+    assert value.version == 7
+
+
+def test_token_bucket():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+    bucket = TokenBucket(100, capacity=2)
+
+    assert bucket.is_full()
+    assert bucket.reserve() == 0
+    assert not bucket.is_full()
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.01, abs=0.001)
+    assert bucket.reserve() == pytest.approx(0.02, abs=0.001)
+
+    async def test():
+        bucket = TokenBucket(50)
+
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+
+        assert time.monotonic() - start >= 0.09
+
+    asyncio.get_event_loop().run_until_complete(test())
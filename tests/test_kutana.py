@@ -1,6 +1,6 @@
 import asyncio
 import pytest
-from asynctest.mock import MagicMock, patch
+from asynctest.mock import CoroutineMock, MagicMock, patch
 from kutana import Kutana, Plugin
 from kutana.storage import OptimisticLockException
 from kutana.storages import MemoryStorage
@@ -104,6 +104,146 @@ def test_not_active_backend():
     asyncio.get_event_loop().run_until_complete(test())
 
 
+def test_backend_waits_for_queue_capacity():
+    app = Kutana()
+
+    backend = Debug([])
+    backend.acquire_updates = CoroutineMock()
+    app.add_backend(backend)
+
+    async def test():
+        queue = asyncio.Queue(maxsize=1)
+        await queue.put("update")
+
+        app._queue_capacity = asyncio.Condition()
+        await app._on_start(queue)
+
+        for _ in range(10):
+            await asyncio.sleep(0)
+        backend.acquire_updates.assert_not_awaited()
+
+        await queue.get()
+        async with app._queue_capacity:
+            app._queue_capacity.notify_all()
+
+        for _ in range(10):
+            await asyncio.sleep(0)
+        backend.acquire_updates.assert_awaited()
+
+        await app._shutdown()
+
+    app.get_loop().run_until_complete(test())
+
+
+def test_ordering():
+    app = Kutana(ordering="sender")
+
+    events = []
+
+    pl = Plugin("")
+
+    @pl.on_messages()
+    async def __(message, ctx):
+        events.append(("start", message.text))
+        await asyncio.sleep(0.01)
+        events.append(("end", message.text))
+
+        await ctx.reply(message.text)
+
+        if message.text == "2":
+            raise ValueError
+
+    app.add_plugin(pl)
+
+    debug = Debug(
+        messages=[("1", 1), ("2", 1), ("3", 2), ("4", 1)],
+        on_complete=app.stop,
+    )
+
+    app.add_backend(debug)
+
+    app.run()
+
+    # Updates from one sender are processed one by one
+    assert [e for e in events if e[1] != "3"] == [
+        ("start", "1"), ("end", "1"),
+        ("start", "2"), ("end", "2"),
+        ("start", "4"), ("end", "4"),
+    ]
+
+    # Updates from different senders are processed concurrently
+    assert events.index(("start", "3")) < events.index(("end", "1"))
+
+    # Only the slot for the next update is occupied
+    assert not app._ordered_queues
+    assert app._sem._value == app._concurrent_handlers_count - 1
+
+
+def run_saturated_key(**kwargs):
+    # Application's semaphore is bound to the default loop
+    previous_loop = asyncio.get_event_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    app = Kutana(loop=loop, concurrent_handlers_count=4, ordering="sender", **kwargs)
+
+    events = []
+
+    pl = Plugin("")
+
+    @pl.on_messages()
+    async def __(message, ctx):
+        events.append(message.text)
+
+        if message.sender_id == 1:
+            await asyncio.sleep(0.01)
+
+        await ctx.reply(message.text)
+
+    app.add_plugin(pl)
+
+    debug = Debug(
+        messages=[*((f"1-{i}", 1) for i in range(20)), ("2", 2)],
+        on_complete=app.stop,
+    )
+
+    app.add_backend(debug)
+
+    try:
+        app.run()
+    finally:
+        asyncio.set_event_loop(previous_loop)
+
+    # Updates of the sender are still processed in order
+    assert [e for e in events if e != "2"] == [f"1-{i}" for i in range(20)]
+
+    assert app._ordering_backlog == 0
+    assert app._sem._value == app._concurrent_handlers_count - 1
+
+    return events.index("2")
+
+
+def test_ordering_saturated_key():
+    # Waiting updates of one key don't occupy slots of other keys
+    assert run_saturated_key() <= 2
+
+    # Updates beyond backlog limit keep their slots
+    assert run_saturated_key(ordering_backlog_limit=0) > 10
+
+
+def test_ordering_keys():
+    ctx = MagicMock(sender_key="s", receiver_key="r")
+    no_sender_ctx = MagicMock(sender_key=None, receiver_key="r")
+
+    assert Kutana()._get_ordering_key(ctx) is None
+    assert Kutana(ordering="sender")._get_ordering_key(ctx) == "s"
+    assert Kutana(ordering="sender")._get_ordering_key(no_sender_ctx) == "r"
+    assert Kutana(ordering="receiver")._get_ordering_key(ctx) == "r"
+
+    with pytest.raises(ValueError):
+        Kutana(ordering="chat")
+
+
 def test_get_backend():
     app = Kutana()
     app.add_backend(Debug([], name="backend1"))
@@ -3,6 +3,9 @@ import pytest
 from kutana import (
     Plugin, Message, Update, UpdateType, Attachment, HandlerResponse as hr,
 )
+from kutana import Context
+from kutana.handler import Handler
+from kutana.helpers import VersionedDict
 from testing_tools import sync, make_kutana_no_run
 
 
@@ -237,6 +240,161 @@ def test_command_full_body():
     assert debug.answers[1][0] == ("abc\nabc\nabc", (), {})
 
 
+def test_commands_longest_wins():
+    app, debug, hu = make_kutana_no_run()
+
+    pl = Plugin("")
+
+    @pl.on_commands(["say", "say hello", "sayhello"])
+    async def __(msg, ctx):
+        await ctx.reply(f"{ctx.prefix}|{ctx.command}|{ctx.body}|{ctx.match.group(0)}")
+
+    app.add_plugin(pl)
+
+    hu(Message(None, UpdateType.MSG, ".say hello world", (), 1, 0, 0, 0, {}))
+    hu(Message(None, UpdateType.MSG, ".SAY HELLOworld", (), 1, 0, 0, 0, {}))
+    hu(Message(None, UpdateType.MSG, ".SayHello", (), 1, 0, 0, 0, {}))
+
+    assert debug.answers[1][0] == (".|say hello|world|.say hello world", (), {})
+    assert debug.answers[1][1] == (".|SAY|HELLOworld|.SAY HELLOworld", (), {})
+    assert debug.answers[1][2] == (".|SayHello||.SayHello", (), {})
+
+
+def test_commands_many():
+    app, debug, hu = make_kutana_no_run()
+
+    pl = Plugin("")
+
+    async def handler(msg, ctx):
+        await ctx.reply(ctx.command)
+
+    pl.on_commands([f"command{i}" for i in range(5000)])(handler)
+    pl.on_commands(["Привет", "İstanbul"])(handler)
+
+    app.add_plugin(pl)
+
+    hu(Message(None, UpdateType.MSG, ".command4999", (), 1, 0, 0, 0, {}))
+    hu(Message(None, UpdateType.MSG, ".command5000", (), 1, 0, 0, 0, {}))
+    hu(Message(None, UpdateType.MSG, ".ПРИВЕТ", (), 1, 0, 0, 0, {}))
+    hu(Message(None, UpdateType.MSG, ".İSTANBUL", (), 1, 0, 0, 0, {}))
+
+    assert debug.answers[1] == [
+        ("command4999", (), {}), ("ПРИВЕТ", (), {}), ("İSTANBUL", (), {}),
+    ]
+
+
+def test_commands_when_mentioned():
+    app, debug, hu = make_kutana_no_run()
+
+    pl = Plugin("")
+
+    @pl.on_commands(["echo"])
+    async def __(msg, ctx):
+        await ctx.reply(ctx.body)
+
+    app.add_plugin(pl)
+
+    meta = {"bot_mentioned": True}
+
+    hu(Message(None, UpdateType.MSG, "echo 1", (), 1, 0, 0, 0, meta))
+    hu(Message(None, UpdateType.MSG, " . echo 2", (), 1, 0, 0, 0, meta))
+    hu(Message(None, UpdateType.MSG, "hey echo 3", (), 1, 0, 0, 0, meta))
+
+    assert debug.answers[1] == [("1", (), {}), ("2", (), {})]
+
+
+def test_commands_changes_at_runtime():
+    app, debug, hu = make_kutana_no_run()
+
+    config = VersionedDict({
+        "prefixes": (".",),
+        "mention_prefix": ("",),
+        "ignore_initial_spaces": True,
+    })
+
+    def handle(text):
+        ctx = sync(Context.create(app=app, config=config, update=Message(
+            None, UpdateType.MSG, text, (), 1, 0, 0, 0, {},
+        ), backend=debug))
+
+        return sync(app._handle_update(ctx.update, ctx))
+
+    pl = Plugin("")
+
+    async def handler(msg, ctx):
+        await ctx.reply(ctx.command)
+
+    pl.on_commands(["echo"])(handler)
+
+    app.add_plugin(pl)
+
+    assert handle(".echo") == hr.COMPLETE
+    assert handle("!echo") == hr.SKIPPED
+
+    # Change prefixes
+    config["prefixes"] = ("!",)
+
+    assert handle(".echo") == hr.SKIPPED
+    assert handle("!echo") == hr.COMPLETE
+
+    # Add and remove commands
+    router = app._routers[0]
+
+    router.add_handler(Handler(handler, 0), "ping")
+    assert handle("!ping") == hr.COMPLETE
+
+    router.remove_handler(Handler(handler, 0), "ping")
+    assert handle("!ping") == hr.SKIPPED
+
+    router.remove_handler(Handler(handler, 0), "pong")
+    assert handle("!echo") == hr.COMPLETE
+
+    assert debug.answers[1] == [("echo", (), {}), ("echo", (), {}), ("ping", (), {}), ("echo", (), {})]
+
+
+def test_plugins_changes_at_runtime():
+    app, debug, hu = make_kutana_no_run()
+
+    pl1 = Plugin("")
+
+    @pl1.on_commands(["echo"])
+    async def __(msg, ctx):
+        await ctx.reply("pl1")
+
+    pl2 = Plugin("")
+
+    @pl2.on_commands(["echo", "ping"])
+    async def __(msg, ctx):
+        await ctx.reply("pl2")
+
+    @pl2.on_updates()
+    async def __(upd, ctx):
+        await ctx.reply("pl2")
+
+    app.add_plugin(pl1)
+
+    assert hu(Message(None, UpdateType.MSG, ".ping", (), 1, 0, 0, 0, {})) == hr.SKIPPED
+
+    app.add_plugin(pl2)
+    assert pl2.app is app
+
+    assert hu(Message(None, UpdateType.MSG, ".ping", (), 1, 0, 0, 0, {})) == hr.COMPLETE
+
+    app.remove_plugin(pl1)
+
+    assert hu(Message(None, UpdateType.MSG, ".echo", (), 1, 0, 0, 0, {})) == hr.COMPLETE
+
+    app.remove_plugin(pl2)
+
+    assert hu(Message(None, UpdateType.MSG, ".echo", (), 1, 0, 0, 0, {})) == hr.SKIPPED
+    assert pl1._routers[0]._handlers.keys() == {"echo"}
+
+    with pytest.raises(RuntimeError):
+        app.remove_plugin(pl2)
+
+    assert debug.answers[1] == [("pl2", (), {}), ("pl2", (), {})]
+
+
 def test_attachments():
     app, debug, hu = make_kutana_no_run()
 
@@ -1,8 +1,16 @@
+import re
 import pytest
+from kutana import Context, Message, Update, UpdateType, HandlerResponse as hr
 from kutana.handler import Handler
 from kutana.router import ListRouter, MapRouter
-from kutana.routers import AnyMessageRouter
-from kutana.backends.vkontakte.extensions import PayloadRouter
+from kutana.routers import (
+    AnyMessageRouter, AnyUpdateRouter, AttachmentsRouter, CommandsRouter,
+    CommandMatch, PatternsRouter,
+)
+from kutana.backends.vkontakte.extensions import (
+    ActionMessageRouter, CallbackPayloadRouter, PayloadRouter,
+)
+from testing_tools import make_kutana_no_run, sync
 
 
 def test_exception_on_wrong_merge():
@@ -120,3 +128,214 @@ def test_router_merge_priority():
     ]))
 
     assert handlers == [1, 2, 6, 4, 5, 3]
+
+
+def test_router_can_handle():
+    assert ListRouter().can_handle(UpdateType.MSG, "debug")
+    assert ListRouter().can_handle(UpdateType.UPD, "debug")
+
+    assert CommandsRouter().can_handle(UpdateType.MSG, "debug")
+    assert not CommandsRouter().can_handle(UpdateType.UPD, "debug")
+    assert not AnyMessageRouter().can_handle(UpdateType.UPD, "debug")
+    assert not AnyUpdateRouter().can_handle(UpdateType.MSG, "debug")
+
+    assert PayloadRouter().can_handle(UpdateType.MSG, "vkontakte")
+    assert not PayloadRouter().can_handle(UpdateType.MSG, "debug")
+    assert not PayloadRouter().can_handle(UpdateType.UPD, "vkontakte")
+    assert CallbackPayloadRouter().can_handle(UpdateType.UPD, "vkontakte")
+    assert not CallbackPayloadRouter().can_handle(UpdateType.MSG, "vkontakte")
+    assert not ActionMessageRouter().can_handle(UpdateType.MSG, "telegram")
+
+
+def test_routers_skip_unsupported_updates():
+    app, debug, _ = make_kutana_no_run()
+
+    message = Message({}, UpdateType.MSG, "hey", (), 1, 0, 0, 0, {})
+    update = Update({}, UpdateType.UPD, {})
+
+    ctx = sync(Context.create(app=app, config={}, update=message, backend=debug))
+
+    routers = [
+        (CommandsRouter(), update), (AttachmentsRouter(), update),
+        (AnyMessageRouter(), update), (AnyUpdateRouter(), message),
+        (PayloadRouter(), message), (CallbackPayloadRouter(), update),
+        (ActionMessageRouter(), message),
+    ]
+
+    for router, upd in routers:
+        if isinstance(router, MapRouter):
+            router.add_handler(Handler(None, 0), "key")
+        else:
+            router.add_handler(Handler(None, 0))
+
+        assert sync(router.handle(upd, ctx)) == hr.SKIPPED
+
+    debug.get_identity = lambda: "vkontakte"
+
+    router = CallbackPayloadRouter()
+    router.add_handler(Handler(None, 0), "key")
+    assert sync(router.handle(Update({"type": "other"}, UpdateType.UPD, {}), ctx)) == hr.SKIPPED
+
+
+def test_routers_plan():
+    app, debug, _ = make_kutana_no_run(backend_source="telegram")
+
+    app._routers = [
+        CommandsRouter(), AnyUpdateRouter(), PayloadRouter(), ListRouter(),
+    ]
+    app._routers_plans = {}
+
+    assert app._get_routers_plan(UpdateType.MSG, "telegram") == (
+        app._routers[0], app._routers[3],
+    )
+    assert app._get_routers_plan(UpdateType.UPD, "vkontakte") == (
+        app._routers[1], app._routers[3],
+    )
+    assert app._get_routers_plan(UpdateType.MSG, "telegram") is app._routers_plans[(UpdateType.MSG, "telegram")]
+
+
+def test_command_match():
+    match = CommandMatch(" .echo  hey", ((0, 11), (1, 2), (2, 6), (7, 11)))
+
+    assert match.group() == " .echo  hey"
+    assert match.group(1, 2) == (".", "echo")
+    assert match.groups() == (".", "echo", " hey")
+    assert match[2] == "echo"
+    assert match.span(2) == (2, 6)
+    assert match.start(1) == 1
+    assert match.end() == 11
+
+    match = CommandMatch(".echo", ((0, 5), (0, 1), (1, 5), None))
+    assert match.groups() == (".", "echo", None)
+
+
+def test_remove_handlers():
+    lr = ListRouter()
+    lr.add_handler(Handler(1, 0))
+    lr.add_handler(Handler(2, 0))
+    lr.remove_handler(Handler(1, 0))
+    lr.remove_handler(Handler(3, 0))
+    assert list(lr._handlers) == [Handler(2, 0)]
+
+    mr = MapRouter()
+    mr.add_handler(Handler(1, 0), "a")
+    mr.add_handler(Handler(2, 0), "a")
+    mr.remove_handler(Handler(1, 0), "a")
+    mr.remove_handler(Handler(1, 0), "b")
+    assert list(mr._handlers["a"]) == [Handler(2, 0)]
+    mr.remove_handler(Handler(2, 0), "a")
+    assert "a" not in mr._handlers
+
+    pr = PayloadRouter()
+    pr.add_handler(Handler(1, 0), {"a": 1})
+    pr.remove_handler(Handler(1, 0), {"a": 1})
+    assert not pr._handlers
+
+    ar = ActionMessageRouter()
+    ar.add_handler(Handler(1, 0), "Chat_Kick_User")
+    ar.remove_handler(Handler(1, 0), "chat_kick_user")
+    assert not ar._handlers
+
+
+def test_unmerge_routers():
+    lr1, lr2 = ListRouter(), ListRouter()
+    lr1.add_handler(Handler(1, 0))
+    lr2.add_handler(Handler(2, 0))
+    lr1.merge(lr2)
+    lr1.unmerge(lr2)
+    assert list(lr1._handlers) == [Handler(1, 0)]
+
+    mr1, mr2 = MapRouter(), MapRouter()
+    mr1.add_handler(Handler(1, 0), "a")
+    mr2.add_handler(Handler(2, 0), "a")
+    mr2.add_handler(Handler(3, 0), "b")
+    mr1.merge(mr2)
+    mr1.unmerge(mr2)
+    assert list(mr1._handlers) == ["a"]
+
+    with pytest.raises(RuntimeError):
+        mr1.unmerge(lr1)
+
+
+def test_list_router():
+    app, debug, _ = make_kutana_no_run()
+
+    async def handler(update, ctx):
+        return hr.SKIPPED if update.text == "skip" else None
+
+    lr = ListRouter()
+    lr.add_handler(Handler(handler, 0))
+
+    for text, result in (("skip", hr.SKIPPED), ("hey", hr.COMPLETE)):
+        message = Message({}, UpdateType.MSG, text, (), 1, 0, 0, 0, {})
+        ctx = sync(Context.create(app=app, config={}, update=message, backend=debug))
+        assert sync(lr.handle(message, ctx)) == result
+
+
+def test_patterns_router_literal_prefix():
+    def prefix(pattern, flags=0):
+        return PatternsRouter._get_literal_prefix(re.compile(pattern, flags))
+
+    assert prefix(r"hello\s+world") == "hello"
+    assert prefix(r"hello world") == "hello world"
+    assert prefix(r"hellos?") == "hello"
+    assert prefix(r"hellos*") == "hello"
+    assert prefix(r"hellos{0,1}") == "hello"
+    assert prefix(r"(hello)") == ""
+    assert prefix(r"hello|world") == ""
+    assert prefix(r"hello", re.IGNORECASE) == ""
+    assert prefix(r"(?i)hello") == ""
+    assert prefix(r"h?") == ""
+
+
+def test_patterns_router():
+    app, debug, _ = make_kutana_no_run()
+
+    called = []
+
+    def make_handler(name, result=None):
+        async def handler(update, ctx):
+            called.append((name, ctx.match.group(0)))
+            return result
+        return handler
+
+    pr1 = PatternsRouter()
+    pr1.add_handler(Handler(make_handler("digits"), 0), r"\d+")
+    pr1.add_handler(Handler(make_handler("hello", hr.SKIPPED), 1), r"hello")
+
+    pr2 = PatternsRouter()
+    pr2.add_handler(Handler(make_handler("hey"), 0), re.compile("hey"))
+    pr2.add_handler(Handler(make_handler("hello world"), 0), r"hello world")
+
+    pr1.merge(pr2)
+
+    def handle(router, text):
+        message = Message({}, UpdateType.MSG, text, (), 1, 0, 0, 0, {})
+        ctx = sync(Context.create(app=app, config={}, update=message, backend=debug))
+        return sync(router.handle(message, ctx))
+
+    assert handle(pr1, "hello world") == hr.COMPLETE
+    assert handle(pr1, "123") == hr.COMPLETE
+    assert handle(pr1, "hey") == hr.COMPLETE
+    assert handle(pr1, "bruh") == hr.SKIPPED
+    assert handle(pr1, "") == hr.SKIPPED
+
+    assert called == [
+        ("hello", "hello"), ("hello world", "hello world"),
+        ("digits", "123"), ("hey", "hey"),
+    ]
+
+    update = Update({}, UpdateType.UPD, {})
+    assert sync(pr1.handle(update, None)) == hr.SKIPPED
+
+    pr1.unmerge(pr2)
+    assert handle(pr1, "hey") == hr.SKIPPED
+
+    pr1.remove_handler(Handler(called.append, 0), r"\d+")
+    assert handle(pr1, "123") == hr.COMPLETE
+
+    pr1.remove_handler(pr1._handlers[-1][0], r"\d+")
+    assert handle(pr1, "123") == hr.SKIPPED
+
+    with pytest.raises(RuntimeError):
+        pr1.unmerge(ListRouter())
@@ -0,0 +1,57 @@
+import pytest
+from kutana import serializer
+
+
+@pytest.mark.parametrize("name", list(serializer.LIBRARIES))
+def test_serializer(name):
+    pytest.importorskip(name)
+
+    default = serializer.library
+
+    try:
+        assert serializer.use(name) == name
+
+        assert serializer.loads(serializer.dumps({"text": "привет", 1: [None]})) == {"text": "привет", "1": [None]}
+        assert serializer.loads('{"a": [1, "б"]}') == {"a": [1, "б"]}
+        assert serializer.loads(b'{"a": 1}') == {"a": 1}
+        assert isinstance(serializer.dumps({}), str)
+
+        with pytest.raises(serializer.JSONDecodeError):
+            serializer.loads("")
+
+        with pytest.raises(ValueError):
+            serializer.loads("{")
+    finally:
+        serializer.use(default)
+
+
+def test_serializer_json():
+    default = serializer.library
+
+    try:
+        assert serializer.use("json") == "json"
+        assert serializer.dumps({"text": "привет", 1: [None]}) == '{"text": "привет", "1": [null]}'
+    finally:
+        serializer.use(default)
+
+
+def test_serializer_use(monkeypatch):
+    default = serializer.library
+
+    def _load_missing():
+        raise ModuleNotFoundError("No module named 'missing'")
+
+    monkeypatch.setattr(serializer, "LIBRARIES", {"missing": _load_missing, **serializer.LIBRARIES})
+
+    try:
+        with pytest.raises(ValueError):
+            serializer.use("pickle")
+
+        with pytest.raises(ModuleNotFoundError):
+            serializer.use("missing")
+
+        assert serializer.use() == default
+    finally:
+        serializer.use(default)
+
+    assert serializer.loads(serializer.dumps({"a": "б"})) == {"a": "б"}
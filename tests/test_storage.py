@@ -80,6 +80,9 @@ def test_storage_exceptions():
         with pytest.raises(ValueError):
             await storage.put('123', {})
 
+        with pytest.raises(ValueError):
+            await storage.put_many([('123', {})])
+
     asyncio.get_event_loop().run_until_complete(test())
 
 
@@ -113,6 +116,279 @@ def test_memory_storage_limit():
         for i in range(20):
             await storage.make_document({}, i + 1).save()
 
-        assert len(storage._storage) == 8
+        assert list(storage._storage) == list(range(11, 21))
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_memory_storage_unknown_policy():
+    with pytest.raises(ValueError):
+        MemoryStorage(eviction_policy="random")
+
+
+def test_memory_storage_lru():
+    storage = MemoryStorage(3)
+
+    async def test():
+        for key in "abc":
+            await storage.make_document({}, key).save()
+
+        assert await storage.get("a")
+        await storage.make_document({}, "d").save()
+        assert sorted(storage._storage) == ["a", "c", "d"]
+
+        # Updates are uses too
+        await (await storage.get("c")).save()
+        await storage.make_document({}, "e").save()
+        assert sorted(storage._storage) == ["c", "d", "e"]
+
+        await storage.delete("d")
+        await storage.make_document({}, "f").save()
+        await storage.make_document({}, "g").save()
+        assert sorted(storage._storage) == ["e", "f", "g"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_memory_storage_lfu():
+    storage = MemoryStorage(3, eviction_policy="lfu")
+
+    async def test():
+        for key in "abc":
+            await storage.make_document({}, key).save()
+
+        for key in "aab":
+            assert await storage.get(key)
+
+        await storage.make_document({}, "d").save()
+        assert sorted(storage._storage) == ["a", "b", "d"]
+
+        await storage.make_document({}, "e").save()
+        assert sorted(storage._storage) == ["a", "b", "e"]
+
+        # Frequencies are counted for stored keys only
+        await storage.delete("a")
+        await storage.delete("e")
+        assert await storage.get("a") is None
+
+        await storage.make_document({}, "f").save()
+        await storage.make_document({}, "g").save()
+        await storage.make_document({}, "h").save()
+        assert sorted(storage._storage) == ["b", "g", "h"]
+
+        # Saves are uses too
+        await (await storage.get("h")).save()
+        await (await storage.get("h")).save()
+        await (await storage.get("g")).save()
+        await storage.make_document({}, "i").save()
+        assert sorted(storage._storage) == ["g", "h", "i"]
+
+        # Several keys are evicted if limit was lowered
+        storage.keys_limit = 1
+        await storage.make_document({}, "j").save()
+        assert sorted(storage._storage) == ["j"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_memory_storage_ttl():
+    storage = MemoryStorage(3, eviction_policy="ttl", ttl=0.05)
+
+    async def test():
+        for key in "abc":
+            await storage.make_document({}, key).save()
+
+        # Reads don't prevent eviction
+        assert await storage.get("a")
+        await storage.make_document({}, "d").save()
+        assert sorted(storage._storage) == ["b", "c", "d"]
+
+        await asyncio.sleep(0.03)
+        await (await storage.get("b")).save()
+
+        await asyncio.sleep(0.03)
+        assert await storage.get("c") is None
+        assert await storage.get("b")
+        assert sorted(storage._storage) == ["b"]
+
+        await asyncio.sleep(0.05)
+        await storage.make_document({}, "e").save()
+        assert sorted(storage._storage) == ["e"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_memory_storage_compact():
+    storage = MemoryStorage(compact=True)
+
+    async def test():
+        doc_1 = await storage.make_document({"state": "", "count": 1}, "key1").save()
+        doc_2 = await storage.make_document({"state": "a", "count": 2}, "key2").save()
+
+        assert storage._storage["key1"][0] is storage._storage["key2"][0]
+
+        assert (await storage.get("key1")).values == {"state": "", "count": 1, "_version": 1}
+        assert (await storage.get("key2")).values == {"state": "a", "count": 2, "_version": 1}
+
+        doc_1["state"] = "b"
+        await doc_1.save()
+        assert (await storage.get("key1")).values == {"state": "b", "count": 1, "_version": 2}
+
+        await (await storage.get("key2")).update({}, remove=["count"])
+
+        with pytest.raises(OptimisticLockException):
+            await doc_2.save()
+
+        assert (await storage.get("key2")).values == {"state": "a", "_version": 2}
+        assert await storage.get("key3") is None
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_storage_many():
+    storage = MemoryStorage()
+
+    async def test():
+        assert await storage.put_many([
+            ("key1", {"val": 1, "_version": None}),
+            ("key2", {"val": 2, "_version": None}),
+        ]) == [1, 1]
+
+        docs = await storage.get_many(iter(["key1", "key3", "key2"]))
+        assert docs[0].values == {"val": 1, "_version": 1}
+        assert docs[1] is None
+        assert docs[2].values == {"val": 2, "_version": 1}
+
+        results = await storage.put_many([
+            ("key1", docs[0].values),
+            ("key2", {"val": 3, "_version": None}),
+        ])
+        assert results[0] == 2
+        assert isinstance(results[1], OptimisticLockException)
+
+        await storage.delete_many(["key1", "key2"])
+        assert await storage.get_many(["key1", "key2"]) == [None, None]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_storage_get_coalescing():
+    calls = []
+
+    class SlowMemoryStorage(MemoryStorage):
+        async def _get(self, key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            if key == "fail":
+                raise RuntimeError
+            return await super()._get(key)
+
+    storage = SlowMemoryStorage()
+
+    async def test():
+        await storage.make_document({"val": 1}, "key").save()
+
+        docs = await asyncio.gather(*(storage.get("key") for _ in range(5)), storage.get("other"))
+        assert calls == ["key", "other"]
+
+        assert all(doc.values == {"val": 1, "_version": 1} for doc in docs[:5])
+        assert len({id(doc.values) for doc in docs[:5]}) == 5
+        assert docs[5] is None
+
+        # Cancellation of one call doesn't affect others
+        first = asyncio.ensure_future(storage.get("key"))
+        second = asyncio.ensure_future(storage.get("key"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert (await second).values == {"val": 1, "_version": 1}
+
+        # Unsaved changes of one caller are not visible to others
+        await storage.make_document({"items": []}, "nested").save()
+
+        async def change():
+            doc = await storage.get("nested")
+            doc["items"].append("uncommitted")
+            doc["state"] = "uncommitted"
+            return doc
+
+        async def read():
+            await asyncio.sleep(0)
+            return await storage.get("nested")
+
+        changed, read_doc = await asyncio.gather(change(), read())
+        assert changed["items"] == ["uncommitted"]
+        assert read_doc.values == {"items": [], "_version": 1}
+        assert (await storage.get("nested")).values == {"items": [], "_version": 1}
+
+        results = await asyncio.gather(
+            storage.get("fail"), storage.get("fail"), return_exceptions=True,
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        assert not storage._pending_gets
+        assert len(calls) == 6
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_document_atomic():
+    storage = MemoryStorage()
+
+    async def test():
+        doc = await storage.make_document({"count": 0}, "key").save()
+        other = await storage.get("key")
+
+        await other.update({"count": 10})
+
+        mutations = []
+
+        def increment(document):
+            mutations.append(document["count"])
+            document["count"] += 1
+
+        await doc.atomic(increment)
+        assert mutations == [0, 10]
+        assert (await storage.get("key")).values == {"count": 11, "_version": 3}
+
+        async def async_increment(document):
+            document["count"] += 1
+
+        await doc.atomic(async_increment)
+        assert doc.values == {"count": 12, "_version": 4}
+
+        async def conflicting_increment(document):
+            await storage._put("key", {"count": 0}, version=document.version)
+            document["count"] += 1
+
+        with pytest.raises(OptimisticLockException):
+            await doc.atomic(conflicting_increment, attempts=3, backoff=0.001)
+
+        assert doc.version == 6
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_storage_atomic_and_update_fields():
+    storage = MemoryStorage()
+
+    async def test():
+        def increment(document):
+            document["count"] += 1
+
+        doc = await storage.atomic("key", increment, default={"count": 0})
+        assert doc.values == {"count": 1, "_version": 1}
+
+        doc = await storage.atomic("key", increment, default={"count": 0})
+        assert doc.values == {"count": 2, "_version": 2}
+
+        await asyncio.gather(*(
+            storage.update_fields("counter", increments={"count": 1})
+            for _ in range(10)
+        ))
+
+        doc = await storage.update_fields("counter", values={"name": "c"}, increments={"count": 5})
+        assert doc.values == {"count": 15, "name": "c", "_version": 11}
+        assert doc.storage is storage
+        assert (await storage.get("counter")).values == doc.values
 
     asyncio.get_event_loop().run_until_complete(test())
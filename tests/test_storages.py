@@ -1,10 +1,14 @@
 import asyncio
 import functools
+import sqlite3
+import threading
 import pytest
 import pymongo
 from asynctest.mock import CoroutineMock, Mock, patch
 from kutana.storage import OptimisticLockException
-from kutana.storages import MongoDBStorage, SqliteStorage
+from kutana.storages import CachedStorage, MemoryStorage, MongoDBStorage, SqliteStorage, RedisStorage
+from kutana.storages.redis import RedisConnection, RedisError
+from fake_redis import FakeRedisServer
 
 
 # --- Test mongodb storage using mocks ---
@@ -17,6 +21,9 @@ def with_mongodb_storage(coro):
             collection.create_index = CoroutineMock()
             collection.find_one = CoroutineMock()
             collection.delete_one = CoroutineMock()
+            collection.delete_many = CoroutineMock()
+            collection.bulk_write = CoroutineMock()
+            collection.find_one_and_update = CoroutineMock()
             client.return_value = {"kutana": {"storage": collection}}
             return await coro(*args, storage=MongoDBStorage("mongo"), **kwargs)
     return wrapper
@@ -56,6 +63,112 @@ def test_mongodb_storage():
     asyncio.get_event_loop().run_until_complete(test())
 
 
+def test_mongodb_storage_many():
+    class Cursor:
+        def __init__(self, items):
+            self._items = iter(items)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self._items)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    @with_mongodb_storage
+    async def test(storage):
+        await storage.init()
+
+        # Get values
+        storage.collection.find = Mock(return_value=Cursor([
+            {"_key": "key2", "val": 2, "_version": 1},
+            {"_key": "key1", "val": 1, "_version": 3},
+        ]))
+
+        assert await storage._get_many(["key1", "key2", "key3"]) == [
+            {"val": 1, "_version": 3},
+            {"val": 2, "_version": 1},
+            None,
+        ]
+        storage.collection.find.assert_called_with(
+            {"_key": {"$in": ["key1", "key2", "key3"]}},
+            projection={"_id": 0},
+        )
+
+        # Put values
+        assert await storage._put_many([]) == []
+        storage.collection.bulk_write.assert_not_awaited()
+
+        assert await storage._put_many([("key1", {"val": 1}, None), ("key2", {"val": 2}, 1)]) == [1, 2]
+        operations = storage.collection.bulk_write.call_args[0][0]
+        assert operations == [
+            pymongo.UpdateOne(
+                {"_key": "key1", "_version": 0},
+                {"$set": {"val": 1, "_key": "key1", "_version": 1}},
+                upsert=True,
+            ),
+            pymongo.UpdateOne(
+                {"_key": "key2", "_version": 1},
+                {"$set": {"val": 2, "_key": "key2", "_version": 2}},
+                upsert=True,
+            ),
+        ]
+        assert storage.collection.bulk_write.call_args[1] == {"ordered": False}
+
+        # Put values with conflicts
+        storage.collection.bulk_write.side_effect = pymongo.errors.BulkWriteError({
+            "writeErrors": [{"index": 1, "code": 11000}],
+        })
+
+        results = await storage._put_many([("key1", {"val": 1}, 1), ("key2", {"val": 2}, 1)])
+        assert results[0] == 2
+        assert isinstance(results[1], OptimisticLockException)
+
+        storage.collection.bulk_write.side_effect = pymongo.errors.BulkWriteError({
+            "writeErrors": [{"index": 0, "code": 121}],
+        })
+
+        with pytest.raises(pymongo.errors.BulkWriteError):
+            await storage._put_many([("key1", {"val": 1}, 1)])
+
+        # Delete values
+        await storage._delete_many(["key1", "key2"])
+        storage.collection.delete_many.assert_awaited_with({"_key": {"$in": ["key1", "key2"]}})
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_mongodb_storage_update_fields():
+    @with_mongodb_storage
+    async def test(storage):
+        await storage.init()
+
+        storage.collection.find_one_and_update.return_value = {"count": 2, "_version": 3}
+
+        doc = await storage.update_fields("key", increments={"count": 1})
+        assert doc.values == {"count": 2, "_version": 3}
+        storage.collection.find_one_and_update.assert_awaited_with(
+            {"_key": "key"},
+            {"$inc": {"count": 1, "_version": 1}},
+            projection={"_key": 0, "_id": 0},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+
+        await storage.update_fields("key", values={"name": "n"})
+        storage.collection.find_one_and_update.assert_awaited_with(
+            {"_key": "key"},
+            {"$inc": {"_version": 1}, "$set": {"name": "n"}},
+            projection={"_key": 0, "_id": 0},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 def test_mongodb_storage_conflict():
     @with_mongodb_storage
     async def test(storage):
@@ -90,3 +203,440 @@ def test_sqlite_storage():
         assert await storage._get("key") is None
 
     asyncio.get_event_loop().run_until_complete(test())
+
+
+@patch("kutana.storages.sqlite.MAX_VARIABLES", 2)
+def test_sqlite_storage_many():
+    @with_sqlite_storage
+    async def test(storage):
+        await storage.init()
+
+        results = await storage._put_many([
+            ("key1", {"val": 1}, None),
+            ("key2", {"val": 2}, None),
+            ("key3", {"val": 3}, None),
+            ("key1", {"val": 4}, None),
+        ])
+
+        assert results[:3] == [1, 1, 1]
+        assert isinstance(results[3], OptimisticLockException)
+
+        assert await storage._get_many(["key3", "key4", "key1", "key2"]) == [
+            {"val": 3, "_version": 1},
+            None,
+            {"val": 1, "_version": 1},
+            {"val": 2, "_version": 1},
+        ]
+
+        await storage._delete_many(["key1", "key3"])
+        assert await storage._get_many(["key1", "key2", "key3"]) == [
+            None, {"val": 2, "_version": 1}, None,
+        ]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_sqlite_storage_thread(tmp_path):
+    threads = set()
+
+    class _SqliteStorage(SqliteStorage):
+        def _sync_get(self, key):
+            threads.add(threading.current_thread())
+            return super()._sync_get(key)
+
+    async def test():
+        storage = _SqliteStorage(str(tmp_path / "storage.db"))
+        await storage.init()
+
+        assert await storage._put("key", {"val": 1}) == 1
+        assert await asyncio.gather(*(storage._get("key") for _ in range(5))) == [
+            {"val": 1, "_version": 1}
+        ] * 5
+
+        with storage.cursor() as cur:
+            cur.execute("PRAGMA journal_mode")
+            assert cur.fetchone()["journal_mode"] == "wal"
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+    assert len(threads) == 1
+    assert threading.current_thread() not in threads
+
+
+def test_sqlite_storage_group_commit():
+    batches = []
+
+    class _SqliteStorage(SqliteStorage):
+        fail = False
+
+        def _sync_put_many(self, puts):
+            if self.fail:
+                raise sqlite3.OperationalError("disk I/O error")
+            batches.append(len(puts))
+            return super()._sync_put_many(puts)
+
+    async def test():
+        storage = _SqliteStorage(":memory:", group_commit_delay=0.01)
+        await storage.init()
+
+        results = await asyncio.gather(
+            storage._put("key1", {"val": 1}),
+            storage._put("key2", {"val": 1}),
+            storage._put("key1", {"val": 2}),
+            return_exceptions=True,
+        )
+
+        assert results[:2] == [1, 1]
+        assert isinstance(results[2], OptimisticLockException)
+        assert batches == [3]
+
+        results = await asyncio.gather(
+            storage._put("key1", {"val": 2}, version=1),
+            storage._put("key1", {"val": 3}, version=1),
+            storage._put("key2", {"val": 2}, version=1),
+            return_exceptions=True,
+        )
+
+        assert results[0] == 2
+        assert isinstance(results[1], OptimisticLockException)
+        assert results[2] == 2
+        assert batches == [3, 3]
+
+        assert await storage._get("key1") == {"val": 2, "_version": 2}
+        assert await storage._get("key2") == {"val": 2, "_version": 2}
+
+        # Values that can't be serialized don't affect other puts
+        results = await asyncio.gather(
+            storage._put("key4", {"val": object()}),
+            storage._put("key5", {"val": 1}),
+            return_exceptions=True,
+        )
+
+        assert isinstance(results[0], TypeError)
+        assert results[1] == 1
+        assert batches == [3, 3, 1]
+
+        assert await storage._get("key4") is None
+        assert await storage._get("key5") == {"val": 1, "_version": 1}
+
+        # Cancelled puts are still saved
+        put = asyncio.ensure_future(storage._put("key3", {"val": 1}))
+        await asyncio.sleep(0)
+        put.cancel()
+        assert await storage._put("key4", {"val": 1}) == 1
+        assert await storage._get("key3") == {"val": 1, "_version": 1}
+
+        # Errors of transaction are reported to every put
+        storage.fail = True
+
+        results = await asyncio.gather(
+            storage._put("key1", {"val": 1}),
+            storage._put("key2", {"val": 1}),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(r, sqlite3.OperationalError) for r in results)
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+# --- Test cached storage using memory storage ---
+class CountingMemoryStorage(MemoryStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gets = 0
+
+    async def _get(self, key):
+        self.gets += 1
+        return await super()._get(key)
+
+
+def test_cached_storage():
+    async def test():
+        storage = CachedStorage(CountingMemoryStorage(), keys_limit=2)
+        await storage.init()
+
+        # Absence of values is cached
+        assert await storage.get("key1") is None
+        assert await storage.get("key1") is None
+        assert storage.storage.gets == 1
+
+        doc = await storage.make_document({"val": 1}, "key1").save()
+
+        # Values are cached on puts and copied
+        cached = await storage.get("key1")
+        assert cached.values == {"val": 1, "_version": 1}
+        cached["val"] = 2
+        assert (await storage.get("key1")).values == {"val": 1, "_version": 1}
+        assert storage.storage.gets == 1
+
+        # Nested values are copied too
+        nested = await storage.make_document({"items": []}, "nested").save()
+        nested["items"].append("uncommitted")
+        loaded = await storage.get("nested")
+        assert loaded["items"] == []
+        loaded["items"].append("uncommitted")
+        assert (await storage.get("nested"))["items"] == []
+        await storage.delete("nested")
+
+        # Cached documents respect optimistic locking
+        await cached.save()
+        with pytest.raises(OptimisticLockException):
+            await doc.save()
+        assert (await storage.get("key1")).values == {"val": 2, "_version": 2}
+
+        # Storage was changed by someone else
+        storage.storage._storage["key1"]["_version"] = 3
+        with pytest.raises(OptimisticLockException):
+            await cached.save()
+        assert (await storage.get("key1")).values == {"val": 2, "_version": 3}
+        assert storage.storage.gets == 3
+
+        await storage.delete("key1")
+        assert await storage.get("key1") is None
+        assert storage.storage.gets == 4
+
+        # Least recently used keys are evicted
+        await storage.get("key2")
+        await storage.get("key3")
+        await storage.get("key1")
+        assert list(storage._cache) == ["key3", "key1"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_cached_storage_ttl():
+    async def test():
+        storage = CachedStorage(CountingMemoryStorage(), ttl=0.01)
+
+        await storage.get("key")
+        await storage.get("key")
+        assert storage.storage.gets == 1
+
+        await asyncio.sleep(0.02)
+
+        await storage.get("key")
+        assert storage.storage.gets == 2
+
+        storage.ttl = None
+        await asyncio.sleep(0.02)
+        await storage.get("key")
+        await storage.get("key")
+        assert storage.storage.gets == 3
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_cached_storage_concurrent_changes():
+    loaded = asyncio.Event()
+    proceed = asyncio.Event()
+
+    class SlowMemoryStorage(MemoryStorage):
+        async def _get(self, key):
+            values = await super()._get(key)
+            loaded.set()
+            await proceed.wait()
+            if key == "fail":
+                raise RuntimeError
+            return values
+
+    async def test():
+        storage = CachedStorage(SlowMemoryStorage())
+
+        # Outdated values are not cached
+        get = asyncio.ensure_future(storage.get("key"))
+        await loaded.wait()
+        await storage.make_document({"val": 1}, "key").save()
+        proceed.set()
+
+        assert await get is None
+        assert (await storage.get("key")).values == {"val": 1, "_version": 1}
+
+        with pytest.raises(RuntimeError):
+            await storage.get("fail")
+
+        assert not storage._loading
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_cached_storage_many():
+    async def test():
+        storage = CachedStorage(CountingMemoryStorage())
+
+        await storage.storage.put("key1", {"val": 1, "_version": None})
+
+        assert await storage._get_many(["key1", "key2", "key1"]) == [
+            {"val": 1, "_version": 1}, None, {"val": 1, "_version": 1},
+        ]
+        assert storage.storage.gets == 2
+
+        assert await storage._get_many(["key1", "key2", "key3"]) == [
+            {"val": 1, "_version": 1}, None, None,
+        ]
+        assert storage.storage.gets == 3
+
+        results = await storage._put_many([
+            ("key1", {"val": 2}, 1),
+            ("key2", {"val": 2}, 1),
+        ])
+
+        assert results[0] == 2
+        assert isinstance(results[1], OptimisticLockException)
+        assert await storage._get_many(["key1", "key2"]) == [{"val": 2, "_version": 2}, None]
+        assert storage.storage.gets == 4
+
+        await storage._delete_many(["key1", "key2"])
+        assert await storage._get_many(["key1", "key2"]) == [None, None]
+        assert storage.storage.gets == 6
+
+        doc = await storage.update_fields("key1", increments={"count": 1})
+        assert doc.values == {"count": 1, "_version": 1}
+        assert await storage._get("key1") == {"count": 1, "_version": 1}
+        assert storage.storage.gets == 7
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+# --- Test redis storage using fake redis server ---
+def with_redis_storage(coro, password=None, pool_size=2):
+    @functools.wraps(coro)
+    async def wrapper():
+        server = FakeRedisServer(password=password)
+        port = await server.start()
+
+        auth = f":{password}@" if password else ""
+        storage = RedisStorage(f"redis://{auth}127.0.0.1:{port}/1", pool_size=pool_size)
+
+        try:
+            return await coro(storage=storage, server=server)
+        finally:
+            await storage.close()
+            await server.stop()
+
+    return wrapper
+
+
+def test_redis_storage():
+    @with_redis_storage
+    async def test(storage, server):
+        await storage.init()
+
+        assert await storage._put("key", {"val1": 1, "val2": "з"}) == 1
+        assert await storage._put("key", {"val1": 1, "val2": 2}, version=1) == 2
+        with pytest.raises(OptimisticLockException):
+            await storage._put("key", {"val1": 1, "val2": 3}, version=1)
+        with pytest.raises(OptimisticLockException):
+            await storage._put("key", {"val1": 1, "val2": 3})
+        assert await storage._get("key") == {"val1": 1, "val2": 2, "_version": 2}
+
+        await storage._delete("key")
+        assert await storage._get("key") is None
+
+        # Script was loaded by server once
+        assert server.commands.count("EVAL") == 1
+        assert server.data == {}
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_redis_storage_many():
+    @with_redis_storage
+    async def test(storage, server):
+        await storage.init()
+
+        assert await storage._put_many([]) == []
+        await storage._delete_many([])
+
+        results = await storage._put_many([
+            ("key1", {"val": 1}, None),
+            ("key2", {"val": 2}, None),
+            ("key1", {"val": 3}, None),
+        ])
+
+        assert results[:2] == [1, 1]
+        assert isinstance(results[2], OptimisticLockException)
+
+        assert await storage._get_many(["key2", "key3", "key1"]) == [
+            {"val": 2, "_version": 1}, None, {"val": 1, "_version": 1},
+        ]
+
+        await storage._delete_many(["key1", "key2"])
+        assert server.data == {}
+
+        # Commands for many keys are sent in one batch (EVALSHA, EVAL,
+        # HMGET and DEL)
+        assert server.batches[-4:] == [3, 3, 3, 1]
+        assert server.commands[-4:] == ["HMGET", "HMGET", "HMGET", "DEL"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_redis_storage_pool():
+    @with_redis_storage
+    async def test(storage, server):
+        await storage.init()
+
+        await asyncio.gather(*(
+            storage._put(f"key{i}", {"val": i}) for i in range(20)
+        ))
+
+        assert server.connections == 2
+        assert len(server.data) == 20
+
+        # Connection is closed if operation was interrupted
+        task = asyncio.ensure_future(storage._get("key1"))
+        await asyncio.sleep(0)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert len(storage._connections) == 1
+
+        assert await storage._get("key1") == {"val": 1, "_version": 1}
+
+        with pytest.raises(RedisError):
+            await storage._execute_many([("UNKNOWN",)])
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_redis_storage_auth():
+    async def test(storage, server):
+        await storage.init()
+        assert server.commands[:3] == ["AUTH", "SELECT", "PING"]
+
+    asyncio.get_event_loop().run_until_complete(
+        with_redis_storage(test, password="secret")()
+    )
+
+    async def test_wrong(storage, server):
+        storage._config["password"] = "wrong"
+
+        with pytest.raises(RedisError):
+            await storage.init()
+
+    asyncio.get_event_loop().run_until_complete(
+        with_redis_storage(test_wrong, password="secret")()
+    )
+
+
+def test_redis_connection_replies():
+    async def test():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"+OK\r\n$-1\r\n*-1\r\n*2\r\n:1\r\n$3\r\nabc\r\n?\r\n")
+
+        connection = RedisConnection(reader, Mock())
+
+        assert await connection._read_reply() == "OK"
+        assert await connection._read_reply() is None
+        assert await connection._read_reply() is None
+        assert await connection._read_reply() == [1, "abc"]
+
+        with pytest.raises(RedisError):
+            await connection._read_reply()
+
+        assert RedisConnection._encode(("SET", b"k", 1)) == b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\n1\r\n"
+
+    asyncio.get_event_loop().run_until_complete(test())
@@ -1,9 +1,12 @@
+import time
 import aiohttp
 import asyncio
 import pytest
+from aiohttp import web
 from asynctest import CoroutineMock, patch
-from kutana import Kutana, Plugin, RequestException, Attachment
-from kutana.backends import Telegram
+from kutana import Kutana, Plugin, RequestException, Attachment, serializer
+from kutana.backends import Telegram, TelegramWebhook
+from kutana.storages import MemoryStorage
 from test_telegram_data import MESSAGES, UPDATES, ATTACHMENTS
 
 
@@ -51,6 +54,53 @@ def test_request_file_and_getter(mock_get):
     asyncio.get_event_loop().run_until_complete(test())
 
 
+@patch('aiohttp.ClientSession.get')
+def test_stream_file(mock_get):
+    async def iter_chunked(chunk_size):
+        yield b"con"
+        yield b"tent"
+
+    mock_get.return_value.__aenter__.return_value.content.iter_chunked = iter_chunked
+
+    async def test():
+        telegram = Telegram(token="token", session=aiohttp.ClientSession())
+
+        async def req(method, kwargs={}):
+            if method == "getFile" and kwargs["file_id"] == "file_id":
+                return {"file_path": "123"}
+        telegram._request = req
+
+        getter = telegram._make_getter("file_id")
+        assert [c async for c in getter.stream()] == [b"con", b"tent"]
+
+        await telegram.session.close()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+@patch('aiohttp.ClientSession.post')
+def test_request_stream(mock_post):
+    mock_post.return_value.__aenter__.return_value.json = CoroutineMock(
+        return_value={"ok": True, "result": 1}
+    )
+
+    async def stream():
+        yield b"content"
+
+    async def test():
+        telegram = Telegram(token="token")
+
+        assert await telegram._request("sendDocument", {"chat_id": "1", "document": stream()}) == 1
+
+        data = mock_post.call_args[1]["data"]
+        assert isinstance(data, aiohttp.FormData)
+        assert data._is_multipart
+
+        await telegram.session.close()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 @patch('aiohttp.ClientSession.post')
 def test_acquire_updates(mock_post):
     def make_mock(exc):
@@ -107,7 +157,6 @@ def test_upload_attachments():
 
     async def test():
         telegram = Telegram(token="token", session=aiohttp.ClientSession())
-        telegram.api_messages_lock = asyncio.Lock()
 
         async def req(method, kwargs):
             requests.append((method, kwargs))
@@ -140,10 +189,160 @@ def test_upload_attachments():
     asyncio.get_event_loop().run_until_complete(test())
 
 
+def test_upload_cache():
+    requests = []
+
+    async def test():
+        telegram = Telegram(token="token", session=aiohttp.ClientSession())
+
+        async def req(method, kwargs):
+            requests.append((method, kwargs))
+
+            if method == "sendPhoto":
+                return {"photo": [{"file_id": "small"}, {"file_id": "large"}]}
+
+            return {"document": {}}
+        telegram._request = req
+
+        for _ in range(2):
+            await telegram.execute_send(1, "", Attachment.new(b"file"), {})
+            await telegram.execute_send(2, "", Attachment.new(b"file", type="doc"), {})
+
+        assert requests == [
+            ("sendPhoto", {"chat_id": "1", "photo": b"file"}),
+            ("sendDocument", {"chat_id": "2", "document": b"file"}),
+            ("sendPhoto", {"chat_id": "1", "photo": "large"}),
+            ("sendDocument", {"chat_id": "2", "document": b"file"}),
+        ]
+
+        await telegram.session.close()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_media_groups():
+    requests = []
+
+    async def test():
+        telegram = Telegram(token="token", session=aiohttp.ClientSession())
+
+        async def req(method, kwargs):
+            requests.append((method, kwargs))
+
+            if method == "sendMediaGroup":
+                media = serializer.loads(kwargs["media"])
+                return [
+                    {"photo": [{"file_id": f"id{i}"}]} if m["type"] == "photo" else {}
+                    for i, m in enumerate(media)
+                ]
+        telegram._request = req
+
+        photos = [Attachment.new(str(i).encode()) for i in range(12)]
+
+        await telegram.execute_send(1, "text", [
+            *photos,
+            Attachment.new(b"voice", type="voice"),
+            Attachment.new(b"doc1", type="doc", title="doc"),
+            Attachment.existing("doc2", "doc"),
+            Attachment.new(b"video", type="video"),
+        ], {})
+
+        assert [method for method, _ in requests] == [
+            "sendMediaGroup", "sendMediaGroup", "sendVoice", "sendMediaGroup", "sendVideo",
+        ]
+
+        # Text is sent as caption
+        media = serializer.loads(requests[0][1]["media"])
+        assert len(media) == 10
+        assert media[0] == {"type": "photo", "media": "attach://file0", "caption": "text"}
+        assert media[1] == {"type": "photo", "media": "attach://file1"}
+        assert requests[0][1]["file1"] == b"1"
+
+        assert len(serializer.loads(requests[1][1]["media"])) == 2
+
+        assert serializer.loads(requests[3][1]["media"]) == [
+            {"type": "document", "media": "attach://file0", "caption": "doc"},
+            {"type": "document", "media": "doc2"},
+        ]
+
+        # Sent files are sent by their IDs
+        requests.clear()
+        await telegram.execute_send(1, "text", photos[:2], {"parse_mode": "HTML"})
+
+        assert requests == [
+            ("sendMessage", {"chat_id": "1", "text": "text", "parse_mode": "HTML"}),
+            ("sendMediaGroup", {
+                "chat_id": "1",
+                "media": serializer.dumps([
+                    {"type": "photo", "media": "id0"},
+                    {"type": "photo", "media": "id1"},
+                ]),
+            }),
+        ]
+
+        await telegram.session.close()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_upload_cache_errors():
+    requests = []
+
+    async def test():
+        storage = MemoryStorage()
+
+        telegram = Telegram(token="token", session=aiohttp.ClientSession(), upload_cache_storage=storage)
+
+        async def req(method, kwargs):
+            requests.append((method, kwargs))
+
+            # Cached IDs became unavailable
+            if "id0" in kwargs.get("media", "") or kwargs.get("photo") == "id2":
+                raise RequestException(telegram, (method, kwargs), {"ok": False})
+
+            if method == "sendMediaGroup":
+                return [{"photo": [{"file_id": f"id{i}"}]} for i in range(2)]
+
+            return {"photo": [{"file_id": "id2"}]}
+        telegram._request = req
+
+        photos = [Attachment.new(str(i).encode()) for i in range(3)]
+
+        for _ in range(2):
+            await telegram.execute_send(1, "", photos[:2], {})
+            await telegram.execute_send(1, "", photos[2], {})
+
+            with pytest.raises(RequestException):
+                await telegram.execute_send(1, "", photos[:2], {})
+
+            with pytest.raises(RequestException):
+                await telegram.execute_send(1, "", photos[2], {})
+
+        assert [kwargs.get("photo", kwargs.get("file0")) for _, kwargs in requests] == [
+            b"0", b"2", None, "id2",
+        ] * 2
+
+        # Files sent by other bots are not used
+        other = Telegram(token="other", session=telegram.session, upload_cache_storage=storage)
+        other._request = req
+
+        await telegram.execute_send(1, "", photos[2], {})
+        await other.execute_send(1, "", photos[2], {})
+
+        assert requests[-1][1]["photo"] == b"2"
+
+        await telegram.session.close()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_upload_cache_disabled():
+    assert Telegram(token="token", upload_cache_size=0).upload_cache is None
+
+
 def test_upload_attachment_unknown_type():
     async def test():
         telegram = Telegram(token="token", session=aiohttp.ClientSession())
-        telegram.api_messages_lock = asyncio.Lock()
 
         attachment = Attachment.new(b"bruh", type="location")
 
@@ -153,6 +352,107 @@ def test_upload_attachment_unknown_type():
     asyncio.get_event_loop().run_until_complete(test())
 
 
+def test_send_concurrency_for_many_chats():
+    received = {}
+    in_flight = [0]
+    max_in_flight = [0]
+
+    async def handle(request):
+        data = await request.post()
+        received.setdefault(data["chat_id"], []).append(data["text"])
+
+        in_flight[0] += 1
+        max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            in_flight[0] -= 1
+
+        return web.json_response({"ok": True, "result": 1})
+
+    async def test():
+        server = web.Application()
+        server.router.add_post("/bottoken/sendMessage", handle)
+
+        runner = web.AppRunner(server)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+
+        _, port = runner.addresses[0][:2]
+
+        telegram = Telegram(
+            token="token",
+            api_url=f"http://127.0.0.1:{port}",
+            messages_per_second=5000,
+        )
+
+        await asyncio.gather(*(
+            telegram.execute_send(chat_id, text, (), {})
+            for text in ("first", "second")
+            for chat_id in range(1000)
+        ))
+
+        await telegram.on_shutdown(None)
+        await runner.cleanup()
+
+        # Messages to one chat are sent in order
+        assert len(received) == 1000
+        assert all(texts == ["first", "second"] for texts in received.values())
+
+        # Messages to different chats are sent concurrently
+        assert max_in_flight[0] >= 10
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_send_per_chat_limit():
+    async def test():
+        telegram = Telegram(
+            token="token",
+            chat_messages_per_second=20,
+            chat_messages_burst=1,
+        )
+
+        sent = []
+
+        async def req(method, kwargs):
+            sent.append((kwargs["chat_id"], time.monotonic()))
+        telegram._request = req
+
+        await asyncio.gather(*(
+            telegram.execute_send(chat_id, "hi", (), {})
+            for chat_id in (1, 1, 1, 2)
+        ))
+
+        times = [t for chat_id, t in sent if chat_id == "1"]
+        assert times[2] - times[0] >= 0.09
+        assert [chat_id for chat_id, _ in sent][:2] == ["1", "2"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+@patch("kutana.backends.telegram.CHATS_LIMITERS_CLEANUP_SIZE", 2)
+def test_chats_limiters_cleanup():
+    async def test():
+        telegram = Telegram(token="token", chat_messages_per_second=1)
+
+        busy_lock, _ = telegram._get_chat_limiter("1")
+        _, empty_bucket = telegram._get_chat_limiter("2")
+
+        await busy_lock.acquire()
+        empty_bucket.reserve()
+
+        telegram._get_chat_limiter("3")
+        assert list(telegram._chats_limiters) == ["1", "2", "3"]
+
+        busy_lock.release()
+        telegram._get_chat_limiter("4")
+        assert list(telegram._chats_limiters) == ["2", "4"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 def test_execute_request():
     telegram = Telegram(token="token")
 
@@ -244,3 +544,129 @@ def test_happy_path():
     assert answers[4] == ("msg", "/echo chat")
     assert answers[5] == ("msg", "367699112")
     assert answers[6] == ("msg", "367699112")
+
+
+def test_webhook_server():
+    async def test():
+        tg = TelegramWebhook("token", host="127.0.0.1", port=0, secret_token="secret", queue_limit=2)
+
+        # Mini-start
+        tg.updates_queue = asyncio.Queue(tg._queue_limit)
+        await tg.start_server()
+
+        _, port = tg._server_app_runner.addresses[0][:2]
+
+        url = f"http://127.0.0.1:{port}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "secret"}
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=MESSAGES["message"]) as resp:
+                assert resp.status == 403
+
+            async with session.post(url, json=MESSAGES["message"], headers={
+                "X-Telegram-Bot-Api-Secret-Token": "wrong",
+            }) as resp:
+                assert resp.status == 403
+
+            async with session.post(url, data=b"{", headers=headers) as resp:
+                assert resp.status == 400
+
+            for status in (200, 200, 503):
+                async with session.post(url, json=MESSAGES["message"], headers=headers) as resp:
+                    assert resp.status == status
+
+        assert tg.updates_queue.qsize() == 2
+
+        submitted = []
+
+        async def submit(update):
+            submitted.append(update)
+
+        await tg.acquire_updates(submit)
+
+        assert len(submitted) == 2
+        assert submitted[0].text == "message"
+
+        await tg.stop_server()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_webhook_throughput():
+    async def test():
+        tg = TelegramWebhook("token", host="127.0.0.1", port=0, secret_token="secret")
+        tg.updates_queue = asyncio.Queue(tg._queue_limit)
+        await tg.start_server()
+
+        _, port = tg._server_app_runner.addresses[0][:2]
+
+        url = f"http://127.0.0.1:{port}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "secret"}
+        body = serializer.dumps(MESSAGES["message"])
+
+        async def post(session):
+            async with session.post(url, data=body, headers=headers) as resp:
+                assert resp.status == 200
+
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(post(session) for _ in range(1000)))
+
+        assert tg.updates_queue.qsize() == 1000
+
+        await tg.stop_server()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_webhook_identity():
+    assert TelegramWebhook.get_identity() == Telegram.get_identity() == "telegram"
+    assert TelegramWebhook("token").get_identity() == "telegram"
+
+
+def test_webhook_setup():
+    async def test(address, allowed_updates=None):
+        tg = TelegramWebhook(
+            "token", address=address, port=0,
+            secret_token="secret", allowed_updates=allowed_updates,
+        )
+
+        requests = []
+
+        async def req(method, kwargs={}):
+            requests.append((method, kwargs))
+
+            if method == "getMe":
+                return {"first_name": "bot", "username": "bot"}
+
+            return True
+        tg._request = req
+        tg.start_server = CoroutineMock()
+        tg.stop_server = CoroutineMock()
+        tg.session = aiohttp.ClientSession()
+
+        await tg.on_start(Kutana(loop=asyncio.get_event_loop()))
+        await tg.on_shutdown(None)
+
+        assert tg.start_server.called
+        assert tg.stop_server.called
+        assert tg.updates_queue.maxsize == 10000
+
+        return tg, requests
+
+    async def run():
+        tg, requests = await test("example.com/tg/webhook", ["message"])
+        assert tg._server_path == "/tg/webhook"
+        assert requests[1] == ("setWebhook", {
+            "url": "https://example.com/tg/webhook",
+            "secret_token": "secret",
+            "max_connections": 40,
+            "allowed_updates": '["message"]',
+        })
+
+        tg, requests = await test(None)
+        assert tg._server_path == "/"
+        assert [method for method, _ in requests] == ["getMe"]
+
+    asyncio.get_event_loop().run_until_complete(run())
+
+    assert len(TelegramWebhook("token").secret_token) == 32
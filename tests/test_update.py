@@ -1,6 +1,8 @@
+import io
 import asyncio
+import threading
 import pytest
-from kutana.update import Attachment
+from kutana.update import Attachment, FileGetter
 
 
 def test_get_file():
@@ -21,3 +23,63 @@ def test_get_file():
 
     with pytest.raises(ValueError):
         assert _get_file(attachment2)
+
+
+def test_iter_file(tmp_path):
+    async def collect(attachment, chunk_size=3):
+        return [bytes(chunk) async for chunk in attachment.iter_file(chunk_size)]
+
+    async def stream(chunk_size):
+        yield b"fi"
+        yield b"le"
+
+    async def getter():
+        return b"file"
+
+    async def test():
+        # File in memory is split to views of file
+        attachment = Attachment.new(b"filefile")
+        chunks = [chunk async for chunk in attachment.iter_file(3)]
+        assert all(isinstance(chunk, memoryview) for chunk in chunks)
+        assert [bytes(chunk) for chunk in chunks] == [b"fil", b"efi", b"le"]
+
+        # File is streamed from getter
+        attachment = Attachment._existing_full(1, "", "", "", FileGetter(getter, stream), {})
+        assert await collect(attachment) == [b"fi", b"le"]
+        assert await attachment.get_file() == b"file"
+
+        # Getter can't stream file
+        attachment = Attachment._existing_full(1, "", "", "", getter, {})
+        assert await collect(attachment) == [b"fil", b"e"]
+
+        # File is async iterator
+        attachment = Attachment.new(stream(3))
+        assert await collect(attachment) == [b"fi", b"le"]
+        assert await Attachment.new(stream(3)).get_file() == b"file"
+
+        # File is file object
+        attachment = Attachment.new(io.BytesIO(b"file"))
+        assert await collect(attachment) == [b"fil", b"e"]
+
+        with pytest.raises(ValueError):
+            await collect(Attachment._existing_full(1, "", "", "", None, {}))
+
+        # File is saved chunk by chunk outside of the event loop's thread
+        threads = set()
+
+        class Path(type(tmp_path)):
+            def __fspath__(self):
+                threads.add(threading.current_thread())
+                return super().__fspath__()
+
+        attachment = Attachment._existing_full(1, "", "", "", FileGetter(getter, stream), {})
+        await attachment.save_file(Path(tmp_path / "file"))
+        assert (tmp_path / "file").read_bytes() == b"file"
+        assert threads and threading.current_thread() not in threads
+
+        # File is closed if contents can't be downloaded
+        with pytest.raises(ValueError):
+            await Attachment._existing_full(1, "", "", "", None, {}).save_file(tmp_path / "empty")
+        assert (tmp_path / "empty").read_bytes() == b""
+
+    asyncio.get_event_loop().run_until_complete(test())
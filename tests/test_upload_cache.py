@@ -0,0 +1,76 @@
+import asyncio
+from kutana import Kutana, Attachment
+from kutana.storages import MemoryStorage
+from kutana.upload_cache import UploadCache
+
+
+async def stream():
+    yield b"file"
+
+
+def test_upload_cache_key():
+    key = UploadCache.get_key(Attachment.new(b"file"))
+
+    assert key == UploadCache.get_key(Attachment.new(bytearray(b"file")))
+    assert key != UploadCache.get_key(Attachment.new(b"file", type="doc"))
+    assert key != UploadCache.get_key(Attachment.new(b"file", file_name="other.png"))
+    assert key != UploadCache.get_key(Attachment.new(b"other"))
+
+    assert key != UploadCache.get_key(Attachment.new(b"file"), "scope")
+    assert UploadCache.get_key(Attachment.new(b"file"), "scope").startswith("scope:")
+
+    assert UploadCache.get_key(Attachment.new(stream())) is None
+
+
+def test_upload_cache():
+    async def test():
+        cache = UploadCache(keys_limit=2)
+
+        assert await cache.get("a") is None
+
+        await cache.put("a", {"id": 1})
+        await cache.put("b", {"id": 2})
+        assert await cache.get("a") == {"id": 1}
+
+        # Least recently used key is evicted
+        await cache.put("c", {"id": 3})
+        assert await cache.get("b") is None
+        assert await cache.get("a") == {"id": 1}
+        assert await cache.get("c") == {"id": 3}
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_upload_cache_storage():
+    app = Kutana()
+    storage = MemoryStorage()
+    app.set_storage("uploads", storage)
+
+    async def test():
+        cache1 = UploadCache(storage="uploads")
+        cache1.resolve_storage(app)
+        assert cache1.storage is storage
+
+        cache2 = UploadCache(storage=storage)
+
+        await cache1.put("a", {"id": 1})
+        await cache2.put("a", {"id": 2})
+
+        assert (await storage.get("upload_cache:a")).id == 1
+
+        # Values are loaded from storage into memory
+        cache3 = UploadCache(storage=storage)
+        assert await cache3.get("a") == {"id": 1}
+        await storage.delete("upload_cache:a")
+        assert await cache3.get("a") == {"id": 1}
+        assert await cache3.get("b") is None
+
+        # Values are deleted from memory and storage
+        await cache1.put("c", {"id": 3})
+        await cache1.delete("c")
+        assert await cache1.get("c") is None
+        assert await storage.get("upload_cache:c") is None
+
+        await UploadCache().delete("c")
+
+    app.get_loop().run_until_complete(test())
@@ -1,11 +1,14 @@
+import json
+import time
 import aiohttp
 import asyncio
 import random
 import pytest
-from asynctest import CoroutineMock, patch
+from asynctest import CoroutineMock, Mock, patch
 from kutana import Kutana, Plugin, RequestException, Attachment
 from kutana.backends import VkontakteLongpoll, VkontakteCallback
-from kutana.backends.vkontakte.backend import VKRequest, NAIVE_CACHE
+from kutana.backends.vkontakte.backend import Vkontakte, VKRequest, NAIVE_CACHE
+from kutana.storages import MemoryStorage
 from test_vkontakte_data import MESSAGES, ATTACHMENTS
 
 
@@ -84,6 +87,92 @@ def test_execute_loop_perform_execute(mock_get_response):
     asyncio.get_event_loop().run_until_complete(test())
 
 
+class _ExecuteVkontakte(Vkontakte):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    async def _execute_loop_perform_execute(self, code, requests):
+        self.batches.append([r.method for r in requests])
+
+        for r in requests:
+            r.set_result(r.method)
+
+
+def test_execute_loop_full_batch():
+    async def test():
+        vkontakte = _ExecuteVkontakte(token="token", requests_batch_delay=10)
+        vkontakte._requests_event = asyncio.Event()
+
+        loop_task = asyncio.ensure_future(vkontakte._execute_loop(None))
+
+        requests = [
+            asyncio.ensure_future(vkontakte._request(f"m{i}", {}))
+            for i in range(30)
+        ]
+
+        await asyncio.sleep(0.05)
+
+        # Full batch is sent immediately in the order of requests
+        assert vkontakte.batches == [[f"m{i}" for i in range(25)]]
+        assert await asyncio.gather(*requests[:25]) == [f"m{i}" for i in range(25)]
+        assert not any(r.done() for r in requests[25:])
+
+        loop_task.cancel()
+
+        for r in requests[25:]:
+            r.cancel()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_execute_loop_light_load():
+    async def test():
+        vkontakte = _ExecuteVkontakte(token="token", requests_per_second=10)
+        vkontakte._requests_event = asyncio.Event()
+
+        loop_task = asyncio.ensure_future(vkontakte._execute_loop(None))
+
+        # Request is sent almost without delay
+        start = time.monotonic()
+        assert await vkontakte._request("m1", {}) == "m1"
+        assert time.monotonic() - start < 0.05
+
+        # Requests are sent in batches according to rate limit
+        start = time.monotonic()
+        assert await asyncio.gather(
+            vkontakte._request("m2", {}),
+            vkontakte._request("m3", {}),
+        ) == ["m2", "m3"]
+        assert time.monotonic() - start >= 0.05
+
+        assert vkontakte.batches == [["m1"], ["m2", "m3"]]
+
+        loop_task.cancel()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_on_start_with_queued_requests():
+    async def noop(*args, **kwargs):
+        pass
+
+    async def test():
+        vkontakte = _ExecuteVkontakte(token="token", session=aiohttp.ClientSession())
+        vkontakte._update_group_data = noop
+
+        request = asyncio.ensure_future(vkontakte._request("m1", {}))
+        await asyncio.sleep(0)
+
+        await vkontakte.on_start(Kutana(loop=asyncio.get_event_loop()))
+
+        assert await request == "m1"
+
+        await vkontakte.on_shutdown(None)
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 @patch("kutana.backends.Vkontakte._request")
 def test_resolve_screen_name(mock_request):
     data = {
@@ -248,6 +337,51 @@ def test_upload_attachment():
     asyncio.get_event_loop().run_until_complete(test())
 
 
+def test_upload_attachment_cache():
+    uploads = []
+
+    class _VkontakteLongpoll(VkontakteLongpoll):
+        async def _request(self, method, kwargs):
+            if method == "photos.getMessagesUploadServer":
+                return {"upload_url": "upload_url_photo"}
+
+            if method == "photos.saveMessagesPhoto":
+                return [ATTACHMENTS["image"]["photo"]]
+
+        async def _upload_file_to_vk(self, url, data):
+            uploads.append(url)
+            return {}
+
+    async def test():
+        vkontakte = _VkontakteLongpoll(token="token")
+
+        image1 = await vkontakte.upload_attachment(Attachment.new(b"content"), peer_id=1)
+        image2 = await vkontakte.upload_attachment(Attachment.new(b"content"), peer_id=2)
+        assert image1.id == image2.id
+        assert len(uploads) == 1
+
+        await vkontakte.upload_attachment(Attachment.new(b"other"), peer_id=1)
+        assert len(uploads) == 2
+
+        vkontakte = _VkontakteLongpoll(token="token", upload_cache_size=0)
+        await vkontakte.upload_attachment(Attachment.new(b"content"), peer_id=1)
+        assert len(uploads) == 3
+
+        # Uploads of different groups are not shared
+        storage = MemoryStorage()
+
+        vkontakte1 = _VkontakteLongpoll(token="token1", upload_cache_storage=storage)
+        vkontakte1.group_id = 1
+        await vkontakte1.upload_attachment(Attachment.new(b"content"), peer_id=1)
+
+        vkontakte2 = _VkontakteLongpoll(token="token2", upload_cache_storage=storage)
+        vkontakte2.group_id = 2
+        await vkontakte2.upload_attachment(Attachment.new(b"content"), peer_id=1)
+        assert len(uploads) == 5
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 @patch("aiohttp.ClientSession.get")
 def test_attachments(mock_get):
     mock_read = CoroutineMock(
@@ -348,6 +482,104 @@ def test_execute_send_new():
     assert result == 1
 
 
+def test_execute_send_cached_error():
+    uploads = []
+    sent = []
+
+    class _VkontakteLongpoll(VkontakteLongpoll):
+        async def _request(self, method, kwargs):
+            if method == "photos.getMessagesUploadServer":
+                return {"upload_url": "upload_url_photo"}
+
+            if method == "photos.saveMessagesPhoto":
+                return [ATTACHMENTS["image"]["photo"]]
+
+            sent.append(kwargs["attachment"])
+
+            # Uploaded photo became unavailable
+            if len(sent) == 2:
+                raise RequestException(self, (method, kwargs), {"error": {"error_code": 100}})
+
+            return 1
+
+        async def _upload_file_to_vk(self, url, data):
+            uploads.append(url)
+            return {}
+
+    async def test():
+        vkontakte = _VkontakteLongpoll(token="token")
+
+        assert await vkontakte.execute_send(1, "", Attachment.new(b"content"), {}) == 1
+
+        with pytest.raises(RequestException):
+            await vkontakte.execute_send(1, "", Attachment.new(b"content"), {})
+
+        # Attachment is uploaded again
+        assert await vkontakte.execute_send(1, "", Attachment.new(b"content"), {}) == 1
+
+        assert len(sent) == 3
+        assert len(uploads) == 2
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_execute_send_concurrent_uploads():
+    vkontakte = VkontakteLongpoll(token="token", uploads_concurrency=2)
+
+    uploading = []
+    max_uploading = []
+    cancelled = []
+
+    async def _upl_att(attachment, peer_id):
+        uploading.append(attachment)
+        max_uploading.append(len(uploading))
+
+        try:
+            # Later attachments are uploaded faster
+            await asyncio.sleep(0.01 / len(attachment.file))
+        except asyncio.CancelledError:
+            cancelled.append(attachment)
+            raise
+        finally:
+            uploading.remove(attachment)
+
+        if attachment.file == b"fail":
+            raise RuntimeError
+
+        return attachment._replace(id=attachment.file.decode(), raw={})
+    vkontakte.upload_attachment = _upl_att
+
+    async def req(method, kwargs):
+        return kwargs["attachment"]
+    vkontakte._request = req
+
+    attachments = [
+        Attachment.new(b"1"),
+        "photo1_1",
+        Attachment.new(b"22"),
+        Attachment.existing("sticker", "sticker"),
+        Attachment.new(b"333"),
+        Attachment.new(b"4444"),
+    ]
+
+    async def test():
+        result = await vkontakte.execute_send(1, "text", attachments, {})
+        assert result == "1,photo1_1,22,333,4444"
+        assert max(max_uploading) == 2
+
+        # Other uploads are cancelled if one of them failed
+        with pytest.raises(RuntimeError):
+            await vkontakte.execute_send(1, "text", [
+                Attachment.new(b"fail"), Attachment.new(b"1"),
+            ], {})
+
+        await asyncio.sleep(0.02)
+        assert uploading == []
+        assert [a.file for a in cancelled] == [b"1"]
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 def test_execute_request():
     vkontakte = VkontakteLongpoll(token="token")
 
@@ -387,6 +619,57 @@ def test_upload_attachment_error_no_retry(
         )
 
 
+@patch("aiohttp.ClientSession.get")
+def test_attachments_stream(mock_get):
+    async def iter_chunked(chunk_size):
+        assert chunk_size == 2
+        yield b"co"
+        yield b"nt"
+
+    mock_get.return_value.__aenter__.return_value.content.iter_chunked = iter_chunked
+
+    async def test():
+        vkontakte = VkontakteLongpoll(token="token", session=aiohttp.ClientSession())
+
+        attachment = vkontakte._make_attachment(ATTACHMENTS["doc"])
+        assert [c async for c in attachment.iter_file(2)] == [b"co", b"nt"]
+
+        await vkontakte.session.close()
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+@patch("kutana.backends.Vkontakte._request")
+@patch("kutana.backends.Vkontakte._upload_file_to_vk")
+def test_upload_attachment_stream(
+    mock_upload_file_to_vk,
+    mock_request,
+):
+    async def stream():
+        yield b"content"
+
+    mock_request.side_effect = [
+        {"upload_url": "_"},
+        RequestException(None, None, None, {"error_code": 1}),
+    ]
+
+    mock_upload_file_to_vk.side_effect = [
+        "ok",
+    ]
+
+    vkontakte = VkontakteLongpoll("token")
+
+    # Stream is consumed by the first upload, so it's not retried
+    with pytest.raises(RequestException):
+        asyncio.get_event_loop().run_until_complete(
+            vkontakte.upload_attachment(Attachment.new(stream()), peer_id=123)
+        )
+
+    data = mock_upload_file_to_vk.call_args[0][1]
+    assert isinstance(data, aiohttp.FormData)
+    assert data._is_multipart
+
+
 @patch("kutana.backends.Vkontakte._request")
 @patch("kutana.backends.Vkontakte._upload_file_to_vk")
 @patch("kutana.backends.Vkontakte._make_attachment")
@@ -484,11 +767,89 @@ def test_callback_server():
     asyncio.get_event_loop().run_until_complete(test())
 
 
+def test_callback_overflow_policies():
+    def request(data):
+        request = Mock()
+        request.read = CoroutineMock(return_value=data if isinstance(data, bytes) else json.dumps(data))
+        return request
+
+    def update(event_id):
+        return {"type": "raw_update", "object": event_id, "event_id": event_id}
+
+    async def test(policy):
+        vk = VkontakteCallback("token", queue_limit=2, overflow_policy=policy, dedupe_size=3)
+        vk.updates_queue = asyncio.Queue(vk._queue_limit)
+
+        statuses = []
+
+        for event_id in ("a", "b", "a", "c", "d", "c"):
+            resp = await vk.handle_request(request(update(event_id)))
+            statuses.append(resp.status)
+
+        assert (await vk.handle_request(request(b"{"))).status == 400
+
+        queued = []
+        while not vk.updates_queue.empty():
+            queued.append(vk.updates_queue.get_nowait().raw["object"])
+
+        return statuses, queued, vk.metrics
+
+    async def run():
+        statuses, queued, metrics = await test("reject")
+        assert statuses == [200, 200, 200, 503, 503, 503]
+        assert queued == ["a", "b"]
+        assert metrics == {
+            "received": 6, "queued": 2, "duplicated": 1, "dropped": 0, "rejected": 3,
+        }
+
+        statuses, queued, metrics = await test("drop_newest")
+        assert statuses == [200] * 6
+        assert queued == ["a", "b"]
+        assert metrics == {
+            "received": 6, "queued": 2, "duplicated": 2, "dropped": 2, "rejected": 0,
+        }
+
+        statuses, queued, metrics = await test("drop_oldest")
+        assert statuses == [200] * 6
+        assert queued == ["c", "d"]
+        assert metrics == {
+            "received": 6, "queued": 4, "duplicated": 2, "dropped": 2, "rejected": 0,
+        }
+
+    asyncio.get_event_loop().run_until_complete(run())
+
+    with pytest.raises(ValueError):
+        VkontakteCallback("token", overflow_policy="unknown")
+
+
+def test_callback_dedupe_limit():
+    async def test():
+        vk = VkontakteCallback("token", queue_limit=0, dedupe_size=2)
+        vk.updates_queue = asyncio.Queue(vk._queue_limit)
+
+        for event_id in ("a", "b", "c", "a", None, None):
+            request = Mock()
+            request.read = CoroutineMock(return_value=json.dumps({
+                "type": "raw_update", "object": {}, "event_id": event_id,
+            }))
+            await vk.handle_request(request)
+
+        assert vk.updates_queue.qsize() == 6
+        assert list(vk._event_ids) == ["c", "a"]
+
+        vk = VkontakteCallback("token", dedupe_size=0)
+        assert not vk._is_duplicate({"event_id": "a"})
+        assert not vk._is_duplicate({"event_id": "a"})
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
 def test_callback_queue():
     async def test():
         vk = VkontakteCallback("token")
         vk.updates_queue = asyncio.Queue()
         await vk.updates_queue.put("hey")
+        await vk.updates_queue.put("hoy")
 
         submitted = []
 
@@ -497,7 +858,7 @@ def test_callback_queue():
 
         await vk.acquire_updates(submit)
 
-        assert submitted == ["hey"]
+        assert submitted == ["hey", "hoy"]
 
     asyncio.get_event_loop().run_until_complete(test())
 
@@ -615,7 +976,7 @@ def test_happy_path(mock_post):
     answers = []
     updated_longpoll = []
 
-    def acquire_updates(content_type=None):
+    def acquire_updates(content_type=None, loads=None):
         if not raw_updates:
             return {"updates": [], "ts": "100"}
         if updated_longpoll == [1]:
@@ -684,13 +1045,15 @@ def test_happy_path(mock_post):
 
     assert len(updated_longpoll) == 2
 
-    answers.sort()
-    assert len(answers) == 4
-    assert '{"message": ", .echo with mention [michaelkrukov|Михаил]",' in answers[0]
-    assert '{"message": ".echo chat [michaelkrukov|Михаил]",' in answers[1]
-    assert (
-        '{"message": ".echo with attachment",' in answers[2] and
-        'attachment": "' in answers[2] and
-        'attachment": ""' not in answers[2]
+    # Compare arguments of requests instead of code, because its
+    # formatting depends on selected JSON library
+    answers = sorted(
+        (json.loads(a[a.index("(") + 1:a.rindex(")")]) for a in answers),
+        key=lambda kwargs: kwargs["message"],
     )
-    assert '{"message": ".echo",' in answers[3]
+    assert len(answers) == 4
+    assert answers[0]["message"] == ", .echo with mention [michaelkrukov|Михаил]"
+    assert answers[1]["message"] == ".echo"
+    assert answers[2]["message"] == ".echo chat [michaelkrukov|Михаил]"
+    assert answers[3]["message"] == ".echo with attachment"
+    assert answers[3]["attachment"]
@@ -1,3 +1,4 @@
+import json
 import pytest
 from kutana import (
     Plugin, Message, Update, UpdateType, HandlerResponse as hr,
@@ -207,15 +208,21 @@ def test_on_callback():
     hu(Update(MESSAGES["inline_callback_val"], UpdateType.UPD, {}))
     hu(Message(make_message_update({"val": 1}), UpdateType.MSG, "hey3", (), 1, 0, 0, 0, {}))
 
-    assert debug.requests == [
+    # Formatting of serialized data depends on selected JSON library
+    requests = [
+        (method, {**kwargs, "event_data": json.loads(kwargs["event_data"])})
+        for method, kwargs in debug.requests
+    ]
+
+    assert requests == [
         ("messages.sendMessageEventAnswer", {
-            'event_data': '{"type": "show_snackbar", "text": "hey hey hey"}',
+            'event_data': {"type": "show_snackbar", "text": "hey hey hey"},
             'event_id': '3159dc190b1g',
             'user_id': 87641997,
             'peer_id': 87641997,
         }),
         ("messages.sendMessageEventAnswer", {
-            'event_data': '{"type": "show_snackbar", "text": "val val val"}',
+            'event_data': {"type": "show_snackbar", "text": "val val val"},
             'event_id': '3159dc190b1g',
             'user_id': 87641997,
             'peer_id': 87641997,
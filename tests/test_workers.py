@@ -0,0 +1,353 @@
+import os
+import asyncio
+import socket
+import pytest
+from asynctest.mock import Mock
+from kutana import Kutana, Plugin, Attachment
+from kutana.backends import Debug, Telegram
+from kutana.exceptions import RequestException
+from kutana.storages import SqliteStorage
+from kutana.upload_cache import UploadCache
+from kutana.workers import Channel, Worker, WorkersPool, get_shard
+
+
+class UnpicklableException(Exception):
+    def __init__(self):
+        super().__init__()
+        self.callback = lambda: None
+
+
+class AttachmentsDebug(Debug):
+    def _make_update(self, data):
+        async def getter():
+            return b"file"
+
+        return super()._make_update(data)._replace(attachments=[
+            Attachment._existing_full(
+                id="1", type="image", title="", file_name="",
+                getter=getter, raw={},
+            ),
+            Attachment.existing("2", "image"),
+        ])
+
+    async def execute_request(self, method, kwargs):
+        if method == "fail":
+            raise RequestException(self, (method, kwargs), {})
+        if method == "unpicklable":
+            raise UnpicklableException()
+        return await super().execute_request(method, kwargs)
+
+    async def echo(self, value):
+        return value
+
+
+def make_in_process_workers(app):
+    workers = []
+
+    def spawn(sock, socks_to_close):
+        worker = Worker(app, Channel(sock))
+        workers.append(worker)
+        asyncio.ensure_future(worker.run(), loop=app.get_loop())
+        return Mock()
+
+    app._workers_pool._spawn = spawn
+
+    return workers
+
+
+def test_workers():
+    app = Kutana(workers=2)
+
+    debug = Debug(
+        messages=[(f"message {i}", i % 4 + 1) for i in range(20)],
+        on_complete=app.stop,
+    )
+
+    app.add_backend(debug)
+
+    pl = Plugin("")
+
+    @pl.on_messages()
+    async def __(msg, ctx):
+        await ctx.request("method", value=msg.text)
+        await ctx.reply(str(os.getpid()))
+
+    app.add_plugin(pl)
+
+    app.run()
+
+    assert len(debug.requests) == 20
+
+    pids = {}
+
+    for sender_id, answers in debug.answers.items():
+        assert len(answers) == 5
+        assert len({answer[0] for answer in answers}) == 1
+        pids[sender_id] = answers[0][0]
+
+    assert str(os.getpid()) not in pids.values()
+
+
+def test_workers_in_process():
+    app = Kutana(workers=1)
+
+    debug = AttachmentsDebug(
+        messages=[("message", 1)],
+        on_complete=app.stop,
+    )
+
+    app.add_backend(debug)
+
+    workers = make_in_process_workers(app)
+
+    pl = Plugin("")
+
+    @pl.on_messages()
+    async def __(msg, ctx):
+        assert await msg.attachments[0].get_file() == b"file"
+        assert msg.attachments[1].file_getter is None
+
+        assert await ctx.backend.echo({"value": [1]}) == {"value": [1]}
+        assert ctx.backend.check_if_complete == debug.check_if_complete.__func__.__get__(ctx.backend._backend)
+        assert ctx.backend.get_identity() == "attachmentsdebug"
+
+        with pytest.raises(RequestException):
+            await ctx.request("fail")
+
+        with pytest.raises(RuntimeError):
+            await ctx.request("unpicklable")
+
+        workers[0]._handle_message(("result", -1, True, None))
+
+        await ctx.reply("ok", attachments=msg.attachments)
+
+    app.add_plugin(pl)
+
+    app.run()
+
+    message, attachments, _ = debug.answers[1][0]
+    assert message == "ok"
+    assert attachments[0].id == "1"
+    assert attachments[0].file_getter is None
+
+
+def test_workers_ordering_saturated_key():
+    # Application's semaphore is bound to the default loop
+    previous_loop = asyncio.get_event_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    app = Kutana(loop=loop, workers=1, concurrent_handlers_count=4, ordering="sender")
+
+    # Counters of backend are shared with in-process worker
+    debug = Debug(messages=[*((f"1-{i}", 1) for i in range(20)), ("2", 2)])
+
+    app.add_backend(debug)
+
+    make_in_process_workers(app)
+
+    events = []
+    answered = []
+
+    pl = Plugin("")
+
+    @pl.on_messages()
+    async def __(msg, ctx):
+        events.append(msg.text)
+
+        if msg.sender_id == 1:
+            await asyncio.sleep(0.01)
+
+        await ctx.reply(msg.text)
+
+        answered.append(msg.text)
+
+        if len(answered) == 21:
+            app.stop()
+
+    app.add_plugin(pl)
+
+    try:
+        app.run()
+    finally:
+        asyncio.set_event_loop(previous_loop)
+
+    # Waiting updates of one key release slots in the main process
+    assert [e for e in events if e != "2"] == [f"1-{i}" for i in range(20)]
+    assert events.index("2") <= 2
+
+
+def test_workers_released_slots():
+    app = Kutana()
+    pool = app._workers_pool = WorkersPool(app, 1)
+
+    async def test():
+        pool._pending[1] = None
+        pool._released.add(1)
+
+        # Released slot of the update is not released again
+        pool._complete(1)
+        assert app._sem._value == app._concurrent_handlers_count
+
+        # Slot is given back if update was completed while it was acquired
+        await pool._acquire(1)
+        assert app._sem._value == app._concurrent_handlers_count
+
+    asyncio.get_event_loop().run_until_complete(test())
+
+
+def test_workers_upload_cache_storage():
+    app = Kutana(workers=1)
+    app.set_storage("uploads", SqliteStorage(":memory:"))
+
+    requests = []
+
+    class _Telegram(Telegram):
+        async def _request(self, method, kwargs={}):
+            requests.append((method, kwargs))
+
+            if method == "getMe":
+                return {"first_name": "bot", "username": "bot"}
+
+            return {"photo": [{"file_id": "id"}]}
+
+    telegram = _Telegram(token="token", active=False, upload_cache_storage="uploads")
+    app.add_backend(telegram)
+
+    async def test():
+        await app._on_start(None)
+
+        # Sends from workers are performed in the main process
+        for _ in range(2):
+            await telegram.execute_send(1, "", Attachment.new(b"file"), {})
+
+        assert requests[1:] == [
+            ("sendPhoto", {"chat_id": "1", "photo": b"file"}),
+            ("sendPhoto", {"chat_id": "1", "photo": "id"}),
+        ]
+
+        key = UploadCache.get_key(Attachment.new(b"file"), telegram._upload_cache_scope)
+        assert (await app.get_storage("uploads").get(f"upload_cache:{key}")).file_id == "id"
+
+    app.get_loop().run_until_complete(test())
+
+
+def test_workers_update_without_attachments():
+    worker = Worker(Kutana(), None)
+    update = AttachmentsDebug([])._make_update(("message", 1))._replace(attachments=())
+    assert worker._unpack_update(0, update) is update
+
+
+def test_workers_unexpected_exit():
+    app = Kutana(workers=1, concurrent_handlers_count=4)
+    app.stop = Mock()
+    pool = app._workers_pool
+
+    debug = Debug([])
+    app.add_backend(debug)
+
+    async def test():
+        sock, worker_sock = socket.socketpair()
+        pool._channels.append(Channel(sock))
+        pool._processes.append(Mock())
+
+        await pool.on_start()
+
+        for i in range(3):
+            await app._sem.acquire()
+            pool.dispatch(debug._make_update((f"message {i}", i)), debug, Mock(sender_key=None, receiver_key=None))
+
+        assert len(pool._pending) == 3
+
+        # Worker exits before updates are processed
+        worker_sock.close()
+        await asyncio.wait_for(pool._readers[0], timeout=1)
+
+        assert pool._pending == {}
+        assert app._sem._value == 4
+        assert app.stop.called
+
+        await pool.stop()
+
+    app.get_loop().run_until_complete(test())
+
+
+def test_workers_main_process_exit():
+    app = Kutana()
+
+    async def test():
+        sock, worker_sock = socket.socketpair()
+
+        worker_task = asyncio.ensure_future(Worker(app, Channel(worker_sock)).run())
+        await asyncio.sleep(0.01)
+
+        sock.close()
+        await asyncio.wait_for(worker_task, timeout=1)
+
+    app.get_loop().run_until_complete(test())
+
+
+def test_workers_stop_before_start():
+    pool = WorkersPool(None, 1)
+
+    sock, other_sock = socket.socketpair()
+    pool._channels.append(Channel(sock))
+    other_sock.close()
+
+    asyncio.get_event_loop().run_until_complete(pool.stop())
+
+
+def test_workers_count():
+    with pytest.raises(ValueError):
+        WorkersPool(None, 0)
+
+
+def test_get_shard():
+    ctx = Mock(sender_key="debug:s1", receiver_key="debug:r1")
+    assert get_shard(ctx, 4) == get_shard(ctx, 4)
+    assert 0 <= get_shard(ctx, 4) < 4
+
+    ctx = Mock(sender_key=None, receiver_key=None)
+    assert get_shard(ctx, 4) is None
+
+    ctx = Mock(sender_key="debug:s1", receiver_key="debug:r1")
+    assert get_shard(ctx, 4, "debug:r1") == get_shard(Mock(sender_key=None, receiver_key="debug:r1"), 4)
+
+
+def test_workers_dispatch_ordering():
+    app = Kutana(workers=4, ordering="receiver")
+    pool = app._workers_pool
+    pool._channels = [Mock() for _ in range(4)]
+
+    debug = Debug([])
+    app.add_backend(debug)
+
+    for sender_id in range(20):
+        update = debug._make_update((f"message {sender_id}", sender_id))
+        ctx = Mock(sender_key=f"debug:{sender_id}", receiver_key="debug:chat")
+        pool.dispatch(update, debug, ctx)
+
+    # Updates for the same receiver are ordered by the same worker
+    assert sorted(channel.send.call_count for channel in pool._channels) == [0, 0, 0, 20]
+
+    # Updates without keys are distributed evenly
+    for i in range(8):
+        pool.dispatch(debug._make_update(("update", i)), debug, Mock(sender_key=None, receiver_key=None))
+
+    assert sorted(channel.send.call_count for channel in pool._channels) == [2, 2, 2, 22]
+
+
+def test_workers_memory_storage(caplog):
+    app = Kutana(workers=1)
+    app.set_storage("shared", SqliteStorage(":memory:"))
+
+    pool = app._workers_pool
+    pool._spawn = Mock()
+    pool.start()
+
+    assert pool._spawn.call_count == 1
+    pool._channels[0].close()
+    assert [r.message for r in caplog.records if "memory" in r.message] == [
+        'Storage "default" is kept in memory of each worker, so workers will '
+        "not share its documents! Use storage like SqliteStorage or RedisStorage with workers."
+    ]